@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HospitalManagement.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from registration.streams import token_queue_application #needs the apps loaded by get_asgi_application()
+
+#live token queue (stream/ and changes/ of the token views) without a thread per open dashboard
+application = token_queue_application(django_application)
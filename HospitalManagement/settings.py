@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'administration.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -191,7 +192,7 @@ SIMPLE_JWT = {
 }
 
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = 'administration.outbox.OutboxBackend' #mail is queued in OutboxEmail, `manage.py run_workers` sends it
 EMAIL_HOST = config('EMAIL_HOST')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool)
 EMAIL_PORT = config('EMAIL_PORT', cast=int)
@@ -206,3 +207,59 @@ AUTHENTICATION_BACKENDS = [
 
 
 
+
+#Cache shared by every worker process: cached filtered counts (administration.counts). A per-process cache
+#(LocMemCache) is not enough, writes in one process would not be seen by the others. The default keeps it in a table of the database (created by administration's migrations);
+#CACHE_BACKEND / CACHE_LOCATION can point it at Memcached instead.
+CACHES = {
+    'default': {
+        'BACKEND'   : config('CACHE_BACKEND', default = 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION'  : config('CACHE_LOCATION', default = 'hospital_cache'),
+    }
+}
+
+#Datatable record counts (administration.counts), cached in the default cache
+COUNT_CACHE_TIMEOUT = 30 #seconds a filtered count is reused; also the longest a count stays stale after a write in another process
+COUNT_ESTIMATE_CAP = 10000 #count_mode=estimated stops counting after this many rows and answers recordsCapped
+
+#Datatable full-text search (administration.search); None picks SQLite FTS5 / MySQL FULLTEXT from the DB vendor
+SEARCH_BACKEND = None #e.g. 'administration.search.BasicBackend'
+SEARCH_MYSQL_MIN_TOKEN_SIZE = 3 #the server's innodb_ft_min_token_size, shorter words are searched with LIKE
+SEARCH_REINDEX_INLINE = 200 #documents reindexed in the request after a rename, more are left to `manage.py run_workers`
+
+#Appointment booking (registration.views, doctor.views)
+APPOINTMENTS_PER_DOCTOR_DAY = 6 #daily limit of a doctor unless Account/Department.daily_appointments is set (registration.capacity)
+AVAILABILITY_CALENDAR_MAX_DAYS = 62 #longest range of the department availability calendar
+AVAILABILITY_CACHE_DAYS = 90 #days ahead whose doctor availability is answered from memory (doctor.availability)
+
+#Live token queue (registration.queue), streamed over SSE by HospitalManagement.asgi with a long-polling fallback
+TOKEN_QUEUE_BACKLOG = 500 #changes kept per hospital, dashboards further behind are told to reload
+TOKEN_QUEUE_POLL_INTERVAL = 0.5 #seconds between reads of the queue versions, one query per ASGI process
+TOKEN_QUEUE_LONG_POLL = 25 #seconds a long-polling request waits for a change (ASGI only)
+TOKEN_QUEUE_HEARTBEAT = 15 #seconds between keep-alive comments on an idle stream
+
+#Medicine autocomplete for prescriptions (dispensary.autocomplete)
+AUTOCOMPLETE_LIMIT = 10 #medicines returned when no limit is given
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+#Streaming CSV/NDJSON exports (administration.exports)
+EXPORT_CHUNK_SIZE = 2000 #rows fetched from the DB per round trip
+
+#Per-request metrics (administration.middleware), also sent as Server-Timing headers
+REQUEST_METRICS_BUFFER = 1000 #latest requests kept in memory per process, see administration/api/metrics/
+
+#Background jobs (administration.jobs), run by `manage.py run_workers`
+JOB_MAX_ATTEMPTS = 5 #a job is marked failed after this many attempts
+JOB_RETRY_BACKOFF = 30 #seconds before the first retry, doubled after every further failure
+JOB_RETRY_BACKOFF_MAX = 3600
+JOB_LEASE = 300 #seconds a worker may run a job before another worker takes it over
+
+#Email outbox (administration.outbox), sent in batches over one connection by `manage.py run_workers`
+EMAIL_OUTBOX_BACKEND = 'django.core.mail.backends.smtp.EmailBackend' #delivers the queued mail
+EMAIL_OUTBOX_BATCH = 50 #messages per connection
+EMAIL_OUTBOX_LEASE = 300 #seconds before messages claimed by a crashed sender are sent again
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_BACKOFF = 60 #seconds before a failed message is retried, doubled after every further failure
+EMAIL_RETRY_BACKOFF_MAX = 3600
+EMAIL_CIRCUIT_FAILURES = 3 #connection failures in a row that stop all sending...
+EMAIL_CIRCUIT_COOLDOWN = 300 #...for this many seconds
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_rename_timestamp_otp_generated_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='daily_appointments',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Daily Appointments'),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='daily_appointments',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Daily Appointments'),
+        ),
+    ]
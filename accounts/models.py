@@ -23,6 +23,7 @@ class Roles(models.Model):
 class Department(models.Model) :
     name = models.CharField(verbose_name = _('Department Name'), max_length = 50)
     fees = models.DecimalField(verbose_name = _('Total Price'), max_digits = 15, decimal_places = 2, default = 500)
+    daily_appointments = models.PositiveIntegerField(verbose_name = _('Daily Appointments'), blank = True, null = True) #per doctor, None: APPOINTMENTS_PER_DOCTOR_DAY
     date_created = models.DateTimeField(verbose_name = _('Date Created'), auto_now_add = True)
     date_modified = models.DateTimeField(verbose_name = _('Date Modified'), auto_now = True) 
     hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE)
@@ -57,6 +58,7 @@ class Account(AbstractBaseUser, PermissionsMixin):
     hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
     roles = models.ForeignKey(Roles, on_delete = models.SET_NULL, blank = True, null = True)
     department = models.ForeignKey(Department, on_delete = models.SET_NULL, blank = True, null = True)
+    daily_appointments = models.PositiveIntegerField(verbose_name = _('Daily Appointments'), blank = True, null = True) #doctors only, None: the department's limit
 
     objects = AccountsManager()
     
@@ -1,6 +1,24 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class AdministrationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'administration'
+
+    def ready(self):
+        from administration.counts import COUNTED_MODELS
+        from administration.search import DEPENDENT_DOCUMENTS, INDEXED_MODELS
+        from administration.signals import hospital_saved, record_deleted, record_saved, search_deleted, search_saved, search_saving
+        for label in COUNTED_MODELS:
+            Model = apps.get_model(label)
+            post_save.connect(record_saved, sender = Model, dispatch_uid = f'record_saved_{label}')
+            post_delete.connect(record_deleted, sender = Model, dispatch_uid = f'record_deleted_{label}')
+        for label in set(INDEXED_MODELS) | set(DEPENDENT_DOCUMENTS):
+            Model = apps.get_model(label)
+            post_save.connect(search_saved, sender = Model, dispatch_uid = f'search_saved_{label}')
+            if label in DEPENDENT_DOCUMENTS:
+                pre_save.connect(search_saving, sender = Model, dispatch_uid = f'search_saving_{label}')
+            if label in INDEXED_MODELS:
+                post_delete.connect(search_deleted, sender = Model, dispatch_uid = f'search_deleted_{label}')
+        post_save.connect(hospital_saved, sender = apps.get_model('accounts.Hospital'), dispatch_uid = 'hospital_saved')
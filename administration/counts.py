@@ -0,0 +1,83 @@
+from hashlib import md5
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from accounts.models import Hospital
+from administration.models import RecordCount
+
+#Models whose per-hospital totals are kept in RecordCount (and whose writes invalidate cached counts)
+COUNTED_MODELS = [
+    'accounts.Department', 'accounts.Roles', 'accounts.Account', 'registration.Patient', 'registration.Appointment',
+    'dispensary.Medicine', 'dispensary.Bill', 'dispensary.Transaction', 'doctor.Diagnosis',
+]
+
+#-----------------------------------TOTAL COUNTERS---------------------------------------------------
+#One RecordCount row per model and hospital: the total (recordsTotal) and the generation of its cached filtered counts,
+#both changed by the single UPDATE every write makes inside its own transaction.
+def recount(Model, hospital):
+    #the row exists before counting, so change_total() of a concurrent write is not lost: a writer that updated it
+    #first holds it until commit (the lock waits, the count sees its row), a later one adds on top of the count
+    label = Model._meta.label
+    counter = RecordCount.objects.filter(model = label, hospital = hospital)
+    RecordCount.objects.bulk_create([RecordCount(model = label, hospital_id = getattr(hospital, 'pk', hospital))], ignore_conflicts = True)
+    with transaction.atomic():
+        counter.select_for_update().get()
+        count = Model.objects.filter(hospital = hospital).count()
+        counter.update(count = count, generation = F('generation') + 1)
+    return count
+
+def total_count(Model, hospital):
+    #recordsTotal from the counter row, the row is created from one COUNT(*) the first time it is needed
+    count = RecordCount.objects.filter(model = Model._meta.label, hospital = hospital).values_list('count', flat = True).first()
+    return recount(Model, hospital) if count is None else count
+
+def change_total(Model, hospital_id, delta):
+    #every write: total += delta, and the cached filtered counts of that model and hospital become unreachable
+    RecordCount.objects.filter(model = Model._meta.label, hospital_id = hospital_id).update(count = F('count') + delta,
+                                                                                             generation = F('generation') + 1)
+
+def rebuild_record_counts(hospital_ids = None):
+    #needed after bulk_create/queryset.update, which do not send signals
+    if hospital_ids is None:
+        hospital_ids = Hospital.objects.values_list('id', flat = True)
+    for hospital_id in hospital_ids:
+        for label in COUNTED_MODELS:
+            recount(apps.get_model(label), hospital_id)
+
+#-----------------------------------FILTERED COUNTS---------------------------------------------------
+#Generations are bumped inside the writer's transaction, so another process can still count the old rows and cache
+#them under the new generation; COUNT_CACHE_TIMEOUT is what bounds how long such a count is served.
+def count_generation(Model, hospital_id):
+    generation = RecordCount.objects.filter(model = Model._meta.label, hospital_id = hospital_id).values_list('generation', flat = True).first()
+    if generation is None: #no counter row yet, writes only bump an existing one
+        recount(Model, hospital_id)
+        return count_generation(Model, hospital_id)
+    return generation
+
+def estimate_count(queryset):
+    #bounded COUNT(*) over at most COUNT_ESTIMATE_CAP + 1 rows, the extra row tells the cap was hit
+    return queryset.values('pk')[:settings.COUNT_ESTIMATE_CAP + 1].count()
+
+def cap_counts(context, start_index = None, rows_per_page = None):
+    #count_mode=estimated: flag a count that hit the cap so the client shows "10000+", and keep one page after the
+    #current one so paging goes on past the cap until a short page comes back
+    context['recordsCapped'] = context['recordsFiltered'] > settings.COUNT_ESTIMATE_CAP
+    if context['recordsCapped'] and start_index is not None:
+        context['recordsFiltered'] = max(context['recordsFiltered'], start_index + 2 * rows_per_page)
+    context['recordsTotal'] = max(context['recordsTotal'], context['recordsFiltered']) #a capped total under its filtered count
+    return context
+
+def cached_count(queryset, hospital, estimated = False):
+    Model = queryset.model
+    if not hospital:
+        return estimate_count(queryset) if estimated else queryset.count()
+    hospital_id = getattr(hospital, 'pk', hospital)
+    query_hash = md5(str(queryset.query).encode()).hexdigest() #normalized filter = compiled WHERE clause
+    key = f"count:{Model._meta.label}:{hospital_id}:g{count_generation(Model, hospital_id)}:{int(estimated)}:{query_hash}"
+    count = cache.get(key)
+    if count is None:
+        count = estimate_count(queryset) if estimated else queryset.count()
+        cache.set(key, count, settings.COUNT_CACHE_TIMEOUT)
+    return count
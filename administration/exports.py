@@ -0,0 +1,107 @@
+import csv
+import os
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import json
+from rest_framework.utils.encoders import JSONEncoder
+
+#-----------------------------------RENDERERS---------------------------------------------------
+#Only used for content negotiation (?format=csv|ndjson) and error responses, rows are streamed by export_response()
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type = None, renderer_context = None):
+        return json.dumps(data, cls = JSONEncoder, default = str) + '\n'
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+EXPORT_RENDERERS = [NDJSONRenderer, CSVRenderer]
+
+class PDFRenderer(BaseRenderer):
+    #content negotiation only (?format=pdf, Accept: application/pdf): the PDF itself is a file_response(), every other
+    #answer of the view is rendered with JSONRenderer
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+#-----------------------------------STREAMING---------------------------------------------------
+class Echo:
+    #csv.writer target that hands every row back instead of buffering it
+    def write(self, value):
+        return value
+
+def csv_cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls = JSONEncoder)
+    return value
+
+def ndjson_rows(rows):
+    for row in rows:
+        yield json.dumps(row, cls = JSONEncoder) + '\n'
+
+def csv_rows(rows, header):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([csv_cell(row.get(field)) for field in header])
+
+def export_response(instances, serializer_class, request, filename, fields = None):
+    #instances: pagination_datatable(..., export = True)['data'], fetched in EXPORT_CHUNK_SIZE keyset batches while streaming
+    export_format = request.accepted_renderer.format
+    serializer = serializer_class(fields = fields) if fields else serializer_class()
+    header = [name for name, field in serializer.fields.items() if not field.write_only and (not fields or name in fields)]
+    rows = (serializer.to_representation(instance) for instance in instances)
+    if export_format == 'csv':
+        response = StreamingHttpResponse(csv_rows(rows, header), content_type = 'text/csv')
+    else:
+        response = StreamingHttpResponse(ndjson_rows(rows), content_type = 'application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+#-----------------------------------FILES---------------------------------------------------
+def parse_range(header, size):
+    #single 'bytes=' range -> (start, end); () when it cannot be satisfied, None when the header is ignored (whole file)
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first: #suffix range, the last N bytes
+            return (max(size - int(last), 0), size - 1) if int(last) > 0 and size else ()
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    return (start, end) if start <= end else ()
+
+def file_response(request, location, etag, content_type, filename):
+    #file whose content never changes under its etag: 304 on If-None-Match, 206 on a single Range (honouring If-Range)
+    etag = f'"{etag}"'
+    if_none_match = [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]
+    headers = {'ETag': etag, 'Accept-Ranges': 'bytes', 'Cache-Control': 'private, no-cache'} #browsers revalidate with the ETag
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        size = os.path.getsize(location)
+        byte_range = None
+        if request.headers.get('Range') and request.headers.get('If-Range', etag) == etag:
+            byte_range = parse_range(request.headers['Range'], size)
+        if byte_range is None:
+            response = FileResponse(open(location, 'rb'), content_type = content_type)
+            response['Content-Length'] = size
+        elif not byte_range:
+            response = HttpResponse(status = 416)
+            response['Content-Range'] = f'bytes */{size}'
+        else:
+            start, end = byte_range
+            with open(location, 'rb') as file:
+                file.seek(start)
+                response = HttpResponse(file.read(end - start + 1), status = 206, content_type = content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = f'inline; filename="{filename}"'
+    for header, value in headers.items():
+        response[header] = value
+    return response
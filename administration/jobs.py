@@ -0,0 +1,61 @@
+import random
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from administration.models import Job
+
+#task name -> dotted path of the function run by `manage.py run_workers`, called with the job payload as keyword arguments
+TASKS = {
+    'bill_mail': 'dispensary.common_methods.send_bill_mail',
+    'reindex_dependents': 'administration.search.reindex_dependents_of',
+}
+
+#-----------------------------------ENQUEUE---------------------------------------------------
+def enqueue(task, key, payload = None, hospital = None, force = False):
+    #idempotent: a queued/running job with the key is left alone, a failed one is queued again, a done one only with force
+    job, created = Job.objects.get_or_create(key = key, defaults = {'task': task, 'payload': payload or {}, 'hospital': hospital,
+                                                                    'run_at': timezone.now()})
+    if created or job.status in ['queued', 'running'] or (job.status == 'done' and not force):
+        return job
+    Job.objects.filter(pk = job.pk, status = job.status).update(status = 'queued', attempts = 0, run_at = timezone.now(),
+                                                                locked_until = None, last_error = '', last_modified = timezone.now())
+    job.refresh_from_db()
+    return job
+
+def job_status(job):
+    return {'task': job.task, 'status': job.status, 'attempts': job.attempts, 'max_attempts': settings.JOB_MAX_ATTEMPTS,
+            'run_at': job.run_at, 'last_error': job.last_error, 'created': job.created, 'last_modified': job.last_modified}
+
+#-----------------------------------WORKER---------------------------------------------------
+def claim_job():
+    #next due job (or one whose worker died and let its lease expire); the conditional UPDATE decides between competing workers
+    now = timezone.now()
+    due = Q(status = 'queued', run_at__lte = now) | Q(status = 'running', locked_until__lt = now)
+    for job in Job.objects.filter(due).order_by('run_at')[:10]:
+        claimed = Job.objects.filter(pk = job.pk, status = job.status, attempts = job.attempts).update(status = 'running',
+            attempts = F('attempts') + 1, locked_until = now + timedelta(seconds = settings.JOB_LEASE), last_modified = now)
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+def retry_delay(attempts, backoff = None, backoff_max = None):
+    #exponential backoff with jitter, so jobs that failed together do not retry together
+    backoff = backoff or settings.JOB_RETRY_BACKOFF
+    delay = min(backoff * 2 ** (attempts - 1), backoff_max or settings.JOB_RETRY_BACKOFF_MAX)
+    return timedelta(seconds = delay * random.uniform(0.8, 1.2))
+
+def run_job(job):
+    try:
+        import_string(TASKS[job.task])(**job.payload)
+    except Exception:
+        now = timezone.now()
+        failed = job.attempts >= settings.JOB_MAX_ATTEMPTS
+        Job.objects.filter(pk = job.pk).update(status = 'failed' if failed else 'queued', locked_until = None,
+            run_at = now if failed else now + retry_delay(job.attempts), last_error = traceback.format_exc(limit = 5), last_modified = now)
+        return False
+    Job.objects.filter(pk = job.pk).update(status = 'done', locked_until = None, last_error = '', last_modified = timezone.now())
+    return True
@@ -0,0 +1,250 @@
+import json
+from datetime import date, timedelta
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from accounts.models import Account
+from dispensary.models import Bill, Medicine, Transaction
+from doctor.models import Diagnosis
+from registration.models import Appointment, Patient
+
+ROLES = ['admin', 'registrar', 'doctor', 'dispensary']
+
+
+def datatable(extra = ''):
+    return '?draw=1&length=10&start=0&search[value]=&order[0][column]=0&order[0][dir]=asc' + extra
+
+def percentile(values, percent):
+    #nearest-rank percentile of an already sorted list
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks every REST endpoint in-process (p50/p95/p99 latency, queries and bytes per request) against a seeded hospital.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospital', type = int, help = 'Hospital ID to benchmark (default: first hospital with doctors).')
+        parser.add_argument('--iterations', type = int, default = 30)
+        parser.add_argument('--warmup', type = int, default = 3)
+        parser.add_argument('--password', default = 'Seed@12345', help = 'password of the seeded accounts, used by the login endpoint')
+        parser.add_argument('--only', action = 'append', help = 'Only run endpoints whose name contains this text (can be repeated).')
+        parser.add_argument('--output', help = 'Write the results to this JSON file (a baseline).')
+        parser.add_argument('--baseline', help = 'Compare the results against this JSON file.')
+        parser.add_argument('--threshold', type = float, default = 0.2, help = 'p95 slowdown ratio reported as a regression')
+        parser.add_argument('--fail-on-regression', action = 'store_true')
+
+    def handle(self, *args, **options):
+        setup_test_environment() #allows the 'testserver' host and swaps in the locmem mail backend
+        try:
+            fixtures = self.fixtures(options['hospital'])
+            endpoints = self.endpoints(fixtures, options['password'])
+            if options['only']:
+                endpoints = [endpoint for endpoint in endpoints if any(text in endpoint['name'] for text in options['only'])]
+            results = {}
+            for endpoint in endpoints:
+                results[endpoint['name']] = self.run(endpoint, fixtures['clients'], options['iterations'], options['warmup'])
+                self.report(endpoint['name'], results[endpoint['name']])
+        finally:
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent = 2, sort_keys = True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['output']}."))
+        if options['baseline']:
+            regressions = self.compare(results, options['baseline'], options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} endpoint(s) regressed: {', '.join(regressions)}")
+
+    #-----------------------------------FIXTURES---------------------------------------------------
+    def fixtures(self, hospital_id):
+        doctors = Account.objects.filter(roles__name = 'doctor')
+        if hospital_id:
+            doctors = doctors.filter(hospital__id = hospital_id)
+        doctor = doctors.filter(appointment__isnull = False).order_by('id').first() or doctors.order_by('id').first()
+        if doctor is None:
+            raise CommandError('No hospital with doctors found, run seed_load first.')
+        hospital = doctor.hospital
+        users = {'doctor': doctor}
+        clients = {}
+        for role in ROLES:
+            if role not in users:
+                users[role] = Account.objects.filter(hospital = hospital, roles__name = role).order_by('id').first()
+            if users[role] is None:
+                raise CommandError(f"Hospital: {hospital} has no {role} account!")
+            clients[role] = APIClient(raise_request_exception = False) #a failing view is reported as a 500, not a crash
+            clients[role].force_authenticate(users[role])
+        clients['anonymous'] = APIClient(raise_request_exception = False)
+
+        appointments = Appointment.objects.filter(hospital = hospital).order_by('id')
+        medicines = list(Medicine.objects.filter(hospital = hospital, quantity__gte = 10).order_by('id')[:2])
+        patient = Patient.objects.filter(hospital = hospital).order_by('id').first()
+        bill = Bill.objects.filter(hospital = hospital).order_by('id').first()
+        if patient is None or bill is None or len(medicines) < 2:
+            raise CommandError(f"Hospital: {hospital} has no patients, bills or medicines, run seed_load first.")
+        return {
+            'hospital': hospital,
+            'users': users,
+            'clients': clients,
+            'patient': patient,
+            'appointment': appointments.first(),
+            'doctor_appointment': appointments.filter(doctor = doctor, present = True).last() or appointments.filter(doctor = doctor).last(),
+            'diagnosis': Diagnosis.objects.filter(hospital = hospital, appointment__doctor = doctor).order_by('id').first(),
+            'bill': bill,
+            'transaction': Transaction.objects.filter(hospital = hospital).order_by('id').first(),
+            'medicines': medicines,
+            'search': patient.name.split()[-1],
+        }
+
+    def endpoints(self, fixtures, password):
+        users = fixtures['users']
+        doctor = users['doctor']
+        appointment = fixtures['appointment']
+        doctor_appointment = fixtures['doctor_appointment']
+        bill = fixtures['bill']
+        medicines = [{'id': medicine.id, 'qty': 1} for medicine in fixtures['medicines']]
+        search = fixtures['search']
+        tomorrow = (date.today() + timedelta(days = 1)).strftime("%Y-%m-%d")
+
+        def write(name, role, method, path, data, prepare = None):
+            return {'name': name, 'role': role, 'method': method, 'path': path, 'data': data, 'prepare': prepare, 'write': True}
+
+        def read(name, role, path):
+            return {'name': name, 'role': role, 'method': 'get', 'path': path, 'data': None, 'prepare': None, 'write': False}
+
+        endpoints = [
+            write('accounts login', 'anonymous', 'post', '/api/login/', {'username': users['registrar'].email, 'password': password}),
+        ]
+        for path in ['departments', 'roles', 'staff']:
+            endpoints += [
+                read(f"administration {path} list", 'admin', f"/administration/api/{path}/" + datatable()),
+                read(f"administration {path} search", 'admin', f"/administration/api/{path}/" + datatable().replace('search[value]=', 'search[value]=a')),
+            ]
+        endpoints += [
+            read('administration staff sort', 'admin', '/administration/api/staff/' + datatable().replace('[column]=0&order[0][dir]=asc', '[column]=2&order[0][dir]=desc')),
+            read('administration staff retrieve', 'admin', f"/administration/api/staff/{doctor.id}/"),
+            read('administration departments retrieve', 'admin', f"/administration/api/departments/{doctor.department_id}/"),
+
+            read('registration patient list', 'registrar', '/registration/api/patient/' + datatable()),
+            read('registration patient search', 'registrar', '/registration/api/patient/' + datatable().replace('search[value]=', f"search[value]={search}")),
+            read('registration patient sort', 'registrar', '/registration/api/patient/' + datatable().replace('[column]=0&order[0][dir]=asc', '[column]=3&order[0][dir]=desc')),
+            read('registration patient retrieve', 'registrar', f"/registration/api/patient/{fixtures['patient'].id}/"),
+            read('registration appointment list', 'registrar', '/registration/api/appointment/' + datatable()),
+            read('registration appointment list cursor', 'registrar', '/registration/api/appointment/' + datatable('&cursor=')),
+            read('registration appointment search', 'registrar', '/registration/api/appointment/' + datatable().replace('search[value]=', f"search[value]={search}")),
+            read('registration appointment retrieve', 'registrar', f"/registration/api/appointment/{appointment.id}/"),
+            write('registration appointment create', 'registrar', 'post', '/registration/api/appointment/',
+                {'appointment_date': tomorrow, 'patient': fixtures['patient'].id, 'doctor': doctor.id, 'department': doctor.department_id}),
+            read('registration token list', 'registrar', '/registration/api/token/' + datatable()),
+            read('registration patient export', 'registrar', '/registration/api/patient/export/?format=ndjson'),
+
+            read('doctor appointment list', 'doctor', '/doctor/api/appointment/' + datatable()),
+            read('doctor token list', 'doctor', '/doctor/api/token/' + datatable()),
+            read('doctor diagnosis list', 'doctor', '/doctor/api/diagnosis/' + datatable()),
+            read('doctor diagnosis search', 'doctor', '/doctor/api/diagnosis/' + datatable().replace('search[value]=', 'search[value]=fever')),
+            write('doctor diagnosis create', 'doctor', 'post', '/doctor/api/diagnosis/',
+                {'appointment': doctor_appointment.id, 'diagnosis': 'bench', 'symptoms': 'bench', 'medicine': medicines},
+                lambda: Diagnosis.objects.filter(appointment = doctor_appointment).delete()),
+            read('doctor availability list', 'doctor', '/doctor/api/availability/'),
+            read('doctor availability doctors', 'registrar', f"/doctor/api/availability/doctors/?dept_no={doctor.department_id}&appointment_date={tomorrow}"),
+            read('doctor availability calendar', 'registrar', f"/doctor/api/availability/calendar/?dept_no={doctor.department_id}&start_date={tomorrow}&end_date={(date.today() + timedelta(days = 30)).strftime('%Y-%m-%d')}"),
+            read('doctor available medicine', 'doctor', '/doctor/api/diagnosis/available_medicine_list/?name=med'),
+            read('doctor medicine autocomplete', 'doctor', '/doctor/api/diagnosis/medicine_autocomplete/?name=medicine 1'),
+
+            read('dispensary medicine list', 'dispensary', '/dispensary/api/medicine/' + datatable()),
+            read('dispensary medicine search', 'dispensary', '/dispensary/api/medicine/' + datatable().replace('search[value]=', 'search[value]=fever')),
+            read('dispensary medicine retrieve', 'dispensary', f"/dispensary/api/medicine/{fixtures['medicines'][0].id}/"),
+            read('dispensary medicine low stock', 'dispensary', '/dispensary/api/medicine/low_stock/'),
+            read('dispensary bill list', 'dispensary', '/dispensary/api/bill/' + datatable()),
+            read('dispensary bill retrieve', 'dispensary', f"/dispensary/api/bill/{bill.id}/"),
+            write('dispensary bill create', 'dispensary', 'post', '/dispensary/api/bill/',
+                {'appointment': bill.appointment_id, 'details': medicines},
+                lambda: Bill.objects.filter(appointment__id = bill.appointment_id).delete()),
+            read('dispensary transaction list', 'dispensary', '/dispensary/api/transaction/' + datatable()),
+            write('dispensary transaction create', 'dispensary', 'post', '/dispensary/api/transaction/',
+                {'bill': bill.id, 'payment_mode': 'cash'},
+                lambda: Transaction.objects.filter(bill = bill).delete()),
+        ]
+        if fixtures['diagnosis']:
+            endpoints.append(read('doctor diagnosis retrieve', 'doctor', f"/doctor/api/diagnosis/{fixtures['diagnosis'].id}/"))
+        if fixtures['transaction']:
+            endpoints.append(read('dispensary transaction retrieve', 'dispensary', f"/dispensary/api/transaction/{fixtures['transaction'].id}/"))
+        return endpoints
+
+    #-----------------------------------MEASURE---------------------------------------------------
+    def request(self, endpoint, client):
+        queries = []
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        start = perf_counter()
+        with connection.execute_wrapper(count_query): #unlike connection.queries, not capped at 9000 entries
+            response = getattr(client, endpoint['method'])(endpoint['path'], endpoint['data'], format = 'json') \
+                if endpoint['data'] is not None else client.get(endpoint['path'])
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+        return perf_counter() - start, len(queries), size, response.status_code
+
+    def measure(self, endpoint, client):
+        if not endpoint['write']:
+            return self.request(endpoint, client)
+        with transaction.atomic(): #writes are rolled back so every iteration sees the same data
+            if endpoint['prepare']:
+                endpoint['prepare']()
+            result = self.request(endpoint, client)
+            transaction.set_rollback(True)
+        return result
+
+    def run(self, endpoint, clients, iterations, warmup):
+        client = clients[endpoint['role']]
+        for _ in range(warmup):
+            self.measure(endpoint, client)
+        timings, queries, sizes, statuses = [], [], [], set()
+        for _ in range(iterations):
+            elapsed, query_count, size, status_code = self.measure(endpoint, client)
+            timings.append(elapsed * 1000)
+            queries.append(query_count)
+            sizes.append(size)
+            statuses.add(status_code)
+        timings.sort()
+        return {
+            'p50': round(percentile(timings, 50), 3),
+            'p95': round(percentile(timings, 95), 3),
+            'p99': round(percentile(timings, 99), 3),
+            'queries': max(queries),
+            'bytes': max(sizes),
+            'status': sorted(statuses),
+        }
+
+    #-----------------------------------REPORT---------------------------------------------------
+    def report(self, name, result):
+        line = f"{name:<45} p50 {result['p50']:>9.2f}ms  p95 {result['p95']:>9.2f}ms  p99 {result['p99']:>9.2f}ms  " \
+               f"{result['queries']:>4} queries  {result['bytes']:>9} bytes  {result['status']}"
+        if any(status >= 400 for status in result['status']):
+            line = self.style.WARNING(line)
+        self.stdout.write(line)
+
+    def compare(self, results, path, threshold):
+        with open(path) as file:
+            baseline = json.load(file)
+        regressions = []
+        self.stdout.write(f"\nCompared with {path}:")
+        for name, result in results.items():
+            if name not in baseline:
+                self.stdout.write(f"{name:<45} new endpoint")
+                continue
+            before = baseline[name]
+            ratio = result['p95'] / before['p95'] if before['p95'] else 1
+            line = f"{name:<45} p95 {before['p95']:>9.2f} -> {result['p95']:>9.2f}ms ({ratio - 1:+.0%})  " \
+                   f"queries {before['queries']} -> {result['queries']}  bytes {before['bytes']} -> {result['bytes']}"
+            if ratio > 1 + threshold or result['queries'] > before['queries']:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        return regressions
@@ -0,0 +1,87 @@
+from itertools import cycle, islice
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+from administration.serializers import AccountReadSerializer, DepartmentReadSerializer, RolesReadSerializer
+from administration.values import values_data
+from administration.views import select_related_fields
+from dispensary.serializers import BillReadSerializer, MedicineReadSerializer, TransactionReadSerializer
+from doctor.serializers import DiagnosisReadSerializer
+from registration.serializers import AppointmentReadSerializer, PatientReadSerializer, TokenReadSerializer
+
+SERIALIZERS = [DepartmentReadSerializer, RolesReadSerializer, AccountReadSerializer, PatientReadSerializer, AppointmentReadSerializer,
+               TokenReadSerializer, MedicineReadSerializer, BillReadSerializer, TransactionReadSerializer, DiagnosisReadSerializer]
+VALUES_SERIALIZERS = [AppointmentReadSerializer, MedicineReadSerializer, TransactionReadSerializer] #list actions rendered by values_data()
+
+
+def rebinding(read_serializer_class):
+    #reference: related fields re-bound on every to_representation() call, as the list serializers used to do
+    class RebindingSerializer(read_serializer_class):
+        def to_representation(self, instance):
+            for name in self.related_fields:
+                if name in self.fields:
+                    self.fields[name] = serializers.StringRelatedField(read_only = True)
+            return super().to_representation(instance)
+    return RebindingSerializer
+
+
+class Command(BaseCommand):
+    help = ('Profiles per-row cost of many = True read serializers against re-binding their related fields on every row, '
+            'and datatable pages rendered by values_data() against the read serializers (--values).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type = int, default = 10000)
+        parser.add_argument('--sample', type = int, default = 100, help = 'distinct DB rows, repeated up to --rows')
+        parser.add_argument('--only', action = 'append', help = 'Only profile serializers whose name contains this text (can be repeated).')
+        parser.add_argument('--values', action = 'store_true', help = 'compare values_data() with the read serializers, DB fetch included')
+        parser.add_argument('--page', type = int, default = 500, help = 'page length for --values')
+
+    def handle(self, *args, **options):
+        if options['values']:
+            return self.compare_values(options)
+        for serializer_class in self.selected(SERIALIZERS, options):
+            name = serializer_class.__name__
+            Model = serializer_class.Meta.model
+            #related rows are loaded up front, so only serialization is timed (no queries)
+            sample = list(select_related_fields(Model.objects.order_by('id'), serializer_class)[:options['sample']])
+            if not sample:
+                raise CommandError(f"No {Model.__name__} rows, run seed_load first.")
+            rows = list(islice(cycle(sample), options['rows']))
+            rebinding_time = self.measure(rebinding(serializer_class), rows)
+            read_time = self.measure(serializer_class, rows)
+            self.stdout.write(f"{name:<29} {len(rows)} rows  re-binding {rebinding_time / len(rows) * 1e6:>7.1f}us/row  "
+                              f"bound once {read_time / len(rows) * 1e6:>7.1f}us/row  {rebinding_time / read_time:>4.1f}x")
+
+    def selected(self, serializer_classes, options):
+        return [serializer_class for serializer_class in serializer_classes
+                if not options['only'] or any(text in serializer_class.__name__ for text in options['only'])]
+
+    def compare_values(self, options):
+        #whole pages as the list actions build them: query + row formatting, pages walked until --rows rows are rendered
+        for serializer_class in self.selected(VALUES_SERIALIZERS, options):
+            name = serializer_class.__name__
+            Model = serializer_class.Meta.model
+            queryset = select_related_fields(Model.objects.order_by('-id'), serializer_class)
+            total = min(queryset.count(), options['rows'])
+            if not total:
+                raise CommandError(f"No {Model.__name__} rows, run seed_load first.")
+            pages = [queryset[start:start + options['page']] for start in range(0, total, options['page'])]
+            for page in pages:
+                values_rows = [list(row.items()) for row in values_data(page, serializer_class)] #key order counts as well
+                if values_rows != [list(row.items()) for row in serializer_class(page, many = True).data]:
+                    raise CommandError(f"{name}: values_data() output differs from the serializer.")
+            serializer_time = self.measure_pages(lambda page: serializer_class(page, many = True).data, pages)
+            values_time = self.measure_pages(lambda page: values_data(page, serializer_class), pages)
+            self.stdout.write(f"{name:<29} {total} rows  serializer {total / serializer_time:>9.0f} rows/s  "
+                              f"values {total / values_time:>9.0f} rows/s  {serializer_time / values_time:>4.1f}x")
+
+    def measure_pages(self, render, pages):
+        start = perf_counter()
+        for page in pages:
+            render(page._chain()) #fresh queryset, nothing cached from the previous run
+        return perf_counter() - start
+
+    def measure(self, serializer_class, rows):
+        start = perf_counter()
+        serializer_class(rows, many = True).data
+        return perf_counter() - start
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from administration.search import INDEXED_MODELS, rebuild_index
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the full-text search index (SearchDocument) used by the datatable search box. Hospitals that existed '
+            'before the index are searched with LIKE until it has run for them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospital', type = int, action = 'append', dest = 'hospitals', 
+            help = 'Only rebuild this hospital ID (can be repeated).')
+        parser.add_argument('--batch-size', type = int, default = 1000)
+
+    def handle(self, *args, **options):
+        rebuild_index(options['hospitals'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt for {', '.join(INDEXED_MODELS)}."))
@@ -0,0 +1,55 @@
+import os
+from datetime import datetime
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from dispensary.common_methods import bill_pdf_cache_location, bill_pdf_data, store_bill_pdf
+from dispensary.models import Bill, Transaction
+from dispensary.pdf import render_bills
+from doctor.models import Diagnosis
+
+
+class Command(BaseCommand):
+    help = "Renders (or backfills) the PDFs of a day's paid bills across all CPU cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', required = True, help = 'bill date, YYYY-MM-DD')
+        parser.add_argument('--hospital', type = int, help = 'only bills of this hospital ID')
+        parser.add_argument('--workers', type = int, default = os.cpu_count(), help = 'rendering processes (1 renders in this process)')
+        parser.add_argument('--chunksize', type = int, default = 20, help = 'bills sent to a worker process at a time')
+        parser.add_argument('--missing', action = 'store_true', help = 'backfill: skip bills whose cached PDF already exists')
+
+    def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['date'], "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError(f"Date: {options['date']} is not in YYYY-MM-DD format!")
+        bills = Bill.objects.filter(bill_date__date = day).select_related('hospital', 'appointment__patient', 'appointment__doctor').order_by('id')
+        if options['hospital']:
+            bills = bills.filter(hospital__id = options['hospital'])
+        bills = list(bills)
+        #transactions and diagnoses of the whole day in two queries, only paid and diagnosed bills can be rendered
+        transactions = {transaction.bill_id: transaction for transaction in Transaction.objects.filter(bill__in = bills)}
+        diagnoses = {diagnosis.appointment_id: diagnosis for diagnosis in
+                     Diagnosis.objects.filter(appointment__in = [bill.appointment_id for bill in bills])}
+        #written where BillView.pdf and the bill mails read them (cached_bill_pdf), one file per bill content
+        locations = {}
+        data = []
+        for bill in bills:
+            if bill.id not in transactions or bill.appointment_id not in diagnoses: continue
+            bill_data = bill_pdf_data(bill, transactions[bill.id], diagnoses[bill.appointment_id])
+            locations[bill.id] = bill_pdf_cache_location(bill_data)[0]
+            if options['missing'] and os.path.exists(locations[bill.id]): continue
+            data.append(bill_data)
+        skipped = len(bills) - len(data)
+        if not data:
+            self.stdout.write(f"No bills to render for {day} ({skipped} skipped).")
+            return
+
+        start = perf_counter()
+        size = 0
+        for bill_data, pdf in render_bills(data, options['workers'], options['chunksize']):
+            store_bill_pdf(locations[bill_data['bill_id']], pdf)
+            size += len(pdf)
+        elapsed = perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Rendered {len(data)} bills of {day} ({skipped} skipped) in {elapsed:.2f}s "
+                                             f"with {options['workers']} workers: {len(data) / elapsed:.1f} bills/s, {size / 1024:.0f} KiB."))
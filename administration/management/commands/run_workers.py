@@ -0,0 +1,50 @@
+import signal
+from threading import Event, Thread
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from administration.jobs import claim_job, run_job
+from administration.outbox import send_outbox
+
+
+class Command(BaseCommand):
+    help = ('Runs queued background jobs (bill PDFs) and sends the email outbox, retrying failures with backoff. '
+            'Start as many as needed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type = int, default = 1, help = 'jobs run in parallel by this process')
+        parser.add_argument('--poll', type = float, default = 2, help = 'seconds to wait when no job is due')
+        parser.add_argument('--once', action = 'store_true', help = 'exit once no job is due instead of polling')
+
+    def handle(self, *args, **options):
+        self.stopping = Event()
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            signal.signal(signum, self.stop) #running jobs are finished before exiting
+        threads = [Thread(target = self.work, args = (options,), daemon = True) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+
+    def stop(self, signum, frame):
+        self.stdout.write('Stopping after the running jobs...')
+        self.stopping.set()
+
+    def work(self, options):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                job = claim_job()
+                if job is not None:
+                    if run_job(job):
+                        self.stdout.write(f"{job.task} {job.key}: done")
+                    else:
+                        self.stdout.write(self.style.WARNING(f"{job.task} {job.key}: attempt {job.attempts} failed"))
+                sent, failed = send_outbox()
+                if sent or failed:
+                    self.stdout.write(f"outbox: {sent} sent, {failed} failed")
+                if job is None and not sent and not failed:
+                    if options['once']: break
+                    self.stopping.wait(options['poll'])
+        finally:
+            connection.close()
@@ -0,0 +1,201 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from time import perf_counter
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from accounts.models import Account, Department, Hospital, Roles
+from administration.counts import rebuild_record_counts
+from administration.search import rebuild_index
+from dispensary.models import Bill, Medicine, Transaction, payment_choices
+from dispensary.stock import track_low_stock
+from doctor.models import Diagnosis, DoctorAvailability, DoctorHoliday
+from registration.models import Appointment, Patient, gender_choices
+
+ROLES = ['admin', 'registrar', 'doctor', 'dispensary']
+DEPARTMENTS = ['cardiology', 'neurology', 'orthopedics', 'pediatrics', 'dermatology', 'ent', 'gynecology', 'oncology',
+               'psychiatry', 'urology', 'radiology', 'nephrology']
+FIRST_NAMES = ['aarav', 'vivaan', 'aditya', 'diya', 'ananya', 'ishaan', 'kavya', 'rohan', 'meera', 'arjun', 'saanvi',
+               'kabir', 'riya', 'vihaan', 'anika', 'neha', 'rahul', 'pooja', 'amit', 'sneha']
+LAST_NAMES = ['sharma', 'verma', 'singh', 'patel', 'gupta', 'iyer', 'nair', 'reddy', 'khan', 'das', 'mehta', 'joshi']
+SYMPTOMS = ['fever', 'cough', 'headache', 'fatigue', 'nausea', 'rash', 'back pain', 'dizziness', 'sore throat', 'chest pain']
+DIAGNOSES = ['viral fever', 'migraine', 'hypertension', 'bronchitis', 'gastritis', 'dermatitis', 'sprain', 'anemia',
+             'sinusitis', 'diabetes']
+DIRECTIONS = ['after food', 'before food', 'twice a day', 'at night', 'once a day']
+
+
+class Command(BaseCommand):
+    help = 'Loads synthetic hospitals (staff, patients, appointments, diagnoses, bills, transactions, holidays) with bulk_create.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospitals', type = int, default = 2)
+        parser.add_argument('--departments', type = int, default = 6, help = 'per hospital')
+        parser.add_argument('--doctors', type = int, default = 4, help = 'per department')
+        parser.add_argument('--registrars', type = int, default = 3, help = 'per hospital')
+        parser.add_argument('--dispensary', type = int, default = 2, help = 'per hospital')
+        parser.add_argument('--patients', type = int, default = 2000, help = 'per hospital')
+        parser.add_argument('--appointments', type = int, default = 20000, help = 'per hospital')
+        parser.add_argument('--medicines', type = int, default = 300, help = 'per hospital')
+        parser.add_argument('--holidays', type = int, default = 5, help = 'upcoming holidays per doctor')
+        parser.add_argument('--future-days', type = int, default = 14, help = 'appointments are booked up to this many days ahead')
+        parser.add_argument('--diagnosed', type = float, default = 0.8, help = 'share of past appointments that were diagnosed')
+        parser.add_argument('--paid', type = float, default = 0.9, help = 'share of bills that were paid')
+        parser.add_argument('--password', default = 'Seed@12345', help = 'password of every generated account')
+        parser.add_argument('--seed', type = int, default = 42)
+        parser.add_argument('--batch-size', type = int, default = 5000)
+        parser.add_argument('--skip-index', action = 'store_true', help = 'do not rebuild the search index afterwards')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.password = make_password(options['password']) #hashed once, shared by every account
+        self.next_ids = {}
+        started = perf_counter()
+        hospital_ids = []
+        for _ in range(options['hospitals']):
+            with transaction.atomic():
+                hospital = self.seed_hospital()
+            hospital_ids.append(hospital.id)
+            self.stdout.write(f"{hospital.name}: done in {perf_counter() - started:.1f}s")
+        rebuild_record_counts(hospital_ids) #bulk_create sends no signals
+        if not options['skip_index']:
+            rebuild_index(hospital_ids)
+        self.stdout.write(self.style.SUCCESS(f"Seeded {len(hospital_ids)} hospitals in {perf_counter() - started:.1f}s."))
+
+    #-----------------------------------HELPERS---------------------------------------------------
+    def allocate_ids(self, Model, count):
+        #explicit primary keys, so dependants can be built before the parents are inserted (MySQL returns no ids)
+        if Model not in self.next_ids:
+            self.next_ids[Model] = (Model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        start = self.next_ids[Model]
+        self.next_ids[Model] += count
+        return range(start, start + count)
+
+    def person_name(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}".title()
+
+    def mobile(self, Model):
+        #unique 10 digit mobile numbers starting with 6 (valid for the serializers' regex), after any already stored
+        if (Model, 'mobile') not in self.next_ids:
+            last = Model.objects.filter(mobile__startswith = '6').order_by('-mobile').values_list('mobile', flat = True).first()
+            self.next_ids[(Model, 'mobile')] = int(last) + 1 if last else 6000000000
+        mobile = self.next_ids[(Model, 'mobile')]
+        self.next_ids[(Model, 'mobile')] += 1
+        return str(mobile)
+
+    def flush(self, pending):
+        for Model in [Appointment, Diagnosis, Bill, Transaction]:
+            Model.objects.bulk_create(pending[Model], batch_size = self.batch_size)
+            pending[Model] = []
+
+    #-----------------------------------HOSPITAL---------------------------------------------------
+    def seed_hospital(self):
+        options = self.options
+        rng = self.rng
+        id = self.allocate_ids(Hospital, 1)[0]
+        hospital = Hospital(id = id, name = f"seed hospital {id}")
+        Hospital.objects.bulk_create([hospital])
+        tag = f"h{hospital.id}"
+
+        roles = {name: Roles(id = id, name = name, hospital = hospital) for name, id in zip(ROLES, self.allocate_ids(Roles, len(ROLES)))}
+        Roles.objects.bulk_create(roles.values())
+        department_names = ['admin'] + [DEPARTMENTS[i % len(DEPARTMENTS)] + ('' if i < len(DEPARTMENTS) else f" {i}")
+                                        for i in range(options['departments'])]
+        departments = [Department(id = id, name = name, fees = Decimal(rng.randrange(300, 1500, 50)), hospital = hospital)
+                       for name, id in zip(department_names, self.allocate_ids(Department, len(department_names)))]
+        Department.objects.bulk_create(departments)
+        admin_department, departments = departments[0], departments[1:]
+
+        def account(role, department, index):
+            id = self.allocate_ids(Account, 1)[0]
+            return Account(id = id, email = f"{role}{index}@{tag}.seed", name = self.person_name(), mobile = self.mobile(Account),
+                           password = self.password, hospital = hospital, roles = roles[role], department = department)
+        accounts = [account('admin', admin_department, 1)]
+        accounts += [account('registrar', admin_department, i + 1) for i in range(options['registrars'])]
+        accounts += [account('dispensary', admin_department, i + 1) for i in range(options['dispensary'])]
+        doctors = [account('doctor', department, f"{department.id}-{i + 1}") for department in departments for i in range(options['doctors'])]
+        Account.objects.bulk_create(accounts + doctors, batch_size = self.batch_size)
+
+        today = date.today()
+        holidays = []
+        for doctor in doctors:
+            for start in sorted({today + timedelta(days = rng.randint(1, 60)) for _ in range(options['holidays'])}):
+                end = start + timedelta(days = rng.choice([0, 0, 0, 2])) #some multi-day ranges
+                if holidays and holidays[-1].doctor is doctor and holidays[-1].end_date >= start - timedelta(days = 1):
+                    holidays[-1].end_date = max(holidays[-1].end_date, end) #touching ranges are stored as one
+                else:
+                    holidays.append(DoctorHoliday(doctor = doctor, start_date = start, end_date = end, hospital = hospital))
+        DoctorAvailability.objects.bulk_create([DoctorAvailability(doctor = doctor, hospital = hospital) for doctor in doctors], batch_size = self.batch_size)
+        DoctorHoliday.objects.bulk_create(holidays, batch_size = self.batch_size)
+
+        medicines = []
+        for id in self.allocate_ids(Medicine, options['medicines']):
+            quantity = rng.randint(0, 1000)
+            medicines.append(Medicine(id = id, name = f"medicine {id}", used_for = ', '.join(rng.sample(SYMPTOMS, 2)),
+                quantity = quantity, available = quantity, price = Decimal(rng.randint(100, 50000)) / 100,
+                discount_percent = Decimal(rng.choice([0, 0, 5, 10, 15])), hospital = hospital))
+        Medicine.objects.bulk_create(medicines, batch_size = self.batch_size)
+        track_low_stock([medicine.id for medicine in medicines])
+
+        patients = []
+        for id in self.allocate_ids(Patient, options['patients']):
+            patients.append(Patient(id = id, email = f"patient{id}@{tag}.seed", mobile = self.mobile(Patient), name = self.person_name(),
+                dob = today - timedelta(days = rng.randint(365, 365 * 90)), gender = rng.choice(gender_choices)[0], hospital = hospital))
+            if len(patients) >= self.batch_size:
+                Patient.objects.bulk_create(patients)
+                patients = []
+        Patient.objects.bulk_create(patients)
+        patient_ids = list(Patient.objects.filter(hospital = hospital).values_list('id', flat = True))
+
+        self.seed_appointments(hospital, doctors, patient_ids, medicines, today)
+        return hospital
+
+    def seed_appointments(self, hospital, doctors, patient_ids, medicines, today):
+        options = self.options
+        rng = self.rng
+        pending = {Appointment: [], Diagnosis: [], Bill: [], Transaction: []}
+        remaining = options['appointments']
+        day = today + timedelta(days = options['future_days'])
+        while remaining > 0 and doctors:
+            for doctor in doctors:
+                for _ in range(min(rng.randint(0, settings.APPOINTMENTS_PER_DOCTOR_DAY), remaining)):
+                    remaining -= 1
+                    appointment_id = self.allocate_ids(Appointment, 1)[0]
+                    past = day < today
+                    diagnosed = past and rng.random() < options['diagnosed']
+                    pending[Appointment].append(Appointment(id = appointment_id, appointment_date = day, present = past,
+                        diagnosed = diagnosed, patient_id = rng.choice(patient_ids), doctor = doctor,
+                        department_id = doctor.department_id, hospital = hospital))
+                    if diagnosed:
+                        self.seed_diagnosis(pending, hospital, appointment_id, doctor, medicines)
+                if len(pending[Appointment]) >= self.batch_size:
+                    self.flush(pending)
+            day -= timedelta(days = 1)
+        self.flush(pending)
+
+    def seed_diagnosis(self, pending, hospital, appointment_id, doctor, medicines):
+        rng = self.rng
+        prescribed = rng.sample(medicines, min(len(medicines), rng.randint(1, 5)))
+        lines = [(medicine, rng.randint(1, 5)) for medicine in prescribed]
+        pending[Diagnosis].append(Diagnosis(id = self.allocate_ids(Diagnosis, 1)[0], appointment_id = appointment_id,
+            diagnosis = rng.choice(DIAGNOSES), symptoms = ', '.join(rng.sample(SYMPTOMS, 2)),
+            medicine = [{'id': medicine.id, 'name': medicine.name, 'qty': qty, 'direction': rng.choice(DIRECTIONS)} for medicine, qty in lines],
+            hospital = hospital))
+        fees = float(doctor.department.fees)
+        bill_lines = []
+        total = fees
+        for medicine, qty in lines:
+            price = float(medicine.price)
+            discount = float(medicine.discount_percent)
+            bill_lines.append({'id': medicine.id, 'name': medicine.name, 'qty': qty, 'price': price, 'discount_percent': discount})
+            total += price * (1 - (discount / 100)) * qty
+        bill_id = self.allocate_ids(Bill, 1)[0]
+        pending[Bill].append(Bill(id = bill_id, appointment_id = appointment_id, details = {'Doctor Fees': fees, 'medicines': bill_lines},
+            total_price = round(Decimal(total), 2), hospital = hospital))
+        if rng.random() < self.options['paid']:
+            pending[Transaction].append(Transaction(id = self.allocate_ids(Transaction, 1)[0], bill_id = bill_id,
+                amount = round(Decimal(total), 2), payment_mode = rng.choice(payment_choices)[0], hospital = hospital))
@@ -0,0 +1,101 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from accounts.models import Account
+from doctor.views import doctor_availability
+from registration.capacity import daily_limit
+from registration.models import Appointment, DoctorDayCount, Patient
+
+
+class Command(BaseCommand):
+    help = ('Books one doctor-day from parallel threads through the appointment endpoint, then cancels and rebooks '
+            'concurrently, and checks that the day was never overbooked and its counter matches the appointments.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospital', type = int, help = 'Hospital ID (default: first hospital with a registration account).')
+        parser.add_argument('--bookings', type = int, default = 40, help = 'bookings posted at once, one patient each')
+        parser.add_argument('--cancels', type = int, default = 3, help = 'appointments cancelled while the second wave books')
+        parser.add_argument('--workers', type = int, default = 8)
+        parser.add_argument('--keep', action = 'store_true', help = 'keep the generated patients and appointments')
+
+    def handle(self, *args, **options):
+        user = Account.objects.filter(roles__name = 'registrar')
+        if options['hospital']:
+            user = user.filter(hospital__id = options['hospital'])
+        user = user.order_by('id').first()
+        if user is None:
+            raise CommandError('No registration account found, run seed_load first.')
+        hospital = user.hospital
+        doctor = Account.objects.select_related('department').filter(hospital = hospital, roles__name = 'doctor',
+                                                                     department__isnull = False).order_by('id').first()
+        if doctor is None:
+            raise CommandError(f"Hospital: {hospital} has no doctors, run seed_load first.")
+        day = self.free_day(doctor)
+        limit = daily_limit(doctor)
+
+        #rows are committed up front, every worker thread has its own DB connection
+        patients = [Patient.objects.create(email = f"stress{index}@bookings.stress", mobile = f"9{index:09d}", name = f"stress patient {index}",
+                    dob = date(1990, 1, 1), gender = 'o', hospital = hospital) for index in range(options['bookings'] * 2)]
+        setup_test_environment() #'testserver' host and the locmem mail backend
+        try:
+            first, second = patients[:options['bookings']], patients[options['bookings']:]
+            statuses, elapsed = self.run(user, [('post', doctor, day, patient) for patient in first], options['workers'])
+            failures = self.verify(doctor, day, limit, 'parallel bookings', statuses, elapsed)
+            booked = list(Appointment.objects.filter(doctor = doctor, appointment_date = day, patient__in = first).values_list('id', flat = True))
+            requests = [('delete', appointment_id) for appointment_id in booked[:options['cancels']]]
+            requests += [('post', doctor, day, patient) for patient in second]
+            statuses, elapsed = self.run(user, requests, options['workers'])
+            failures += self.verify(doctor, day, limit, 'cancels while booking', statuses, elapsed)
+        finally:
+            teardown_test_environment()
+            if not options['keep']:
+                Appointment.objects.filter(patient__in = patients).delete()
+                Patient.objects.filter(pk__in = [patient.id for patient in patients]).delete()
+                DoctorDayCount.objects.filter(doctor = doctor, appointment_date = day).delete()
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('No overbooking, the counter matches the booked appointments.'))
+
+    def free_day(self, doctor):
+        #first day without appointments or a holiday, so the whole limit is up for grabs
+        for offset in range(1, 366):
+            day = date.today() + timedelta(days = offset)
+            if (not Appointment.objects.filter(doctor = doctor, appointment_date = day).exists()
+                    and doctor_availability(doctor.department_id, day, doctor.hospital).filter(id = doctor.id).exists()):
+                return day
+        raise CommandError(f"Doctor: {doctor} has no free day within a year.")
+
+    def run(self, user, requests, workers):
+        def send(request):
+            try:
+                client = APIClient(raise_request_exception = False)
+                client.force_authenticate(user)
+                if request[0] == 'delete':
+                    return 'delete ' + str(client.delete(f'/registration/api/appointment/{request[1]}/').status_code)
+                method, doctor, day, patient = request
+                return 'post ' + str(client.post('/registration/api/appointment/', {'appointment_date': day.strftime("%Y-%m-%d"), 'patient': patient.id,
+                                                 'doctor': doctor.id, 'department': doctor.department_id}, format = 'json').status_code)
+            finally:
+                connection.close()
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            statuses = Counter(executor.map(send, requests))
+        return statuses, perf_counter() - start
+
+    def verify(self, doctor, day, limit, name, statuses, elapsed):
+        booked = Appointment.objects.filter(doctor = doctor, appointment_date = day).count()
+        counter = DoctorDayCount.objects.filter(doctor = doctor, appointment_date = day).values_list('booked', flat = True).first()
+        self.stdout.write(f"{name}: {sum(statuses.values())} requests in {elapsed:.2f}s: "
+                          + ', '.join(f"{count} x {status}" for status, count in sorted(statuses.items()))
+                          + f"; {booked} booked of {limit}, counter {counter}")
+        failures = []
+        if booked > limit:
+            failures.append(f"{name}: {booked} appointments for a limit of {limit}")
+        if counter != booked:
+            failures.append(f"{name}: counter {counter} but {booked} appointments")
+        return failures
@@ -0,0 +1,149 @@
+from collections import deque
+from contextlib import ExitStack, nullcontext
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter, time
+from django.conf import settings
+from django.db import connections
+
+#-----------------------------------RING BUFFER---------------------------------------------------
+metrics_buffer = deque(maxlen = settings.REQUEST_METRICS_BUFFER)
+metrics_lock = Lock()
+
+def record_metrics(metrics):
+    with metrics_lock:
+        metrics_buffer.append(metrics)
+
+def get_metrics(hospital_id = None, viewset = None, action = None):
+    with metrics_lock:
+        records = list(metrics_buffer)
+    return [record for record in records if (hospital_id is None or record['hospital'] == hospital_id)
+            and (viewset is None or record['viewset'] == viewset) and (action is None or record['action'] == action)]
+
+#-----------------------------------MIDDLEWARE---------------------------------------------------
+class QueryTimer:
+    #connection.execute_wrapper hook, count queries (SELECT COUNT) are tracked apart from the rest
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.count_queries = 0
+        self.count_time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if sql.lstrip().upper().startswith('SELECT COUNT('):
+                self.count_queries += 1
+                self.count_time += elapsed
+
+
+class SerializeTimer:
+    #time spent turning instances and rows into primitives, without the queries run meanwhile (lazy querysets, related
+    #rows); nested serializers are counted once, by the outermost one
+    def __init__(self, queries):
+        self.queries = queries
+        self.depth = 0
+        self.time = 0
+
+    def __enter__(self):
+        if not self.depth:
+            self.start, self.db_start = perf_counter(), self.queries.db_time
+        self.depth += 1
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if not self.depth:
+            self.time += perf_counter() - self.start - (self.queries.db_time - self.db_start)
+
+serialize_timer = ContextVar('serialize_timer', default = None) #SerializeTimer of the request being handled
+
+def serializing():
+    #with serializing(): around serializer output (administration.serializers, administration.values), no-op outside a request
+    return serialize_timer.get() or nullcontext()
+
+
+def shows_timing(request):
+    #Server-Timing tells how the server spends its time, only developers (DEBUG) and staff/hospital admins get it
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None) #set by DRF's authentication too
+    if user is None or not user.is_authenticated:
+        return False
+    return user.is_staff or getattr(user.roles, 'name', None) == 'admin'
+
+
+class RequestMetricsMiddleware:
+    #per request: queries, DB time, serialize and render (JSON/CSV encoding) time and response size, in metrics_buffer and
+    #as Server-Timing (shows_timing)
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_view = (None, None)
+        request.metrics_render = 0
+        timer = QueryTimer()
+        serialize = SerializeTimer(timer)
+        token = serialize_timer.set(serialize)
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            serialize_timer.reset(token)
+        total = perf_counter() - start
+
+        render = request.metrics_render
+        app = max(total - timer.db_time - serialize.time - render, 0) #view code
+        if shows_timing(request):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timer.db_time * 1000:.2f};desc="{timer.queries} queries"',
+                f'count;dur={timer.count_time * 1000:.2f};desc="{timer.count_queries} queries"',
+                f'serialize;dur={serialize.time * 1000:.2f}',
+                f'render;dur={render * 1000:.2f}',
+                f'app;dur={app * 1000:.2f}',
+                f'total;dur={total * 1000:.2f}',
+            ])
+
+        viewset, action = request.metrics_view
+        if viewset:
+            user = getattr(request, 'user', None)
+            record_metrics({
+                'time': time(),
+                'method': request.method,
+                'path': request.path,
+                'viewset': viewset,
+                'action': action,
+                'hospital': getattr(user, 'hospital_id', None),
+                'status': response.status_code,
+                'duration': round(total * 1000, 3),
+                'queries': timer.queries,
+                'db_time': round(timer.db_time * 1000, 3),
+                'count_queries': timer.count_queries,
+                'count_time': round(timer.count_time * 1000, 3),
+                'serialize_time': round(serialize.time * 1000, 3),
+                'render_time': round(render * 1000, 3),
+                'bytes': None if response.streaming else len(response.content), #streamed exports have no size up front
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        #DRF's as_view() exposes the viewset class and its method -> action map
+        cls = getattr(view_func, 'cls', None)
+        if cls is not None:
+            actions = getattr(view_func, 'actions', None) or {}
+            request.metrics_view = (cls.__name__, actions.get(request.method.lower(), request.method.lower()))
+
+    def process_template_response(self, request, response):
+        #DRF responses are rendered (encoded to JSON/CSV) right after this hook
+        start = perf_counter()
+        def rendered(response):
+            request.metrics_render = perf_counter() - start
+        response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0011_rename_timestamp_otp_generated_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Model')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Count')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+            ],
+            options={
+                'unique_together': {('model', 'hospital')},
+            },
+        ),
+    ]
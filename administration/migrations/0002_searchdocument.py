@@ -0,0 +1,64 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+FTS_TABLE = 'administration_searchdocument_fts'
+
+SQLITE_FTS = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(content, content='administration_searchdocument', content_rowid='id')",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON administration_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON administration_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON administration_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+MYSQL_FULLTEXT = [
+    "ALTER TABLE administration_searchdocument ADD FULLTEXT INDEX administration_searchdocument_ft (content)",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_FTS, 'mysql': MYSQL_FULLTEXT}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == 'mysql':
+        schema_editor.execute("ALTER TABLE administration_searchdocument DROP INDEX administration_searchdocument_ft")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_rename_timestamp_otp_generated_time'),
+        ('administration', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Model')),
+                ('object_id', models.BigIntegerField(verbose_name='Object ID')),
+                ('content', models.TextField(verbose_name='Content')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+            ],
+            options={
+                'unique_together': {('model', 'object_id')},
+                'index_together': {('model', 'hospital')},
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
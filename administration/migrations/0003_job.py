@@ -0,0 +1,35 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_rename_timestamp_otp_generated_time'),
+        ('administration', '0002_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=100, verbose_name='Task')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Key')),
+                ('payload', models.JSONField(default=dict, verbose_name='Payload')),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='queued', max_length=7, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('run_at', models.DateTimeField(verbose_name='Run At')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Locked Until')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last Error')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('last_modified', models.DateTimeField(auto_now=True, verbose_name='Last Modified')),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+            ],
+            options={
+                'index_together': {('status', 'run_at')},
+            },
+        ),
+    ]
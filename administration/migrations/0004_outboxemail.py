@@ -0,0 +1,40 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('administration', '0003_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.TextField(verbose_name='Subject')),
+                ('body', models.TextField(verbose_name='Body')),
+                ('from_email', models.CharField(max_length=255, verbose_name='From')),
+                ('to', models.JSONField(default=list, verbose_name='To')),
+                ('cc', models.JSONField(default=list, verbose_name='CC')),
+                ('bcc', models.JSONField(default=list, verbose_name='BCC')),
+                ('reply_to', models.JSONField(default=list, verbose_name='Reply To')),
+                ('headers', models.JSONField(default=dict, verbose_name='Headers')),
+                ('alternatives', models.JSONField(default=list, verbose_name='Alternatives')),
+                ('attachments', models.JSONField(default=list, verbose_name='Attachments')),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('sending', 'sending'), ('sent', 'sent'), ('failed', 'failed')], default='queued', max_length=7, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('send_after', models.DateTimeField(verbose_name='Send After')),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=32, verbose_name='Claimed By')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Locked Until')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last Error')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='Sent')),
+            ],
+            options={
+                'index_together': {('claimed_by', 'status'), ('status', 'send_after')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    call_command('createcachetable', database = schema_editor.connection.alias) #only for DatabaseCache backends, skips existing tables
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('administration', '0004_outboxemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_daily_appointments'),
+        ('administration', '0005_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Version')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+            ],
+            options={
+                'unique_together': {('name', 'hospital')},
+            },
+        ),
+    ]
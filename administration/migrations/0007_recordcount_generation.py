@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('administration', '0006_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordcount',
+            name='generation',
+            field=models.BigIntegerField(default=0, verbose_name='Generation'),
+        ),
+    ]
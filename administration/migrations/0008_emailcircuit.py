@@ -0,0 +1,21 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('administration', '0007_recordcount_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailCircuit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('failures', models.IntegerField(default=0, verbose_name='Failures')),
+                ('open_until', models.DateTimeField(blank=True, null=True, verbose_name='Open Until')),
+            ],
+        ),
+    ]
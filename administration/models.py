@@ -1 +1,107 @@
 from django.db import models
+from django.utils.translation import gettext_lazy as _
+from accounts.models import Hospital
+
+#--------------------------------------------------------------------------------------
+class RecordCount(models.Model):
+    model = models.CharField(verbose_name = _('Model'), max_length = 100) #app_label.ModelName
+    count = models.BigIntegerField(verbose_name = _('Count'), default = 0)
+    generation = models.BigIntegerField(verbose_name = _('Generation'), default = 0) #bumped by every write, keys the cached filtered counts
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE)
+
+    class Meta:
+        unique_together = ['model', 'hospital']
+
+    def __str__(self):
+        return f"{self.model}: {self.count}"
+#--------------------------------------------------------------------------------------
+class SearchDocument(models.Model):
+    model = models.CharField(verbose_name = _('Model'), max_length = 100) #app_label.ModelName
+    object_id = models.BigIntegerField(verbose_name = _('Object ID'))
+    content = models.TextField(verbose_name = _('Content')) #full-text indexed by the search backend
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE)
+
+    class Meta:
+        unique_together = ['model', 'object_id']
+        index_together = ['model', 'hospital']
+
+    def __str__(self):
+        return f"{self.model}({self.object_id})"
+#--------------------------------------------------------------------------------------
+job_status_choices = (
+    ('queued', 'queued'),
+    ('running', 'running'),
+    ('done', 'done'),
+    ('failed', 'failed')
+)
+
+class Job(models.Model):
+    task = models.CharField(verbose_name = _('Task'), max_length = 100) #name in administration.jobs.TASKS
+    key = models.CharField(verbose_name = _('Key'), max_length = 255, unique = True) #enqueueing the same key again reuses the job
+    payload = models.JSONField(verbose_name = _('Payload'), default = dict) #keyword arguments of the task
+    status = models.CharField(verbose_name = _('Status'), max_length = 7, choices = job_status_choices, default = 'queued')
+    attempts = models.PositiveIntegerField(verbose_name = _('Attempts'), default = 0)
+    run_at = models.DateTimeField(verbose_name = _('Run At')) #next attempt, pushed back after every failure
+    locked_until = models.DateTimeField(verbose_name = _('Locked Until'), blank = True, null = True) #lease of the worker running it
+    last_error = models.TextField(verbose_name = _('Last Error'), blank = True, default = '')
+    created = models.DateTimeField(verbose_name = _('Created'), auto_now_add = True)
+    last_modified = models.DateTimeField(verbose_name = _('Last Modified'), auto_now = True)
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
+
+    class Meta:
+        index_together = ['status', 'run_at']
+
+    def __str__(self):
+        return f"{self.task}({self.key}): {self.status}"
+#--------------------------------------------------------------------------------------
+email_status_choices = (
+    ('queued', 'queued'),
+    ('sending', 'sending'),
+    ('sent', 'sent'),
+    ('failed', 'failed')
+)
+
+class OutboxEmail(models.Model):
+    subject = models.TextField(verbose_name = _('Subject'))
+    body = models.TextField(verbose_name = _('Body'))
+    from_email = models.CharField(verbose_name = _('From'), max_length = 255)
+    to = models.JSONField(verbose_name = _('To'), default = list)
+    cc = models.JSONField(verbose_name = _('CC'), default = list)
+    bcc = models.JSONField(verbose_name = _('BCC'), default = list)
+    reply_to = models.JSONField(verbose_name = _('Reply To'), default = list)
+    headers = models.JSONField(verbose_name = _('Headers'), default = dict)
+    alternatives = models.JSONField(verbose_name = _('Alternatives'), default = list) #[content, mimetype]
+    attachments = models.JSONField(verbose_name = _('Attachments'), default = list) #[filename, base64 content, mimetype]
+    status = models.CharField(verbose_name = _('Status'), max_length = 7, choices = email_status_choices, default = 'queued')
+    attempts = models.PositiveIntegerField(verbose_name = _('Attempts'), default = 0)
+    send_after = models.DateTimeField(verbose_name = _('Send After')) #pushed back after every failed attempt
+    claimed_by = models.CharField(verbose_name = _('Claimed By'), max_length = 32, blank = True, default = '') #batch of the sender holding it
+    locked_until = models.DateTimeField(verbose_name = _('Locked Until'), blank = True, null = True)
+    last_error = models.TextField(verbose_name = _('Last Error'), blank = True, default = '')
+    created = models.DateTimeField(verbose_name = _('Created'), auto_now_add = True)
+    sent = models.DateTimeField(verbose_name = _('Sent'), blank = True, null = True)
+
+    class Meta:
+        index_together = [['status', 'send_after'], ['claimed_by', 'status']]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}: {self.status}"
+#--------------------------------------------------------------------------------------
+class EmailCircuit(models.Model):
+    #the single row (pk 1) of the outbox circuit breaker, shared by every sender
+    failures = models.IntegerField(verbose_name = _('Failures'), default = 0) #connection failures in a row
+    open_until = models.DateTimeField(verbose_name = _('Open Until'), blank = True, null = True) #nothing is sent before this
+
+    def __str__(self):
+        return f"{self.failures} failures, open until {self.open_until}"
+#--------------------------------------------------------------------------------------
+class DataVersion(models.Model):
+    name = models.CharField(verbose_name = _('Name'), max_length = 100) #what is versioned, e.g. app_label.ModelName
+    version = models.BigIntegerField(verbose_name = _('Version'), default = 0)
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE)
+
+    class Meta:
+        unique_together = ['name', 'hospital']
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
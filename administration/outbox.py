@@ -0,0 +1,152 @@
+import smtplib
+from base64 import b64decode, b64encode
+from datetime import timedelta
+from time import monotonic
+from uuid import uuid4
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import F, Q
+from django.utils import timezone
+from administration.jobs import retry_delay
+from administration.models import EmailCircuit, OutboxEmail
+
+#-----------------------------------QUEUE---------------------------------------------------
+class OutboxBackend(BaseEmailBackend):
+    #EMAIL_BACKEND: send_mail()/EmailMessage.send() only insert the messages, send_outbox() delivers them later
+    def send_messages(self, email_messages):
+        email_messages = [message for message in email_messages if message.recipients()]
+        try:
+            OutboxEmail.objects.bulk_create([outbox_email(message) for message in email_messages])
+        except Exception:
+            if not self.fail_silently: raise
+            return 0
+        return len(email_messages)
+
+def attachment_content(content):
+    return b64encode(content if isinstance(content, bytes) else content.encode()).decode()
+
+def outbox_email(message):
+    return OutboxEmail(subject = message.subject, body = message.body, from_email = message.from_email, to = list(message.to),
+        cc = list(message.cc), bcc = list(message.bcc), reply_to = list(message.reply_to), headers = dict(message.extra_headers),
+        alternatives = [list(alternative) for alternative in getattr(message, 'alternatives', [])],
+        attachments = [[filename, attachment_content(content), mimetype] for filename, content, mimetype in message.attachments],
+        send_after = timezone.now())
+
+def email_message(email, connection):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, email.to, email.bcc, connection = connection,
+                                     headers = email.headers, cc = email.cc, reply_to = email.reply_to)
+    for content, mimetype in email.alternatives:
+        message.attach_alternative(content, mimetype)
+    for filename, content, mimetype in email.attachments:
+        message.attach(filename, b64decode(content), mimetype)
+    return message
+
+#-----------------------------------CIRCUIT BREAKER---------------------------------------------------
+#shared through the EmailCircuit row by every sender: after EMAIL_CIRCUIT_FAILURES connection failures in a row, nothing
+#is sent for EMAIL_CIRCUIT_COOLDOWN seconds; the failures are kept, so the next batch after that decides whether it
+#closes again or opens for another cooldown
+def circuit():
+    EmailCircuit.objects.bulk_create([EmailCircuit(pk = 1)], ignore_conflicts = True)
+    return EmailCircuit.objects.filter(pk = 1)
+
+def circuit_open():
+    return EmailCircuit.objects.filter(pk = 1, open_until__gt = timezone.now()).exists()
+
+def connection_failed():
+    row = circuit()
+    row.update(failures = F('failures') + 1) #counted by the database, senders failing together do not overwrite each other
+    row.filter(failures__gte = settings.EMAIL_CIRCUIT_FAILURES).update(
+        open_until = timezone.now() + timedelta(seconds = settings.EMAIL_CIRCUIT_COOLDOWN))
+
+def connection_succeeded():
+    EmailCircuit.objects.filter(pk = 1).update(failures = 0, open_until = None)
+
+#-----------------------------------SENDER---------------------------------------------------
+def claim_emails(batch_size):
+    #due messages (and ones a crashed sender left behind) are claimed with one conditional UPDATE under a batch token
+    now = timezone.now()
+    due = Q(status = 'queued', send_after__lte = now) | Q(status = 'sending', locked_until__lt = now)
+    ids = list(OutboxEmail.objects.filter(due).order_by('send_after').values_list('id', flat = True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid4().hex
+    OutboxEmail.objects.filter(due, pk__in = ids).update(status = 'sending', claimed_by = token,
+                                                         locked_until = now + timedelta(seconds = settings.EMAIL_OUTBOX_LEASE))
+    return list(OutboxEmail.objects.filter(claimed_by = token, status = 'sending').order_by('send_after'))
+
+def renew_lease(token):
+    #keeps a slow batch claimed; returns the ids still held, a sender stalled past its lease may have lost some
+    OutboxEmail.objects.filter(claimed_by = token, status = 'sending').update(
+        locked_until = timezone.now() + timedelta(seconds = settings.EMAIL_OUTBOX_LEASE))
+    return set(OutboxEmail.objects.filter(claimed_by = token, status = 'sending').values_list('id', flat = True))
+
+def email_sent(email):
+    #right after delivery, so a crash later in the batch does not send it again
+    OutboxEmail.objects.filter(pk = email.pk, claimed_by = email.claimed_by).update(status = 'sent', sent = timezone.now(), claimed_by = '',
+                                                                                   locked_until = None)
+
+def email_failed(email, error):
+    attempts = email.attempts + 1
+    failed = attempts >= settings.EMAIL_MAX_ATTEMPTS
+    send_after = timezone.now() + (timedelta() if failed else retry_delay(attempts, settings.EMAIL_RETRY_BACKOFF, settings.EMAIL_RETRY_BACKOFF_MAX))
+    OutboxEmail.objects.filter(pk = email.pk, claimed_by = email.claimed_by).update(status = 'failed' if failed else 'queued', attempts = attempts, send_after = send_after,
+                                                     claimed_by = '', locked_until = None, last_error = repr(error))
+
+def release_emails(emails, error):
+    #the server, not the message, failed: back to the queue without using up an attempt
+    OutboxEmail.objects.filter(pk__in = [email.pk for email in emails], claimed_by__in = {email.claimed_by for email in emails}).update(
+        status = 'queued', claimed_by = '', locked_until = None, last_error = repr(error))
+
+def send_outbox(batch_size = None):
+    #one batch over a single connection of EMAIL_OUTBOX_BACKEND; returns (sent, failed), (0, 0) while the circuit is open
+    if circuit_open():
+        return 0, 0
+    emails = claim_emails(batch_size or settings.EMAIL_OUTBOX_BATCH)
+    if not emails:
+        return 0, 0
+    connection = get_connection(settings.EMAIL_OUTBOX_BACKEND, fail_silently = False)
+    try:
+        connection.open()
+    except Exception as e:
+        connection_failed()
+        release_emails(emails, e)
+        return 0, 0
+    sent = 0
+    failed = 0
+    held = {email.pk for email in emails}
+    renew_at = monotonic() + settings.EMAIL_OUTBOX_LEASE / 2
+    try:
+        for index, email in enumerate(emails):
+            if monotonic() >= renew_at:
+                held = renew_lease(email.claimed_by)
+                renew_at = monotonic() + settings.EMAIL_OUTBOX_LEASE / 2
+            if email.pk not in held: #claimed again by another sender
+                continue
+            try:
+                connection.send_messages([email_message(email, connection)])
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError) as e:
+                connection_failed()
+                release_emails(emails[index:], e)
+                break
+            except smtplib.SMTPException as e: #refused recipient/sender or data: only this message is retried
+                email_failed(email, e)
+                failed += 1
+            except OSError as e: #socket level, the connection is gone
+                connection_failed()
+                release_emails(emails[index:], e)
+                break
+            except Exception as e:
+                email_failed(email, e)
+                failed += 1
+            else:
+                email_sent(email)
+                sent += 1
+        else:
+            connection_succeeded()
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return sent, failed
@@ -0,0 +1,189 @@
+import re
+from uuid import uuid4
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from accounts.models import Hospital
+from administration.jobs import enqueue
+from administration.models import SearchDocument
+from administration.versions import bump_data_version, data_version
+
+FTS_TABLE = 'administration_searchdocument_fts'
+INDEX_BUILT = 'administration.search_index' #DataVersion name, non-zero once a hospital's documents are complete
+BUILT_HOSPITALS = set() #hospitals this process has seen built, an index is never emptied again
+
+#-----------------------------------DOCUMENTS---------------------------------------------------
+def medicine_names(medicines):
+    return [medicine.get('name', '') for medicine in medicines or [] if isinstance(medicine, dict)]
+
+def patient_document(patient):
+    return [patient.id, patient.name, patient.email, patient.mobile, patient.dob, patient.get_gender_display()]
+
+def account_document(account):
+    return [account.id, account.name, account.email, account.mobile, account.roles, account.department]
+
+def appointment_document(appointment):
+    return [appointment.id, appointment.patient, appointment.doctor, appointment.department]
+
+def medicine_document(medicine):
+    return [medicine.id, medicine.name, medicine.used_for, medicine.quantity, medicine.price, medicine.discount_percent]
+
+def bill_document(bill):
+    details = bill.details if isinstance(bill.details, dict) else {}
+    return [bill.id, bill.total_price] + medicine_names(details.get('medicines'))
+
+def diagnosis_document(diagnosis):
+    return [diagnosis.id, diagnosis.diagnosis, diagnosis.symptoms] + medicine_names(diagnosis.medicine)
+
+#label -> (document builder, relations the builder reads)
+INDEXED_MODELS = {
+    'registration.Patient': (patient_document, []),
+    'accounts.Account': (account_document, ['roles', 'department']),
+    'registration.Appointment': (appointment_document, ['patient', 'doctor', 'department']),
+    'dispensary.Medicine': (medicine_document, []),
+    'dispensary.Bill': (bill_document, []),
+    'doctor.Diagnosis': (diagnosis_document, []),
+}
+
+#label -> [(indexed label, fk)] documents that embed the name of this model
+DEPENDENT_DOCUMENTS = {
+    'registration.Patient': [('registration.Appointment', 'patient')],
+    'accounts.Account': [('registration.Appointment', 'doctor')],
+    'accounts.Department': [('registration.Appointment', 'department'), ('accounts.Account', 'department')],
+    'accounts.Roles': [('accounts.Account', 'roles')],
+}
+
+def is_indexed(Model):
+    return Model._meta.label in INDEXED_MODELS
+
+def build_content(instance):
+    document, related = INDEXED_MODELS[instance._meta.label]
+    return ' '.join(str(value) for value in document(instance) if value not in (None, ''))
+
+def tokenize(search_value):
+    return re.findall(r'\w+', search_value.lower())
+
+#-----------------------------------BACKENDS---------------------------------------------------
+class BasicBackend:
+    #portable fallback: one LIKE over the single content column instead of an OR across every column
+    def match(self, documents, tokens):
+        for token in tokens:
+            documents = documents.filter(content__icontains = token)
+        return documents
+
+class SQLiteFTS5Backend:
+    #external-content FTS5 table kept in sync by triggers (administration migration 0002)
+    def match(self, documents, tokens):
+        expression = ' '.join('"' + token.replace('"', '""') + '"*' for token in tokens)
+        return documents.filter(id__in = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]))
+
+class MySQLFullTextBackend:
+    #FULLTEXT index on content (administration migration 0002), boolean mode prefix search; InnoDB leaves out words
+    #shorter than innodb_ft_min_token_size and its default stopwords, so those tokens are matched with LIKE instead
+    STOPWORDS = {'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how', 'i', 'in', 'is', 'it',
+                 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'when', 'where', 'who', 'will', 'with', 'und', 'www'}
+
+    def is_indexed_token(self, token):
+        return len(token) >= settings.SEARCH_MYSQL_MIN_TOKEN_SIZE and token not in self.STOPWORDS
+
+    def match(self, documents, tokens):
+        indexed = [token for token in tokens if self.is_indexed_token(token)]
+        if indexed:
+            expression = ' '.join('+' + token + '*' for token in indexed)
+            #unqualified column: the queryset is used as a subquery, where Django re-aliases the table
+            documents = documents.extra(where = ['MATCH (content) AGAINST (%s IN BOOLEAN MODE)'], params = [expression])
+        return BasicBackend().match(documents, [token for token in tokens if not self.is_indexed_token(token)])
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'mysql': MySQLFullTextBackend,
+}
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+        if backend_path:
+            _backend = import_string(backend_path)()
+        else:
+            _backend = VENDOR_BACKENDS.get(connection.vendor, BasicBackend)()
+    return _backend
+
+def index_built(hospital_id):
+    #rows that existed before the index are only in it after rebuild_index(), new hospitals are indexed from the start
+    if hospital_id not in BUILT_HOSPITALS and data_version(INDEX_BUILT, hospital_id):
+        BUILT_HOSPITALS.add(hospital_id)
+    return hospital_id in BUILT_HOSPITALS
+
+def mark_index_built(hospital_id):
+    bump_data_version(INDEX_BUILT, hospital_id)
+
+def index_condition(Model, hospital, search_value):
+    #Q on Model.id answered by the search index, None if the value has nothing to search for or the index is not built yet
+    tokens = tokenize(search_value)
+    if not tokens or not index_built(getattr(hospital, 'pk', hospital)): return None
+    documents = SearchDocument.objects.filter(model = Model._meta.label, hospital = hospital)
+    return Q(id__in = get_backend().match(documents, tokens).values('object_id'))
+
+#-----------------------------------INDEXING---------------------------------------------------
+def index_instance(instance):
+    #returns True when the stored document changed
+    if not instance.hospital_id: return False
+    content = build_content(instance)
+    updated = SearchDocument.objects.filter(model = instance._meta.label, object_id = instance.pk).exclude(content = content)
+    if updated.update(content = content, hospital_id = instance.hospital_id):
+        return True
+    document, created = SearchDocument.objects.get_or_create(model = instance._meta.label, object_id = instance.pk, 
+        defaults = {'content': content, 'hospital_id': instance.hospital_id})
+    return created
+
+def unindex_instance(instance):
+    SearchDocument.objects.filter(model = instance._meta.label, object_id = instance.pk).delete()
+
+def dependents(instance):
+    for label, fk in DEPENDENT_DOCUMENTS.get(instance._meta.label, []):
+        yield apps.get_model(label).objects.filter(**{fk : instance}).select_related(*INDEXED_MODELS[label][1])
+
+def reindex_dependents(instance):
+    for queryset in dependents(instance):
+        for dependent in queryset.iterator(chunk_size = 500):
+            index_instance(dependent)
+
+def reindex_dependents_of(label, pk):
+    #background job (administration.jobs): the instance is read when the job runs, so it indexes the latest name
+    instance = apps.get_model(label).objects.filter(pk = pk).first()
+    if instance is not None:
+        reindex_dependents(instance)
+
+def schedule_reindex(instance):
+    #a handful of documents are reindexed in the request, a large department or a busy doctor in the job queue
+    if sum(queryset.count() for queryset in dependents(instance)) <= settings.SEARCH_REINDEX_INLINE:
+        reindex_dependents(instance)
+    else: #a new key per rename: a job already running may have read the previous name
+        enqueue('reindex_dependents', f"reindex:{instance._meta.label}:{instance.pk}:{uuid4().hex}",
+                {'label': instance._meta.label, 'pk': instance.pk}, hospital = instance.hospital)
+
+def rebuild_index(hospital_ids = None, batch_size = 1000):
+    for label, (document, related) in INDEXED_MODELS.items():
+        Model = apps.get_model(label)
+        documents = SearchDocument.objects.filter(model = label)
+        objects = Model.objects.filter(hospital__isnull = False).select_related(*related)
+        if hospital_ids is not None:
+            documents = documents.filter(hospital__id__in = hospital_ids)
+            objects = objects.filter(hospital__id__in = hospital_ids)
+        documents.delete()
+        batch = []
+        for instance in objects.iterator(chunk_size = batch_size):
+            batch.append(SearchDocument(model = label, object_id = instance.pk, content = build_content(instance), 
+                hospital_id = instance.hospital_id))
+            if len(batch) >= batch_size:
+                SearchDocument.objects.bulk_create(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+    for hospital_id in Hospital.objects.values_list('id', flat = True) if hospital_ids is None else hospital_ids:
+        mark_index_built(hospital_id)
@@ -3,25 +3,74 @@ from rest_framework import serializers
 from accounts.models import Account, Department, Roles
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.password_validation import validate_password
+from administration.middleware import serializing
+#-----------------------------------COMMON---------------------------------------------------
+
+class SparseFieldsMixin:
+    #Serializer(..., fields = [...]) renders only those fields, fields = None renders all of them
+    def __init__(self, *args, **kwargs):
+        self.sparse_fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.sparse_fields is not None:
+            for name in list(fields):
+                if name not in self.sparse_fields:
+                    fields.pop(name)
+        return fields
+
+
+class ReadSerializerMixin:
+    #read-only rendering of a write serializer: related_fields become StringRelatedField once per serializer
+    #(get_fields), not on every to_representation() call, so a many = True list binds its fields a single time
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.related_fields:
+            if name in fields:
+                fields[name] = serializers.StringRelatedField(read_only = True)
+        return fields
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        #ListSerializer.many_init with TimedListSerializer as the list class
+        list_kwargs = {key: kwargs.pop(key) for key in ['allow_empty', 'max_length', 'min_length'] if key in kwargs}
+        list_kwargs['child'] = cls(*args, **kwargs)
+        list_kwargs.update({key: value for key, value in kwargs.items() if key in serializers.LIST_SERIALIZER_KWARGS})
+        return TimedListSerializer(*args, **list_kwargs)
+
+    def to_representation(self, instance):
+        with serializing(): #'serialize' entry of Server-Timing and the request metrics
+            return serializers.Serializer.to_representation(self, instance) #skips the write serializer's per-row override
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    #times a whole many = True list once instead of row by row
+    def to_representation(self, data):
+        with serializing():
+            return super().to_representation(data)
+
+
 #-----------------------------------DEPARTMENT---------------------------------------------------
 
 class DepartmentSerializer(serializers.ModelSerializer):
+    related_fields = ['hospital']
     date_created = serializers.DateTimeField(required=False, read_only=True)
     date_modified = serializers.DateTimeField(required=False, read_only=True)
     #date_modified = serializers.DateTimeField(format = settings.DATETIME_FORMAT, required=False, read_only=True)
     
     class Meta:
         model = Department
-        fields = ['id', 'name', 'fees', 'date_created', 'date_modified', 'hospital']
+        fields = ['id', 'name', 'fees', 'daily_appointments', 'date_created', 'date_modified', 'hospital']
         extra_kwargs = {
             'name': {'required': True},
             'fees': {'required': True},            
+            'daily_appointments': {'required': False},
             'hospital': {'required': False, 'read_only': True}
         }
 
     def to_representation(self, instance):
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance) 
+        return DepartmentReadSerializer(context = self.context).to_representation(instance)
 
     def validate_name(self, value):
         name = value.lower()
@@ -36,6 +85,10 @@ class DepartmentSerializer(serializers.ModelSerializer):
         return validated_data
 
 
+class DepartmentReadSerializer(ReadSerializerMixin, DepartmentSerializer):
+    pass
+
+
 class DepartmentDropDownSerializer(serializers.ModelSerializer):
     class Meta:
         model = Department
@@ -45,6 +98,7 @@ class DepartmentDropDownSerializer(serializers.ModelSerializer):
 #--------------------------------------ROLES------------------------------------------------
 
 class RolesSerializer(serializers.ModelSerializer):
+    related_fields = ['hospital']
     date_created = serializers.DateTimeField(required=False, read_only=True)
     date_modified = serializers.DateTimeField(required=False, read_only=True)
     
@@ -57,8 +111,7 @@ class RolesSerializer(serializers.ModelSerializer):
         }
 
     def to_representation(self, instance):
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance) 
+        return RolesReadSerializer(context = self.context).to_representation(instance)
 
     def validate_name(self, value):
         name = value.lower()
@@ -73,6 +126,10 @@ class RolesSerializer(serializers.ModelSerializer):
         return validated_data
 
 
+class RolesReadSerializer(ReadSerializerMixin, RolesSerializer):
+    pass
+
+
 class RolesDropDownSerializer(serializers.ModelSerializer):
     class Meta:
         model = Roles
@@ -82,7 +139,8 @@ class RolesDropDownSerializer(serializers.ModelSerializer):
 
 #--------------------------------------ACCOUNT STAFF------------------------------------------------
 
-class AccountSerializer(serializers.ModelSerializer):
+class AccountSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    related_fields = ['roles', 'department', 'hospital']
     email = serializers.EmailField(required = True)
     last_login = serializers.DateTimeField(required=False, read_only=True)
     date_joined = serializers.DateTimeField(required=False, read_only=True)
@@ -101,10 +159,7 @@ class AccountSerializer(serializers.ModelSerializer):
         }
 
     def to_representation(self, instance):
-        self.fields['roles'] =  serializers.StringRelatedField(read_only = True)
-        self.fields['department'] =  serializers.StringRelatedField(read_only = True)
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+        return AccountReadSerializer(context = self.context, fields = self.sparse_fields).to_representation(instance)
         
 
     def validate_email(self, value):
@@ -141,6 +196,10 @@ class AccountSerializer(serializers.ModelSerializer):
         return account
 
 
+class AccountReadSerializer(ReadSerializerMixin, AccountSerializer):
+    pass
+
+
 class DoctorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Account 
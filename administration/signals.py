@@ -0,0 +1,31 @@
+from administration.counts import change_total
+from administration.search import DEPENDENT_DOCUMENTS, index_instance, is_indexed, mark_index_built, schedule_reindex, unindex_instance
+
+
+def record_saved(sender, instance, created, **kwargs):
+    if not instance.hospital_id: return
+    change_total(sender, instance.hospital_id, 1 if created else 0)
+
+def record_deleted(sender, instance, **kwargs):
+    if not instance.hospital_id: return
+    change_total(sender, instance.hospital_id, -1)
+
+def search_saving(sender, instance, update_fields = None, **kwargs):
+    #other documents embed only the name (str()) of a patient, staff member, department or role
+    if update_fields is not None and 'name' not in update_fields:
+        instance._search_name = instance.name
+        return
+    instance._search_name = sender.objects.filter(pk = instance.pk).values_list('name', flat = True).first() if instance.pk else None
+
+def search_saved(sender, instance, created, **kwargs):
+    if is_indexed(sender):
+        index_instance(instance)
+    if not created and sender._meta.label in DEPENDENT_DOCUMENTS and getattr(instance, '_search_name', None) != instance.name:
+        schedule_reindex(instance) #e.g. a renamed patient is still found through its appointments
+
+def search_deleted(sender, instance, **kwargs):
+    unindex_instance(instance)
+
+def hospital_saved(sender, instance, created, **kwargs):
+    if created: #nothing to backfill, every record of the hospital is indexed when saved
+        mark_index_built(instance.pk)
@@ -1,3 +1,195 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase, override_settings
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from accounts.models import Account, Department, Hospital, Roles
+from administration.counts import cached_count, cap_counts, count_generation, total_count
+from administration.models import DataVersion, EmailCircuit, RecordCount, SearchDocument
+from administration.outbox import circuit_open, connection_failed, connection_succeeded
+from administration.search import BUILT_HOSPITALS, INDEX_BUILT, MySQLFullTextBackend, rebuild_index
+from administration.values import values_data
+from administration.views import get_search_condition, select_related_fields
+from dispensary.models import Bill, Medicine, Transaction, payment_choices
+from dispensary.serializers import MedicineReadSerializer, TransactionReadSerializer
+from registration.models import Appointment, Patient
+from registration.serializers import AppointmentReadSerializer, PatientReadSerializer
 
-# Create your tests here.
+
+class HospitalRecordsTestCase(TestCase):
+    #one hospital with a department, a doctor and ROWS appointments, every third one without a doctor
+    ROWS = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name = 'Test Hospital')
+        cls.department = Department.objects.create(name = 'cardiology', hospital = cls.hospital)
+        cls.doctor = Account.objects.create_user('doctor@hospital.test', 'Test Doctor', 'password', hospital = cls.hospital,
+                     department = cls.department, roles = Roles.objects.create(name = 'doctor', hospital = cls.hospital))
+        cls.patients = [Patient.objects.create(email = f"patient{index}@hospital.test", mobile = f"9{index:09d}", name = f"patient {index}",
+                        dob = date(1990, 1, 1), gender = 'mfo'[index % 3], hospital = cls.hospital) for index in range(10)]
+        Appointment.objects.bulk_create([Appointment(appointment_date = date.today() + timedelta(days = index % 7), present = bool(index % 2),
+            patient = cls.patients[index % len(cls.patients)], doctor = None if index % 3 == 0 else cls.doctor, department = cls.department,
+            hospital = cls.hospital) for index in range(cls.ROWS)])
+
+
+class ReadSerializerTests(HospitalRecordsTestCase):
+    #ReadSerializerMixin.get_fields binds the StringRelatedFields once per serializer, not once per row
+    def page(self, rows):
+        return select_related_fields(Appointment.objects.order_by('id'), AppointmentReadSerializer)[:rows]
+
+    def test_related_fields_bound_once_per_list(self):
+        for rows in [10, self.ROWS]:
+            with mock.patch.object(serializers, 'StringRelatedField', wraps = serializers.StringRelatedField) as bound:
+                data = AppointmentReadSerializer(self.page(rows), many = True).data
+            self.assertEqual(len(data), rows)
+            self.assertEqual(bound.call_count, len(AppointmentReadSerializer.related_fields))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for rows in [10, self.ROWS]:
+            with self.assertNumQueries(1): #the page itself, related names come from its JOINs
+                data = AppointmentReadSerializer(self.page(rows), many = True).data
+            self.assertEqual(len(data), rows)
+
+
+class ValuesDataTests(HospitalRecordsTestCase):
+    #values_data() has to render the list pages field for field like the read serializers, key order included
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        prices = [Decimal('10.00'), Decimal('10.5'), Decimal('7'), Decimal('0.01')] #stored with and without the column's decimal places
+        Medicine.objects.bulk_create([Medicine(name = f"medicine {index}", used_for = 'testing', quantity = index, available = index,
+            price = prices[index % len(prices)], discount_percent = Decimal(index % 3) / 2, hospital = None if index == 0 else cls.hospital)
+            for index in range(12)])
+        appointments = list(Appointment.objects.order_by('id')[:len(payment_choices) * 2])
+        bills = [Bill.objects.create(appointment = appointment, details = {'Doctor Fees': 500, 'medicines': []}, total_price = Decimal('500.00'),
+                 hospital = cls.hospital) for appointment in appointments] #bulk_create() leaves pks unset on some backends
+        Transaction.objects.bulk_create([Transaction(bill = bill, amount = Decimal('500.5') if index % 2 else Decimal('500.00'),
+            payment_mode = payment_choices[index % len(payment_choices)][0], hospital = None if index == 0 else cls.hospital)
+            for index, bill in enumerate(bills)])
+
+    def assertSameRows(self, serializer_class, fields = None):
+        queryset = select_related_fields(serializer_class.Meta.model.objects.order_by('-id'), serializer_class)
+        expected = serializer_class(queryset, many = True, **({} if fields is None else {'fields': fields})).data
+        rows = values_data(queryset, serializer_class, fields = fields)
+        self.assertTrue(rows)
+        self.assertEqual([list(row.items()) for row in rows], [list(row.items()) for row in expected])
+
+    def test_appointments(self):
+        self.assertSameRows(AppointmentReadSerializer) #null doctors, dates, related names
+
+    def test_medicines(self):
+        self.assertSameRows(MedicineReadSerializer) #Decimal places, datetimes, a null hospital
+        self.assertSameRows(MedicineReadSerializer, fields = ['id', 'name', 'price', 'hospital'])
+
+    def test_transactions(self):
+        self.assertSameRows(TransactionReadSerializer) #every payment_mode, Decimal amounts, datetimes
+
+    def test_choice_display(self):
+        self.assertSameRows(PatientReadSerializer) #gender rendered through get_gender_display
+        self.assertSameRows(PatientReadSerializer, fields = ['name', 'gender'])
+
+
+class SearchIndexTests(HospitalRecordsTestCase):
+    #rows saved before the search index existed are found with LIKE until rebuild_index() has filled it
+    COLUMNS = ['id', 'name', 'email', 'mobile', 'dob', 'gender']
+
+    def setUp(self):
+        BUILT_HOSPITALS.clear()
+
+    def search(self, value):
+        condition = get_search_condition(Patient, self.hospital, value, self.COLUMNS, date_columns = ['dob'])
+        return set(Patient.objects.filter(hospital = self.hospital).filter(condition).values_list('name', flat = True))
+
+    def test_new_hospital_is_searched_through_the_index(self):
+        self.assertEqual(self.search('patient7@'), {'patient 7'})
+        self.assertIn(self.hospital.id, BUILT_HOSPITALS)
+
+    def test_unbuilt_index_falls_back_to_like(self):
+        DataVersion.objects.filter(name = INDEX_BUILT).delete()
+        SearchDocument.objects.all().delete() #as after migrating a database that already had rows
+        self.assertEqual(self.search('patient7@'), {'patient 7'})
+        self.assertNotIn(self.hospital.id, BUILT_HOSPITALS)
+        rebuild_index([self.hospital.id])
+        self.assertEqual(self.search('patient7@'), {'patient 7'})
+        self.assertIn(self.hospital.id, BUILT_HOSPITALS)
+
+    def test_mysql_leaves_unindexed_words_to_like(self):
+        #the FULLTEXT MATCH only gets words InnoDB indexes, the rest must not make the search come back empty
+        documents = SearchDocument.objects.filter(model = 'registration.Patient', hospital = self.hospital)
+        short = MySQLFullTextBackend().match(documents, ['9', 'the'])
+        self.assertNotIn('MATCH', str(short.query))
+        self.assertEqual(short.count(), documents.filter(content__icontains = '9').filter(content__icontains = 'the').count())
+        mixed = MySQLFullTextBackend().match(documents, ['patient7', 'of'])
+        self.assertIn('+patient7*', str(mixed.query))
+        self.assertNotIn('+of', str(mixed.query))
+
+
+class RecordCountTests(HospitalRecordsTestCase):
+    def test_counter_row_follows_writes(self):
+        RecordCount.objects.filter(model = 'registration.Patient').delete()
+        self.assertEqual(total_count(Patient, self.hospital), len(self.patients)) #created from COUNT(*)
+        patient = Patient.objects.create(email = 'new@hospital.test', mobile = '8000000000', name = 'new patient', dob = date(1990, 1, 1),
+                                         gender = 'f', hospital = self.hospital)
+        self.assertEqual(total_count(Patient, self.hospital), len(self.patients) + 1)
+        patient.delete()
+        self.assertEqual(total_count(Patient, self.hospital), len(self.patients))
+        self.assertEqual(RecordCount.objects.filter(model = 'registration.Patient').count(), 1)
+
+    def test_writes_bump_the_generation_with_the_total(self):
+        total_count(Patient, self.hospital)
+        generation = count_generation(Patient, self.hospital.id)
+        self.patients[0].save() #an edit changes filtered counts but not the total
+        self.assertEqual(count_generation(Patient, self.hospital.id), generation + 1)
+        self.assertEqual(total_count(Patient, self.hospital), len(self.patients))
+        self.patients[1].delete()
+        self.assertEqual(count_generation(Patient, self.hospital.id), generation + 2)
+        self.assertEqual(total_count(Patient, self.hospital), len(self.patients) - 1)
+
+    @override_settings(COUNT_ESTIMATE_CAP = 50)
+    def test_capped_estimate_keeps_paging(self):
+        appointments = Appointment.objects.filter(hospital = self.hospital)
+        count = cached_count(appointments, self.hospital, estimated = True)
+        self.assertEqual(count, 51) #one row past the cap, not the cap itself
+        context = cap_counts({'recordsTotal': count, 'recordsFiltered': count}, 100, 10)
+        self.assertTrue(context['recordsCapped'])
+        self.assertEqual(context['recordsFiltered'], 120) #a page after the current one
+        context = cap_counts({'recordsTotal': 51, 'recordsFiltered': 7}, 0, 10)
+        self.assertFalse(context['recordsCapped'])
+        self.assertEqual(context['recordsFiltered'], 7)
+
+
+class ServerTimingTests(HospitalRecordsTestCase):
+    #Server-Timing goes to hospital admins (and everyone under DEBUG), the metrics are recorded for every request
+    def list_departments(self, user):
+        client = APIClient()
+        if user:
+            client.force_authenticate(user)
+        return client.get('/administration/api/departments/', {'draw': 1, 'start': 0, 'length': 10})
+
+    def test_only_admins_get_server_timing(self):
+        admin = Account.objects.create_user('admin@hospital.test', 'Test Admin', 'password', hospital = self.hospital,
+                roles = Roles.objects.create(name = 'admin', hospital = self.hospital))
+        self.assertIn('db;dur=', self.list_departments(admin).get('Server-Timing', ''))
+        self.assertNotIn('Server-Timing', self.list_departments(self.doctor))
+        self.assertNotIn('Server-Timing', self.list_departments(None))
+        with override_settings(DEBUG = True):
+            self.assertIn('Server-Timing', self.list_departments(None))
+
+
+class EmailCircuitTests(TestCase):
+    @override_settings(EMAIL_CIRCUIT_FAILURES = 3, EMAIL_CIRCUIT_COOLDOWN = 300)
+    def test_opens_after_failures_in_a_row(self):
+        connection_succeeded() #no row yet
+        for _ in range(2):
+            connection_failed()
+        self.assertFalse(circuit_open())
+        connection_failed()
+        self.assertTrue(circuit_open())
+        self.assertEqual(EmailCircuit.objects.get().failures, 3)
+        connection_succeeded()
+        self.assertFalse(circuit_open())
+        connection_failed()
+        self.assertFalse(circuit_open()) #counting starts over
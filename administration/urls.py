@@ -6,6 +6,7 @@ router = DefaultRouter()
 router.register('api/departments', views.DepartmentView, basename='api_department')
 router.register('api/roles', views.RolesView, basename='api_roles')
 router.register('api/staff', views.StaffView, basename='api_staff')
+router.register('api/metrics', views.RequestMetricsView, basename='api_metrics')
 
 
 urlpatterns = [
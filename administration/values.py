@@ -0,0 +1,87 @@
+from functools import lru_cache
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from administration.middleware import serializing
+
+#-----------------------------------RELATED NAMES---------------------------------------------------
+#str() of the models rendered with StringRelatedField, rebuilt from joined columns (keep in sync with their __str__)
+RELATED_STR = {
+    'accounts.Hospital': (['name'], lambda name: name),
+    'accounts.Roles': (['name'], lambda name: name),
+    'accounts.Department': (['name'], lambda name: name),
+    'accounts.Account': (['name', 'id'], lambda name, id: name + f"({id})"),
+    'registration.Patient': (['name', 'id'], lambda name, id: name + f"({id})"),
+    'registration.Appointment': (['id'], lambda id: str(id)),
+}
+
+#-----------------------------------CONVERTERS---------------------------------------------------
+def decimal_converter(field):
+    #DRF DecimalField output; DB values already carry the column's decimal places, anything else goes through DRF
+    if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) or field.localize:
+        return field.to_representation
+    exponent = -field.decimal_places
+    def convert(value):
+        if value.as_tuple().exponent == exponent:
+            return '{:f}'.format(value)
+        return field.to_representation(value)
+    return convert
+
+def choice_display_converter(field, model_field):
+    #ChoiceField(source = 'get_x_display')
+    choices = dict(model_field.flatchoices)
+    return lambda value: field.to_representation(choices.get(value, value))
+
+def get_column(Model, name, field):
+    #(values_list lookups, converter of those columns) for one readable serializer field
+    if isinstance(field, serializers.StringRelatedField):
+        related = Model._meta.get_field(field.source).related_model
+        parts, to_str = RELATED_STR[related._meta.label]
+        lookups = [field.source] + [field.source + '__' + part for part in parts] #FK column first, None -> None
+        return lookups, lambda value, *values: to_str(*values)
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return [field.source], lambda value: value
+    if '.' in field.source or field.source == '*' or isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer)):
+        raise ValueError(f"Field: {name} cannot be rendered from values()")
+    if field.source.startswith('get_') and field.source.endswith('_display'):
+        model_field = Model._meta.get_field(field.source[len('get_'):-len('_display')])
+        return [model_field.name], choice_display_converter(field, model_field)
+    if isinstance(field, serializers.DecimalField):
+        return [field.source], decimal_converter(field)
+    return [field.source], field.to_representation
+
+@lru_cache(maxsize = None)
+def get_columns(serializer_class, fields = None):
+    #precomputed once per serializer class and field set: values_list() lookups and (name, start, end, converter)
+    serializer = serializer_class(fields = list(fields)) if fields is not None else serializer_class()
+    Model = serializer_class.Meta.model
+    lookups = []
+    columns = []
+    for name, field in serializer.fields.items():
+        if field.write_only: continue
+        field_lookups, convert = get_column(Model, name, field)
+        columns.append((name, len(lookups), len(lookups) + len(field_lookups), convert))
+        lookups += field_lookups
+    return lookups, columns
+
+#-----------------------------------RENDER---------------------------------------------------
+def values_data(data, serializer_class, fields = None):
+    #serializer_class(data, many = True, fields = fields).data from values_list() rows, without model instances
+    if not isinstance(data, QuerySet): #already fetched rows (cursor pages)
+        if fields is None: return serializer_class(data, many = True).data
+        return serializer_class(data, many = True, fields = fields).data
+    lookups, columns = get_columns(serializer_class, None if fields is None else tuple(fields))
+    rows = []
+    with serializing():
+        for row in data.values_list(*lookups):
+            item = {}
+            for name, start, end, convert in columns:
+                value = row[start]
+                if value is None:
+                    item[name] = None
+                elif end - start == 1:
+                    item[name] = convert(value)
+                else:
+                    item[name] = convert(*row[start:end])
+            rows.append(item)
+    return rows
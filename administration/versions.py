@@ -0,0 +1,16 @@
+from django.db.models import F
+from administration.models import DataVersion
+
+#Per-hospital version numbers kept in the database, for in-process copies that must never outlive a write made by
+#another process (doctor.availability, dispensary.autocomplete). The bump runs in the writer's transaction, so the
+#new version becomes visible exactly when the data it stands for does.
+
+def data_version(name, hospital_id):
+    return DataVersion.objects.filter(name = name, hospital_id = hospital_id).values_list('version', flat = True).first() or 0
+
+def bump_data_version(name, hospital_id):
+    #the UPDATE locks the row until commit, so concurrent writers get consecutive versions in commit order
+    DataVersion.objects.bulk_create([DataVersion(name = name, hospital_id = hospital_id)], ignore_conflicts = True)
+    versions = DataVersion.objects.filter(name = name, hospital_id = hospital_id)
+    versions.update(version = F('version') + 1)
+    return versions.values_list('version', flat = True).get()
@@ -1,4 +1,7 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from functools import reduce
+import json
+from django.conf import settings
 from django.shortcuts import redirect, render
 from django.urls import reverse
 from accounts.models import Account, Department, Roles
@@ -7,13 +10,17 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import cache_control
 # from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
-from administration.serializers import AccountSerializer, DepartmentDropDownSerializer, DepartmentSerializer, DoctorSerializer, RolesDropDownSerializer, RolesSerializer, UpdatePasswordSerializer
+from administration.serializers import AccountReadSerializer, AccountSerializer, DepartmentDropDownSerializer, DepartmentReadSerializer, DepartmentSerializer, DoctorSerializer, RolesDropDownSerializer, RolesReadSerializer, RolesSerializer, UpdatePasswordSerializer
 from rest_framework.response import Response
 from rest_framework import status, viewsets
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q
 from accounts.models import Department
+from administration.counts import cap_counts, cached_count, total_count
+from administration.exports import EXPORT_RENDERERS, export_response
+from administration.middleware import get_metrics
+from administration.search import index_condition, is_indexed
 from rest_framework.decorators import action
 
 # Create your views here.
@@ -28,16 +35,93 @@ def get_conditions(search_value, columns, date_columns = [], fk_columns = [], ex
         elif col not in date_columns and col not in exclude: 
             conditions.append(Q(**{col + "__icontains" : search_value}))
     return reduce(lambda x,y : x | y, conditions)
+
+def get_search_condition(Model, hospital, search_value, columns, date_columns = [], fk_columns = [], exclude = []):
+    #indexed models are searched through the full-text index once it is built for the hospital, the rest through get_conditions
+    if not search_value: return None
+    if hospital and is_indexed(Model):
+        search_condition = index_condition(Model, hospital, search_value)
+        if search_condition is not None: return search_condition
+    return get_conditions(search_value, columns, date_columns, fk_columns, exclude)
     
+def get_fields(query_params, serializer_class, defer = []):
+    #?fields=a,b -> only those serializer fields; otherwise all but the deferred (heavy) ones; None -> everything
+    readable = [name for name, field in serializer_class().fields.items() if not field.write_only]
+    requested = query_params.get('fields', '').strip()
+    if requested:
+        fields = [name for name in readable if name in [field.strip() for field in requested.split(',')]]
+    elif defer:
+        fields = [name for name in readable if name not in defer]
+    else:
+        return None
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+def get_only_fields(Model, fields, *extra):
+    #model columns to load for the given serializer fields (queryset.only())
+    concrete = [field.name for field in Model._meta.concrete_fields]
+    return [name for name in concrete if name in fields or name in extra]
+
+def select_related_fields(queryset, serializer_class, fields = None):
+    #JOINs the relations the serializer renders with StringRelatedField (related_fields) instead of a query per row
+    related = [name for name in getattr(serializer_class, 'related_fields', []) if fields is None or name in fields]
+    if not related: return queryset #select_related() without names would follow every foreign key
+    return queryset.select_related(*related)
+
+def encode_cursor(Model, instance, sort_column):
+    field = Model._meta.get_field(sort_column)
+    value = getattr(instance, field.attname)
+    if value is not None:
+        value = field.value_to_string(instance) #full precision string, e.g. datetime with microseconds
+    return urlsafe_b64encode(json.dumps([value, instance.pk]).encode()).decode()
+
+def decode_cursor(cursor):
+    value, pk = json.loads(urlsafe_b64decode(cursor.encode()))
+    return value, pk
+
+def keyset_condition(sort_column, sort_direction, value, pk):
+    #rows that come after (value, pk) in "ORDER BY sort_column, id" (NULLs first in asc, last in desc)
+    if sort_direction == 'desc':
+        if value is None:
+            return Q(**{sort_column + '__isnull' : True, 'id__lt' : pk})
+        return (Q(**{sort_column + '__lt' : value}) | Q(**{sort_column : value, 'id__lt' : pk}) 
+                | Q(**{sort_column + '__isnull' : True}))
+    if value is None:
+        return Q(**{sort_column + '__isnull' : True, 'id__gt' : pk}) | Q(**{sort_column + '__isnull' : False})
+    return Q(**{sort_column + '__gt' : value}) | Q(**{sort_column : value, 'id__gt' : pk})
+
+def keyset_ordering(sort_column, sort_direction):
+    id_order = '-id' if sort_direction == 'desc' else 'id'
+    return [id_order] if sort_column == 'id' else [('-' if sort_direction == 'desc' else '') + sort_column, id_order]
+
+def keyset_rows(queryset, sort_column, sort_direction, batch_size):
+    #every row in keyset order, one query of at most batch_size rows at a time, each continuing after the last row of
+    #the previous one (queryset.iterator() would still buffer the whole result set on MySQL)
+    attname = queryset.model._meta.get_field(sort_column).attname
+    ordering = keyset_ordering(sort_column, sort_direction)
+    batch = list(queryset.order_by(*ordering)[:batch_size])
+    while batch:
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last = batch[-1]
+        batch = list(queryset.filter(keyset_condition(sort_column, sort_direction, getattr(last, attname), last.pk)).order_by(*ordering)[:batch_size])
+
 def pagination_datatable(Model, columns, **kwargs):
     context = {}
-    context['draw'] = int(kwargs.get('draw', None)[0]) #draw counter to handle async 
-    rows_per_page = int(kwargs.get('length', None)[0]) #row length that we select in dropdown
-    start_index = int(kwargs.get('start', None)[0]) #starting index
-    search_value = (kwargs.get('search[value]', '')[0]).strip() #search value
-    sort_column_index = int(kwargs.get('order[0][column]', None)[0]) #which column was sorted
-    sort_direction = (kwargs.get('order[0][dir]', 'asc')[0]).strip() #contains values -> asc/desc
-    sort_column_name = columns[sort_column_index]
+    export = kwargs.get('export', False) #every filtered row in keyset batches, no counts or paging (export_response)
+    cursor = kwargs.get('cursor', None) #keyset pagination, used instead of start when present ('' -> first page)
+    if not export:
+        context['draw'] = int(kwargs.get('draw', None)[0]) #draw counter to handle async 
+        rows_per_page = int(kwargs.get('length', None)[0]) #row length that we select in dropdown
+        if cursor is None:
+            start_index = int(kwargs.get('start', None)[0]) #starting index
+    search_value = (kwargs.get('search[value]', [''])[0]).strip() #search value
+    sort_column_index = int(kwargs.get('order[0][column]', ['0'])[0]) #which column was sorted
+    sort_direction = (kwargs.get('order[0][dir]', ['asc'])[0]).strip() #contains values -> asc/desc
+    sort_column = columns[sort_column_index]
+    sort_column_name = sort_column
     if sort_direction == 'desc': 
         sort_column_name = '-' + sort_column_name # - for descending
     #--------data--------
@@ -48,11 +132,22 @@ def pagination_datatable(Model, columns, **kwargs):
     date_filter = kwargs.get('date_filter',[])
     exclude = kwargs.get('exclude',[])
     date_col_filter = kwargs.get('date_col_filter','')
+    estimated = (kwargs.get('count_mode', ['exact'])[0]).strip() == 'estimated' #bounded counts for very large tables
+    serializer_fields = kwargs.get('serializer_fields', None) #get_fields()
+    serializer_class = kwargs.get('serializer_class', None)
+    if serializer_fields:
+        context['data'] = context['data'].only(*get_only_fields(Model, serializer_fields, sort_column))
+    if serializer_class:
+        context['data'] = select_related_fields(context['data'], serializer_class, serializer_fields)
     if hospital:
         context['data'] = context['data'].filter(hospital = hospital)
-    context['recordsTotal'] = context['data'].count() #Total Record count
+    if export: pass
+    elif hospital:
+        context['recordsTotal'] = total_count(Model, hospital) #Total Record count (maintained counter)
+    else:
+        context['recordsTotal'] = context['data'].count() #Total Record count
 
-    search_condition = get_conditions(search_value, columns, date_columns, fk_columns, exclude)
+    search_condition = get_search_condition(Model, hospital, search_value, columns, date_columns, fk_columns, exclude)
     if search_condition:
         context['data'] = context['data'].filter(search_condition)
     
@@ -64,8 +159,29 @@ def pagination_datatable(Model, columns, **kwargs):
         elif date_filter[1]:
             context['data'] = context['data'].filter(**{date_col_filter + '__lte' : date_filter[1]})
 
-    context['recordsFiltered'] = context['data'].count() #Filtered record count
-    context['data'] = context['data'].order_by(sort_column_name)[start_index : (start_index + rows_per_page)] #One Page Data
+    if export:
+        context['data'] = keyset_rows(context['data'], sort_column, sort_direction, settings.EXPORT_CHUNK_SIZE)
+        return context
+    if not search_condition and not any(date_filter):
+        context['recordsFiltered'] = context['recordsTotal'] #nothing filtered
+    else:
+        context['recordsFiltered'] = cached_count(context['data'], hospital, estimated) #Filtered record count
+        if estimated:
+            cap_counts(context, start_index if cursor is None else None, rows_per_page) #keyset pages go on through next_cursor
+    if cursor is None:
+        context['data'] = context['data'].order_by(sort_column_name)[start_index : (start_index + rows_per_page)] #One Page Data
+        return context
+
+    #--------keyset page--------
+    cursor = cursor[0].strip()
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        context['data'] = context['data'].filter(keyset_condition(sort_column, sort_direction, value, pk))
+    page = list(context['data'].order_by(*keyset_ordering(sort_column, sort_direction))[:rows_per_page + 1]) #one extra row tells if there is a next page
+    context['data'] = page[:rows_per_page]
+    context['next_cursor'] = None
+    if len(page) > rows_per_page:
+        context['next_cursor'] = encode_cursor(Model, context['data'][-1], sort_column)
     return context
 
 #-----------------------------------DEPARTMENT---------------------------------------------------
@@ -82,7 +198,7 @@ class DepartmentView(viewsets.ModelViewSet):
     serializer_class = DepartmentSerializer
     permission_classes = [IsAuthenticated, IsAdministrator]
     
-    def list(self, request):
+    def list(self, request, export = False):
         context = {}
         try:
             columns = ['id', "name", 'fees', 'date_created', "date_modified"]
@@ -93,28 +209,38 @@ class DepartmentView(viewsets.ModelViewSet):
             #------------------
             department_data = pagination_datatable(Department, columns, **request.query_params, 
             hospital = request.user.hospital, date_columns = date_columns, date_filter = date_filter, 
-            date_col_filter = 'date_created')            
+            date_col_filter = 'date_created', serializer_class = DepartmentReadSerializer, export = export)            
             #------------------
-            serializer = DepartmentSerializer(department_data['data'], many = True)
+            if export:
+                return export_response(department_data['data'], DepartmentReadSerializer, request, 'departments')
+            serializer = DepartmentReadSerializer(department_data['data'], many = True)
             context['data'] = serializer.data
             context['draw'] = department_data['draw']
             context['recordsTotal'] = department_data['recordsTotal']
             context['recordsFiltered'] = department_data['recordsFiltered']
+            if 'recordsCapped' in department_data:
+                context['recordsCapped'] = department_data['recordsCapped']
+            if 'next_cursor' in department_data:
+                context['next_cursor'] = department_data['next_cursor']
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'], renderer_classes = EXPORT_RENDERERS)
+    def export(self, request):
+        return self.list(request, export = True)
+
 
     def retrieve(self, request, pk):
         context = {}
         try:
             try:     
-                department_data = self.queryset.get(id = pk, hospital = request.user.hospital)
+                department_data = select_related_fields(self.queryset, DepartmentReadSerializer).get(id = pk, hospital = request.user.hospital)
             except Department.DoesNotExist:
                 context['error'] = {"id": [_(f"ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = DepartmentSerializer(department_data)    
+            serializer = DepartmentReadSerializer(department_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -240,7 +366,7 @@ class RolesView(viewsets.ModelViewSet):
     serializer_class = RolesSerializer
     permission_classes = [IsAuthenticated, IsAdministrator]
     
-    def list(self, request):
+    def list(self, request, export = False):
         context = {}
         try:
             columns = ['id', "name", 'date_created', "date_modified"]
@@ -251,27 +377,37 @@ class RolesView(viewsets.ModelViewSet):
             #------------------
             roles_data = pagination_datatable(Roles, columns, **request.query_params, 
             hospital = request.user.hospital, date_columns = date_columns, date_filter = date_filter,
-            date_col_filter = 'date_created')
+            date_col_filter = 'date_created', serializer_class = RolesReadSerializer, export = export)
             #------------------
-            serializer = RolesSerializer(roles_data['data'], many = True)
+            if export:
+                return export_response(roles_data['data'], RolesReadSerializer, request, 'roles')
+            serializer = RolesReadSerializer(roles_data['data'], many = True)
             context['data'] = serializer.data
             context['draw'] = roles_data['draw']
             context['recordsTotal'] = roles_data['recordsTotal']
             context['recordsFiltered'] = roles_data['recordsFiltered']
+            if 'recordsCapped' in roles_data:
+                context['recordsCapped'] = roles_data['recordsCapped']
+            if 'next_cursor' in roles_data:
+                context['next_cursor'] = roles_data['next_cursor']
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'], renderer_classes = EXPORT_RENDERERS)
+    def export(self, request):
+        return self.list(request, export = True)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:     
-                roles_data = self.queryset.get(id = pk, hospital = request.user.hospital)
+                roles_data = select_related_fields(self.queryset, RolesReadSerializer).get(id = pk, hospital = request.user.hospital)
             except Roles.DoesNotExist:
                 context['error'] = {"id": [_(f"ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = RolesSerializer(roles_data)    
+            serializer = RolesReadSerializer(roles_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -398,7 +534,7 @@ class StaffView(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']        
     permission_classes = [IsAuthenticated, IsAdministrator]
     
-    def list(self, request):
+    def list(self, request, export = False):
         context = {}
         try:
             columns = ['id','name','email',"mobile",'roles','department','last_login','date_joined','is_active']
@@ -408,29 +544,40 @@ class StaffView(viewsets.ModelViewSet):
             date_joined_end = request.query_params.get('date_joined_end','').strip()
             date_filter = [date_joined_start,date_joined_end]
             #------------------
+            fields = get_fields(request.query_params, AccountReadSerializer)
             account_data = pagination_datatable(Account, columns, **request.query_params, 
             hospital = request.user.hospital, date_columns = date_columns, fk_columns = fk_columns, 
-            date_filter = date_filter, date_col_filter = 'date_joined')
+            date_filter = date_filter, date_col_filter = 'date_joined', serializer_fields = fields, serializer_class = AccountReadSerializer, export = export)
             #------------------
-            serializer = AccountSerializer(account_data['data'], many = True)
+            if export:
+                return export_response(account_data['data'], AccountReadSerializer, request, 'staff', fields)
+            serializer = AccountReadSerializer(account_data['data'], many = True, fields = fields)
             context['data'] = serializer.data
             context['draw'] = account_data['draw']
             context['recordsTotal'] = account_data['recordsTotal']
             context['recordsFiltered'] = account_data['recordsFiltered']
+            if 'recordsCapped' in account_data:
+                context['recordsCapped'] = account_data['recordsCapped']
+            if 'next_cursor' in account_data:
+                context['next_cursor'] = account_data['next_cursor']
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'], renderer_classes = EXPORT_RENDERERS)
+    def export(self, request):
+        return self.list(request, export = True)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:     
-                account_data = self.queryset.get(id = pk, hospital = request.user.hospital)
+                account_data = select_related_fields(self.queryset, AccountReadSerializer).get(id = pk, hospital = request.user.hospital)
             except Account.DoesNotExist:
                 context['error'] = {"id": [_(f"ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = AccountSerializer(account_data)    
+            serializer = AccountReadSerializer(account_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -539,6 +686,47 @@ class StaffView(viewsets.ModelViewSet):
         context['message'] = _('Password was not updated!')
         return Response(context, status = status.HTTP_400_BAD_REQUEST) 
 
+#-----------------------------------REQUEST METRICS---------------------------------------------------
+def summarize_metrics(records):
+    #per viewset/action: request count, average and p95 duration, average queries, DB, count, serialize and render time
+    groups = {}
+    for record in records:
+        groups.setdefault((record['viewset'], record['action']), []).append(record)
+    summary = []
+    for (viewset, action), group in groups.items():
+        durations = sorted(record['duration'] for record in group)
+        summary.append({
+            'viewset': viewset,
+            'action': action,
+            'requests': len(group),
+            'avg_duration': round(sum(durations) / len(group), 3),
+            'p95_duration': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            'avg_queries': round(sum(record['queries'] for record in group) / len(group), 2),
+            'avg_db_time': round(sum(record['db_time'] for record in group) / len(group), 3),
+            'avg_count_time': round(sum(record['count_time'] for record in group) / len(group), 3),
+            'avg_serialize_time': round(sum(record['serialize_time'] for record in group) / len(group), 3),
+            'avg_render_time': round(sum(record['render_time'] for record in group) / len(group), 3),
+        })
+    return sorted(summary, key = lambda row: row['avg_duration'], reverse = True)
+
+class RequestMetricsView(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated, IsAdministrator]
+
+    def list(self, request):
+        context = {}
+        try:
+            viewset = request.query_params.get('viewset', '').strip() or None
+            action_name = request.query_params.get('action', '').strip() or None
+            limit = int(request.query_params.get('limit', 100))
+            records = get_metrics(request.user.hospital_id, viewset, action_name) #only this hospital's requests
+            context['summary'] = summarize_metrics(records)
+            context['data'] = records[::-1][:limit] #latest first
+            return Response(context, status = status.HTTP_200_OK)
+        except Exception as e:
+            context['error'] = e
+        context['message'] = _('Request metrics were not retrieved!')
+        return Response(context, status = status.HTTP_400_BAD_REQUEST)
+
 #--------------------------------------------------------------------------------------
 
 '''
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 
 
 class DispensaryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dispensary'
+
+    def ready(self):
+        from dispensary.signals import medicine_deleted, medicine_saved, medicine_saving, release_deleted_diagnosis
+        pre_save.connect(medicine_saving, sender = 'dispensary.Medicine', dispatch_uid = 'medicine_saving')
+        post_save.connect(medicine_saved, sender = 'dispensary.Medicine', dispatch_uid = 'medicine_saved')
+        post_delete.connect(medicine_deleted, sender = 'dispensary.Medicine', dispatch_uid = 'medicine_deleted')
+        pre_delete.connect(release_deleted_diagnosis, sender = 'doctor.Diagnosis', dispatch_uid = 'release_deleted_diagnosis')
@@ -0,0 +1,75 @@
+import re
+from bisect import bisect_left
+from threading import Lock
+from administration.versions import bump_data_version, data_version
+from dispensary.models import Medicine
+
+#Per-hospital prefix index of case-folded medicine names, kept in this process and rebuilt when the hospital's
+#DataVersion (administration.versions) changes; medicines added, renamed or deleted bump it in their transaction, in
+#whichever process. Stock is not part of the index: it changes on every diagnosis and payment, so it is read for the
+#few candidates of each lookup instead.
+VERSION = 'dispensary.autocomplete' #DataVersion name
+INDEXES = {} #hospital id -> (version, names, words)
+INDEX_LOCK = Lock()
+
+#-----------------------------------INDEX---------------------------------------------------
+def index_changed(hospital_id):
+    if hospital_id:
+        bump_data_version(VERSION, hospital_id)
+
+def fold(name):
+    return ' '.join(name.casefold().split())
+
+def build_index(hospital_id):
+    #names: sorted (folded name, id); words: sorted (folded name from its 2nd, 3rd... word on, id)
+    names = []
+    words = []
+    for id, name in Medicine.objects.filter(hospital_id = hospital_id).values_list('id', 'name').iterator():
+        name = fold(name)
+        names.append((name, id))
+        words.extend((name[match.start():], id) for match in re.finditer(r'(?<=\W)\w', name))
+    names.sort()
+    words.sort()
+    return names, words
+
+def medicine_index(hospital_id):
+    version = data_version(VERSION, hospital_id)
+    index = INDEXES.get(hospital_id)
+    if index is None or index[0] != version:
+        with INDEX_LOCK: #one rebuild per process, other requests wait for it
+            index = INDEXES.get(hospital_id)
+            if index is None or index[0] != version:
+                index = (version, *build_index(hospital_id))
+                INDEXES[hospital_id] = index
+    return index[1], index[2]
+
+def prefix_range(entries, prefix):
+    for position in range(bisect_left(entries, (prefix,)), len(entries)):
+        key, id = entries[position]
+        if not key.startswith(prefix):
+            return
+        yield id
+
+def candidates(hospital_id, prefix):
+    #medicines whose name starts with the prefix first, then those with a later word starting with it
+    names, words = medicine_index(hospital_id)
+    seen = set()
+    for entries in [names, words]:
+        for id in prefix_range(entries, prefix):
+            if id not in seen:
+                seen.add(id)
+                yield id
+
+#-----------------------------------LOOKUP---------------------------------------------------
+def autocomplete(hospital_id, name, start = 0, limit = 10):
+    #([{id, name, quantity}], more): in stock matches start..start + limit, quantity is what can still be prescribed
+    ids = candidates(hospital_id, fold(name))
+    wanted = start + limit + 1 #one extra tells whether there is a next page
+    found = []
+    while len(found) < wanted:
+        batch = [id for _, id in zip(range(max(wanted - len(found), limit) * 2), ids)]
+        if not batch:
+            break
+        stock = Medicine.objects.filter(available__gt = 0).only('id', 'name', 'available').in_bulk(batch)
+        found.extend({'id': id, 'name': stock[id].name, 'quantity': stock[id].available} for id in batch if id in stock)
+    return found[start:start + limit], len(found) > start + limit
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:03
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def set_available(apps, schema_editor):
+    #nothing is reserved yet
+    apps.get_model('dispensary', 'Medicine').objects.update(available = F('quantity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0006_auto_20220805_1132'),
+        ('accounts', '0011_rename_timestamp_otp_generated_time'),
+        ('dispensary', '0007_auto_20220805_1132'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='available',
+            field=models.PositiveIntegerField(default=0, verbose_name='Available'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_available, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('restock', 'restock'), ('reserve', 'reserve'), ('release', 'release'), ('consume', 'consume')], max_length=7, verbose_name='Kind')),
+                ('quantity_change', models.IntegerField(verbose_name='Quantity Change')),
+                ('available_change', models.IntegerField(verbose_name='Available Change')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='Date')),
+                ('diagnosis', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='doctor.diagnosis')),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dispensary.medicine')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dispensary.transaction')),
+            ],
+        ),
+    ]
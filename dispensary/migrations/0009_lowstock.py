@@ -0,0 +1,43 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:07
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def fill_low_stock(apps, schema_editor):
+    Medicine = apps.get_model('dispensary', 'Medicine')
+    LowStock = apps.get_model('dispensary', 'LowStock')
+    LowStock.objects.bulk_create([LowStock(medicine_id = medicine['id'], available = medicine['available'], reorder_level = medicine['reorder_level'],
+        hospital_id = medicine['hospital_id']) for medicine in Medicine.objects.filter(available__lte = F('reorder_level')).values()], batch_size = 1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_rename_timestamp_otp_generated_time'),
+        ('dispensary', '0008_stockmovement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='reorder_level',
+            field=models.PositiveIntegerField(default=10, verbose_name='Reorder Level'),
+        ),
+        migrations.CreateModel(
+            name='LowStock',
+            fields=[
+                ('medicine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='dispensary.medicine')),
+                ('available', models.PositiveIntegerField(verbose_name='Available')),
+                ('reorder_level', models.PositiveIntegerField(verbose_name='Reorder Level')),
+                ('since', models.DateTimeField(auto_now_add=True, verbose_name='Low Since')),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='lowstock',
+            index=models.Index(fields=['hospital', 'available'], name='dispensary__hospita_576d95_idx'),
+        ),
+        migrations.RunPython(fill_low_stock, migrations.RunPython.noop),
+    ]
@@ -8,12 +8,19 @@ class Medicine(models.Model):
     name =  models.CharField(verbose_name = _('Medicine Name'), max_length = 255)
     used_for = models.TextField(verbose_name = _('Used For'))
     quantity = models.PositiveIntegerField(verbose_name = _('Quantity'))
+    available = models.PositiveIntegerField(verbose_name = _('Available')) #quantity minus units reserved by unpaid diagnoses
+    reorder_level = models.PositiveIntegerField(verbose_name = _('Reorder Level'), default = 10) #low stock at or below this many available units
     price = models.DecimalField(verbose_name = _('Price'), max_digits = 10, decimal_places = 2)
     discount_percent = models.DecimalField(verbose_name = _('Discount (%)'), max_digits = 5, decimal_places = 2)
     date_added = models.DateTimeField(verbose_name = _('Date Added'), auto_now_add = True)
     last_modified = models.DateTimeField(verbose_name = _('Last Modified'), auto_now = True) 
     hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
 
+    def save(self, *args, **kwargs):
+        if self.available is None: #new medicine, nothing reserved yet
+            self.available = self.quantity
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -45,3 +52,40 @@ class Transaction(models.Model):
 
     def __str__(self):
         return str(self.amount)       
+
+
+movement_choices = (
+    ('restock', 'restock'),
+    ('reserve', 'reserve'),
+    ('release', 'release'),
+    ('consume', 'consume')
+)
+
+class StockMovement(models.Model):
+    #ledger of Medicine.quantity/available changes; units a diagnosis holds = sum(quantity_change - available_change)
+    medicine = models.ForeignKey(Medicine, on_delete = models.CASCADE)
+    kind = models.CharField(verbose_name = _('Kind'), max_length = 7, choices = movement_choices)
+    quantity_change = models.IntegerField(verbose_name = _('Quantity Change'))
+    available_change = models.IntegerField(verbose_name = _('Available Change'))
+    diagnosis = models.ForeignKey('doctor.Diagnosis', on_delete = models.SET_NULL, blank = True, null = True)
+    transaction = models.ForeignKey(Transaction, on_delete = models.SET_NULL, blank = True, null = True)
+    date = models.DateTimeField(verbose_name = _('Date'), auto_now_add = True)
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
+
+    def __str__(self):
+        return f"{self.kind} {self.medicine_id}: {self.quantity_change}/{self.available_change}"
+
+
+class LowStock(models.Model):
+    #medicines at or below their reorder level, kept up to date by dispensary.stock.track_low_stock
+    medicine = models.OneToOneField(Medicine, on_delete = models.CASCADE, primary_key = True)
+    available = models.PositiveIntegerField(verbose_name = _('Available'))
+    reorder_level = models.PositiveIntegerField(verbose_name = _('Reorder Level'))
+    since = models.DateTimeField(verbose_name = _('Low Since'), auto_now_add = True)
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
+
+    class Meta:
+        indexes = [models.Index(fields = ['hospital', 'available'])]
+
+    def __str__(self):
+        return f"{self.medicine_id}: {self.available}/{self.reorder_level}"
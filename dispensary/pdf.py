@@ -0,0 +1,100 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+#Bill PDF rendering, plain data in -> PDF bytes out. No Django imports: process pool workers only need reportlab.
+
+PDF_VERSION = 1 #part of the cached PDFs' content hash, bump when the layout below changes
+
+#-----------------------------------TEMPLATES---------------------------------------------------
+DETAILS_STYLE = TableStyle([
+    ('TEXTCOLOR', (0, 0), (0, -1), colors.gray), #3rd and 4th parameters are start and end with each (col, row)
+])
+DIAGNOSIS_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.gray),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+])
+BILL_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.gray),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('BACKGROUND', (-2, -1), (-2, -1), colors.gray),
+    ('TEXTCOLOR', (-2, -1), (-2, -1), colors.white)
+])
+DIAGNOSIS_HEADER = ['ID', 'Name', 'QUANTITY', 'DIRECTION']
+BILL_HEADER = ['ID', 'Name', 'QUANTITY', 'PRICE', 'DISCOUNT', 'TOTAL AMOUNT']
+
+@lru_cache(maxsize = None)
+def bill_styles():
+    #built once per process; derived styles, the sample stylesheet itself is never modified
+    title = getSampleStyleSheet()['Title']
+    return {
+        'hospital': ParagraphStyle('BillHospital', parent = title, fontSize = 30, textColor = colors.gray),
+        'heading': ParagraphStyle('BillHeading', parent = title, fontSize = 15, textColor = colors.gray),
+    }
+
+#-----------------------------------RENDER---------------------------------------------------
+def get_age(dob):
+    dob = datetime.strptime(dob, "%Y-%m-%d")
+    today = datetime.now()
+    age = today.year - dob.year
+    if dob.month > today.month: age -= 1
+    elif dob.month == today.month and dob.day > today.day: age -= 1
+    return age
+
+def render_bill(bill):
+    #bill: dict with the keyword arguments of dispensary.common_methods.create_pdf
+    styles = bill_styles()
+    spacer = Spacer(1, 0.5 * inch)
+    flowables = [Paragraph(bill['hospital_name'], styles['hospital']), Spacer(1, 0.25 * inch)]
+
+    details = [
+        ['BILL ID:', bill['bill_id']],
+        ['APPOINTMENT DATE:', bill['appointment_date']],
+        ['DIAGNOSED BY:', bill['doctor_name']],
+        ['DOCTOR EMAIL:', bill['doctor_email']],
+        ['PATIENT NAME:', bill['patient_name']],
+        ['AGE:', get_age(bill['patient_dob'])],
+        ['PATIENT EMAIL:', bill['patient_email']],
+    ]
+    flowables += [Table(details, style = DETAILS_STYLE), spacer]
+
+    diagnosis = [DIAGNOSIS_HEADER]
+    for diagnosis_dict in bill['diagnosis_details']:
+        diagnosis.append([diagnosis_dict['id'], diagnosis_dict['name'], diagnosis_dict['qty'], diagnosis_dict['direction']])
+    flowables += [Paragraph("DIAGNOSIS", styles['heading']), Table(diagnosis, style = DIAGNOSIS_STYLE), spacer]
+
+    medicine_details = bill['medicine_details']
+    rows = [BILL_HEADER]
+    amount_payable = 0
+    for medicine in medicine_details["medicines"]:
+        price = float(medicine['price'])
+        qty = int(medicine['qty'])
+        discount = float(medicine['discount_percent'])
+        total_amount = price * (1 - (discount / 100)) * qty
+        amount_payable += total_amount
+        rows.append([medicine['id'], medicine['name'], qty, price, discount, total_amount])
+    amount_payable += float(medicine_details["Doctor Fees"])
+    rows.append(['','','', '', 'Doctor Fees', medicine_details["Doctor Fees"]])
+    rows.append(['','','','', 'Amount Payable', amount_payable])
+    rows.append(['','','','', 'Amount Paid', bill['amount_paid']])
+    flowables += [Paragraph("BILL", styles['heading']), Table(rows, style = BILL_STYLE)]
+
+    buffer = BytesIO()
+    SimpleDocTemplate(buffer, pagesize = letter).build(flowables)
+    return buffer.getvalue()
+
+def render_bills(bills, workers = None, chunksize = 20):
+    #yields (bill, pdf bytes) in input order, rendered across a process pool (workers = 1 renders in this process)
+    bills = list(bills)
+    if workers == 1:
+        for bill in bills:
+            yield bill, render_bill(bill)
+        return
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        yield from zip(bills, executor.map(render_bill, bills, chunksize = chunksize))
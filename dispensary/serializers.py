@@ -1,11 +1,68 @@
 from rest_framework import serializers
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from accounts.models import Department
-from dispensary.models import Bill, Medicine, Transaction, payment_choices
-
-
-
-class MedicineSerializer(serializers.ModelSerializer):
+from administration.serializers import ReadSerializerMixin, SparseFieldsMixin
+from dispensary.models import Bill, Medicine, StockMovement, Transaction, payment_choices
+from dispensary.stock import consume_bill, lock_diagnosis, medicine_units, reserved_for, restock
+from doctor.models import Diagnosis
+
+
+#-----------------------------------MEDICINE LINES---------------------------------------------------
+def validate_medicine_lines(value, hospital, reserved = None):
+    #[(medicine, qty, line)] of prescribed/billed medicines: one in_bulk() query, errors of every line raised together;
+    #with reserved ({medicine id: units already held by the caller}) the quantity is checked against Medicine.available
+    errors = []
+    lines = []
+    seen = set()
+    for index, line in enumerate(value):
+        if not isinstance(line, dict) or not line.get('id', None):
+            errors.append((index, _('No Medicine ID provided!')))
+            continue
+        try:
+            id = int(line['id'])
+        except (TypeError, ValueError):
+            errors.append((index, _(f'Medicine ID: {line["id"]} is not correct!')))
+            continue
+        if id in seen:
+            errors.append((index, _(f'Medicine ID: {id} is added more than once!')))
+            continue
+        seen.add(id)
+        try:
+            qty = int(line.get('qty', 1))
+        except (TypeError, ValueError):
+            errors.append((index, _(f'Quantity is not correct, for Medicine ID: {id}!')))
+            continue
+        lines.append((index, id, qty, line))
+    medicines = Medicine.objects.filter(hospital = hospital).in_bulk(seen) if seen else {}
+    result = []
+    for index, id, qty, line in lines:
+        medicine = medicines.get(id)
+        if medicine is None:
+            errors.append((index, _(f'Medicine ID: {id} is not correct!')))
+        elif reserved is not None and qty > medicine.available + reserved.get(id, 0):
+            errors.append((index, _(f'Quantity cannot be more than {medicine.available + reserved.get(id, 0)}, for Medicine ID: {id}!')))
+        elif qty < 1:
+            errors.append((index, _(f'Quantity cannot be less than 1, for Medicine ID: {id}!')))
+        else:
+            result.append((medicine, qty, line))
+    if errors:
+        raise serializers.ValidationError([message for index, message in sorted(errors, key = lambda error: error[0])])
+    return result
+
+def stock_errors(quantities, medicines, reserved):
+    #{medicine id: qty} against {medicine id: Medicine} and the units the appointment's diagnosis holds
+    errors = []
+    for id, qty in quantities.items():
+        if id not in medicines:
+            errors.append(_(f'Medicine ID: {id} is not correct!'))
+        elif qty > medicines[id].available + reserved.get(id, 0):
+            errors.append(_(f'Quantity cannot be more than {medicines[id].available + reserved.get(id, 0)}, for Medicine ID: {id}!'))
+    return errors
+
+
+class MedicineSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    related_fields = ['hospital']
     
     class Meta:
         model = Medicine
@@ -16,6 +73,8 @@ class MedicineSerializer(serializers.ModelSerializer):
             'quantity': {'required': True},
             'price': {'required': True},
             'discount': {'required': False},
+            'available': {'required': False, 'read_only': True},
+            'reorder_level': {'required': False},
             'date_added': {'required': False, 'read_only': True},
             'last_modified': {'required': False, 'read_only': True},            
             'hospital': {'required': False, 'read_only': True}
@@ -29,16 +88,43 @@ class MedicineSerializer(serializers.ModelSerializer):
             return name
         raise serializers.ValidationError(_(f'Medicine: {name} already exists!'))
 
-    def to_representation(self, instance):               
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+    def create(self, validated_data):
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            StockMovement.objects.create(medicine = instance, kind = 'restock', quantity_change = instance.quantity,
+                                         available_change = instance.quantity, hospital = instance.hospital)
+        return instance
+
+    def update(self, instance, validated_data):
+        #the delta and the reserved units come from the locked row: payments and reservations wait for this restock,
+        #the ones committed before it are counted in
+        with transaction.atomic():
+            current = Medicine.objects.select_for_update().get(pk = instance.pk)
+            quantity = validated_data.pop('quantity', current.quantity)
+            reserved = current.quantity - current.available
+            if quantity < reserved:
+                raise serializers.ValidationError({'quantity': [_(f'Quantity cannot be less than {reserved} reserved by diagnoses!')]})
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save(update_fields = list(validated_data) + ['last_modified'])
+            restock(instance, quantity - current.quantity)
+        instance.refresh_from_db()
+        return instance
+
+    def to_representation(self, instance):
+        return MedicineReadSerializer(context = self.context, fields = self.sparse_fields).to_representation(instance)
 
     def validate(self, validated_data):
         validated_data['hospital'] = self.context.get("hospital")
         return validated_data
 
 
-class BillSerializer(serializers.ModelSerializer):
+class MedicineReadSerializer(ReadSerializerMixin, MedicineSerializer):
+    pass
+
+
+class BillSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    related_fields = ['appointment', 'hospital']
     total_amount = 0
     class Meta:
         model = Bill
@@ -60,34 +146,18 @@ class BillSerializer(serializers.ModelSerializer):
 
     def validate_details(self, value):
         medicine_list = []
-        medicine_id = []
-        for medicine in value:
-            try:
-                if not medicine.get('id', None): raise serializers.ValidationError(('No Medicine ID provided!'))
-                id = int(medicine['id'])
-                qty = int(medicine.get('qty', 1))
-                medicine = Medicine.objects.get(pk = id, hospital = self.context.get("hospital"))
-                if qty > medicine.quantity:
-                    raise serializers.ValidationError(_(f'Quantity cannot be more than {medicine.quantity}, for Medicine ID: {id}!'))
-                if qty < 1:
-                    raise serializers.ValidationError(_(f'Quantity cannot be less than 1, for Medicine ID: {id}!'))
-                if id not in medicine_id:
-                    price = float(medicine.price)
-                    discount = float(medicine.discount_percent)
-                    medicine_list.append({'id' : medicine.id, 'name' : medicine.name, 'qty' : qty, 'price' : price, 
-                    'discount_percent' : discount})
-                    medicine_id.append(id)
-                    self.total_amount += price * (1 - (discount / 100)) * qty
-                else:
-                    raise serializers.ValidationError(_(f'Medicine ID: {id} is added more than once!'))    
-            except Medicine.DoesNotExist:
-                raise serializers.ValidationError(_(f'Medicine ID: {id} is not correct!'))    
+        self.medicines = {}
+        for medicine, qty, line in validate_medicine_lines(value, self.context.get("hospital")):
+            self.medicines[medicine.id] = medicine
+            price = float(medicine.price)
+            discount = float(medicine.discount_percent)
+            medicine_list.append({'id' : medicine.id, 'name' : medicine.name, 'qty' : qty, 'price' : price, 
+            'discount_percent' : discount})
+            self.total_amount += price * (1 - (discount / 100)) * qty
         return medicine_list   
 
     def to_representation(self, instance):
-        self.fields['appointment'] =  serializers.StringRelatedField(read_only = True)                
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+        return BillReadSerializer(context = self.context, fields = self.sparse_fields).to_representation(instance)
 
     def validate(self, validated_data):
         if self.context.get("fees"):
@@ -95,6 +165,11 @@ class BillSerializer(serializers.ModelSerializer):
         else:    
             department = Department.objects.get(id = validated_data['appointment'].department.id)
             fees = float(department.fees)
+        #billed medicines have to be on the shelf or held for the appointment by its diagnosis
+        diagnosis = Diagnosis.objects.filter(appointment = validated_data['appointment']).first()
+        errors = stock_errors(medicine_units(validated_data['details']), self.medicines, reserved_for(diagnosis))
+        if errors:
+            raise serializers.ValidationError({'details': errors})
         validated_data['details'] = {'Doctor Fees' : fees, 'medicines' : validated_data['details']}
         self.total_amount += fees
         validated_data['total_price'] = self.total_amount
@@ -102,7 +177,12 @@ class BillSerializer(serializers.ModelSerializer):
         return validated_data       
 
 
+class BillReadSerializer(ReadSerializerMixin, BillSerializer):
+    pass
+
+
 class TransactionSerializer(serializers.ModelSerializer):
+    related_fields = ['hospital']
     amount_paid = 0
     payment_mode = serializers.ChoiceField(required = True, choices = payment_choices)
     class Meta:
@@ -118,27 +198,37 @@ class TransactionSerializer(serializers.ModelSerializer):
     def validate_bill(self, value):
         if value.hospital != self.context.get("hospital"):
             raise serializers.ValidationError(_(f'No such Bill: {value.id} exists!'))
+        #rows stay locked until the caller's transaction.atomic() ends: concurrent payments of the bill or its medicines wait here
+        value = Bill.objects.select_for_update().get(pk = value.pk)
+        if Transaction.objects.filter(bill = value, hospital = self.context.get("hospital")).exists():
+            raise serializers.ValidationError(_(f'Bill: {value.id} already paid!'))
+        self.amount_paid = value.total_price
+        self.diagnosis = Diagnosis.objects.filter(appointment_id = value.appointment_id).first()
+        lock_diagnosis(self.diagnosis) #its reservation cannot change until the payment commits
+        stock = medicine_units(value.details["medicines"])
+        medicines = {medicine.id: medicine for medicine in Medicine.objects.select_for_update().filter(pk__in = stock,
+                     hospital = self.context.get("hospital")).order_by('id')} #same lock order in every payment
+        errors = stock_errors(stock, medicines, reserved_for(self.diagnosis))
+        if errors:
+            raise serializers.ValidationError(errors)
+        return value
+
+    def create(self, validated_data):
+        instance = super().create(validated_data)
         try:
-            Transaction.objects.get(bill = value, hospital = self.context.get("hospital"))
-        except Transaction.DoesNotExist:
-            self.amount_paid = value.total_price
-            for medicine in value.details["medicines"]:
-                try:
-                    id = int(medicine['id'])
-                    qty = int(medicine['qty'])
-                    medicine = Medicine.objects.get(pk = id, hospital = self.context.get("hospital"))
-                    if qty > medicine.quantity:
-                        raise serializers.ValidationError(_(f'Quantity cannot be more than {medicine.quantity}, for Medicine ID: {id}!'))   
-                except Medicine.DoesNotExist:
-                    raise serializers.ValidationError(_(f'Medicine ID: {id} is not correct!'))  
-            return value
-        raise serializers.ValidationError(_(f'Bill: {value.id} already paid!'))       
+            consume_bill(instance, instance.bill, self.diagnosis)
+        except serializers.ValidationError:
+            raise serializers.ValidationError({'bill': [_(f'Not enough stock left to pay Bill: {instance.bill_id}!')]})
+        return instance
 
-    def to_representation(self, instance):               
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+    def to_representation(self, instance):
+        return TransactionReadSerializer(context = self.context).to_representation(instance)
 
     def validate(self, validated_data):
         validated_data['amount'] = self.amount_paid
         validated_data['hospital'] = self.context.get("hospital")
-        return validated_data             
\ No newline at end of file
+        return validated_data             
+
+
+class TransactionReadSerializer(ReadSerializerMixin, TransactionSerializer):
+    pass
@@ -0,0 +1,20 @@
+from dispensary.autocomplete import index_changed
+from dispensary.models import Medicine
+from dispensary.stock import release_diagnosis, track_low_stock
+
+
+def release_deleted_diagnosis(sender, instance, **kwargs):
+    release_diagnosis(instance) #also when deleted along with its appointment
+
+def medicine_saving(sender, instance, **kwargs):
+    #the autocomplete index only depends on names, stock and price edits leave it alone
+    before = Medicine.objects.filter(pk = instance.pk).values('name', 'hospital_id').first() if instance.pk else None
+    instance._index_changed = before != {'name': instance.name, 'hospital_id': instance.hospital_id}
+
+def medicine_saved(sender, instance, **kwargs):
+    track_low_stock([instance.id]) #new medicine, edited reorder level
+    if getattr(instance, '_index_changed', True):
+        index_changed(instance.hospital_id)
+
+def medicine_deleted(sender, instance, **kwargs):
+    index_changed(instance.hospital_id)
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from dispensary.models import LowStock, Medicine, StockMovement, Transaction
+from doctor.models import Diagnosis
+
+#Stock moves only through StockMovement rows: a diagnosis reserves its medicines (available goes down), paying the
+#bill consumes them (quantity goes down, whatever was reserved but not billed is released), restocks move both.
+
+#-----------------------------------LEDGER---------------------------------------------------
+def reserved_for(diagnosis):
+    #{medicine id: units the diagnosis still holds}
+    if diagnosis is None or diagnosis.pk is None:
+        return {}
+    rows = StockMovement.objects.filter(diagnosis = diagnosis).values('medicine_id').annotate(held = Sum(F('quantity_change') - F('available_change')))
+    return {row['medicine_id']: row['held'] for row in rows if row['held']}
+
+def lock_diagnosis(diagnosis):
+    #inside the caller's transaction: reservation changes and the payment of one diagnosis take turns, so the units
+    #read by reserved_for() cannot be moved by the other before this transaction commits
+    if diagnosis is not None and diagnosis.pk is not None:
+        Diagnosis.objects.select_for_update().filter(pk = diagnosis.pk).first()
+
+def medicine_units(lines):
+    #{medicine id: qty} of diagnosis/bill medicine lines
+    units = {}
+    for line in lines:
+        units[int(line['id'])] = units.get(int(line['id']), 0) + int(line['qty'])
+    return units
+
+def apply_movements(movements):
+    #one conditional UPDATE of all medicines involved (skipped when a change would go below zero) and one INSERT of the ledger rows
+    movements = [movement for movement in movements if movement.quantity_change or movement.available_change]
+    if not movements:
+        return
+    quantity = {}
+    available = {}
+    for movement in movements:
+        quantity[movement.medicine_id] = quantity.get(movement.medicine_id, 0) + movement.quantity_change
+        available[movement.medicine_id] = available.get(movement.medicine_id, 0) + movement.available_change
+    enough = Q()
+    for id in quantity:
+        enough |= Q(pk = id, quantity__gte = max(-quantity[id], 0), available__gte = max(-available[id], 0))
+    with transaction.atomic():
+        updated = Medicine.objects.filter(enough).update(
+            quantity = Case(*[When(pk = id, then = F('quantity') + change) for id, change in quantity.items() if change], default = F('quantity')),
+            available = Case(*[When(pk = id, then = F('available') + change) for id, change in available.items() if change], default = F('available')),
+            last_modified = timezone.now())
+        if updated != len(quantity): #rolled back
+            raise serializers.ValidationError(_('Not enough stock left, the stock changed meanwhile!'))
+        StockMovement.objects.bulk_create(movements)
+        track_low_stock(list(quantity))
+
+def track_low_stock(medicine_ids):
+    #adds/updates/removes the LowStock rows of just these medicines, after every stock or reorder level change
+    medicines = Medicine.objects.filter(pk__in = medicine_ids).values('id', 'available', 'reorder_level', 'hospital_id')
+    low = {medicine['id']: medicine for medicine in medicines if medicine['available'] <= medicine['reorder_level']}
+    LowStock.objects.filter(medicine_id__in = medicine_ids).exclude(medicine_id__in = low).delete()
+    if not low:
+        return
+    LowStock.objects.filter(medicine_id__in = low).update(
+        available = Case(*[When(medicine_id = id, then = medicine['available']) for id, medicine in low.items()]),
+        reorder_level = Case(*[When(medicine_id = id, then = medicine['reorder_level']) for id, medicine in low.items()]))
+    LowStock.objects.bulk_create([LowStock(medicine_id = id, available = medicine['available'], reorder_level = medicine['reorder_level'],
+        hospital_id = medicine['hospital_id']) for id, medicine in low.items()], ignore_conflicts = True) #rows already low keep their since
+
+#-----------------------------------MOVEMENTS---------------------------------------------------
+def reserve_diagnosis(diagnosis):
+    #brings the diagnosis' reservation in line with its prescribed medicines; a paid diagnosis holds nothing any more
+    lock_diagnosis(diagnosis) #a payment in progress commits first, then counts as paid here
+    if Transaction.objects.filter(bill__appointment_id = diagnosis.appointment_id).exists():
+        return
+    held = reserved_for(diagnosis)
+    wanted = medicine_units(diagnosis.medicine)
+    apply_movements([StockMovement(medicine_id = id, kind = 'release' if held.get(id, 0) > wanted.get(id, 0) else 'reserve',
+        quantity_change = 0, available_change = held.get(id, 0) - wanted.get(id, 0), diagnosis = diagnosis, hospital_id = diagnosis.hospital_id)
+        for id in set(held) | set(wanted)])
+
+def release_diagnosis(diagnosis):
+    #for a diagnosis being deleted: its rows are SET_NULL by the delete, rows added now would block it
+    lock_diagnosis(diagnosis)
+    apply_movements([StockMovement(medicine_id = id, kind = 'release', quantity_change = 0, available_change = units,
+        hospital_id = diagnosis.hospital_id) for id, units in reserved_for(diagnosis).items()])
+
+def consume_bill(transaction_model, bill, diagnosis):
+    #billed units leave the shelf, taken from the diagnosis' reservation first
+    held = reserved_for(diagnosis)
+    billed = medicine_units(bill.details['medicines'])
+    apply_movements([StockMovement(medicine_id = id, kind = 'consume', quantity_change = -billed.get(id, 0),
+        available_change = held.get(id, 0) - billed.get(id, 0), diagnosis = diagnosis, transaction = transaction_model,
+        hospital_id = bill.hospital_id) for id in set(held) | set(billed)])
+
+def restock(medicine, change):
+    apply_movements([StockMovement(medicine_id = medicine.id, kind = 'restock', quantity_change = change, available_change = change,
+                                   hospital_id = medicine.hospital_id)])
@@ -1,3 +1,105 @@
-from django.test import TestCase
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from accounts.models import Account, Hospital, Roles
+from dispensary.models import Bill, Medicine, StockMovement, Transaction
+from dispensary.serializers import MedicineSerializer
+from dispensary.stock import apply_movements
+from registration.models import Appointment, Patient
 
-# Create your tests here.
+
+class PaymentConcurrencyTests(TransactionTestCase):
+    #bills sharing the same medicines are paid from parallel threads with a DB connection each: the row locks taken
+    #in TransactionSerializer.validate_bill are all that keeps stock deductions and payments from being lost or doubled
+    QTY = 3
+    WORKERS = 6
+
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name = 'Test Hospital')
+        self.dispensary = Account.objects.create_user('dispensary@hospital.test', 'Test Dispensary', 'password', hospital = self.hospital,
+                          roles = Roles.objects.create(name = 'dispensary', hospital = self.hospital))
+        patient = Patient.objects.create(email = 'patient@hospital.test', mobile = '9000000000', name = 'patient', dob = date(1990, 1, 1),
+                  gender = 'o', hospital = self.hospital)
+        self.appointment = Appointment.objects.create(appointment_date = date.today(), patient = patient, hospital = self.hospital)
+
+    def create_bills(self, count, stock):
+        self.medicines = [Medicine.objects.create(name = f"medicine {index}", used_for = 'testing', quantity = stock, price = Decimal('10.00'),
+                          discount_percent = Decimal('0.00'), hospital = self.hospital) for index in range(2)]
+        bills = []
+        for index in range(count):
+            lines = self.medicines if index % 2 else self.medicines[::-1] #both lock orders
+            bills.append(Bill.objects.create(appointment = self.appointment, hospital = self.hospital, total_price = Decimal(20 * self.QTY),
+                details = {'Doctor Fees': 0, 'medicines': [{'id': medicine.id, 'name': medicine.name, 'qty': self.QTY, 'price': 10.0,
+                'discount_percent': 0.0} for medicine in lines]}))
+        return bills
+
+    def pay(self, bill_id):
+        try:
+            client = APIClient(raise_request_exception = False) #a payment the database refused is a 500
+            client.force_authenticate(self.dispensary)
+            return client.post('/dispensary/api/transaction/', {'bill': bill_id, 'payment_mode': 'cash'}, format = 'json').status_code
+        finally:
+            connection.close()
+
+    def pay_parallel(self, bills, attempts):
+        with ThreadPoolExecutor(max_workers = self.WORKERS) as executor:
+            return Counter(executor.map(self.pay, [bill.id for bill in bills for _ in range(attempts)]))
+
+    def assertStock(self, bills, stock, statuses):
+        #one transaction per accepted payment, no bill paid twice, every paid bill deducted exactly once
+        paid = Transaction.objects.filter(bill__in = bills)
+        self.assertEqual(paid.count(), statuses[201])
+        self.assertFalse(paid.values('bill').annotate(payments = Count('id')).filter(payments__gt = 1).exists())
+        for medicine in Medicine.objects.filter(pk__in = [medicine.id for medicine in self.medicines]):
+            self.assertEqual(medicine.quantity, stock - paid.count() * self.QTY)
+            self.assertEqual(medicine.available, medicine.quantity) #nothing is reserved for these bills
+
+    def test_parallel_payments_lose_no_stock_updates(self):
+        bills = self.create_bills(10, 100)
+        statuses = self.pay_parallel(bills, 2)
+        self.assertGreater(statuses[201], 0)
+        self.assertStock(bills, 100, statuses)
+
+    def test_parallel_payments_never_oversell(self):
+        bills = self.create_bills(8, self.QTY * 3) #stock for three bills
+        statuses = self.pay_parallel(bills, 1)
+        self.assertLessEqual(statuses[201], 3)
+        self.assertStock(bills, self.QTY * 3, statuses)
+
+
+class MedicineRestockTests(TestCase):
+    #the medicine given to MedicineSerializer was read before the stock moved: the restock must go by the locked row
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name = 'Test Hospital')
+        self.medicine = MedicineSerializer(data = {'name': 'medicine', 'used_for': 'testing', 'quantity': 10, 'price': '10.00',
+                        'discount_percent': '0.00'}, context = {'hospital': self.hospital})
+        self.assertTrue(self.medicine.is_valid())
+        self.medicine = self.medicine.save()
+
+    def move(self, quantity_change, available_change):
+        apply_movements([StockMovement(medicine_id = self.medicine.id, kind = 'reserve', quantity_change = quantity_change,
+                         available_change = available_change, hospital = self.hospital)])
+
+    def restock(self, quantity):
+        serializer = MedicineSerializer(self.medicine, data = {'quantity': quantity}, partial = True, context = {'hospital': self.hospital})
+        self.assertTrue(serializer.is_valid())
+        return serializer.save()
+
+    def test_restock_keeps_stock_moved_meanwhile(self):
+        self.move(-3, -3) #paid after the medicine was read
+        medicine = self.restock(15)
+        self.assertEqual((medicine.quantity, medicine.available), (15, 15))
+        self.assertEqual(sum(StockMovement.objects.filter(medicine = medicine).values_list('quantity_change', flat = True)), 15)
+
+    def test_reserved_units_checked_on_the_locked_row(self):
+        self.move(0, -8) #reserved after the medicine was read
+        with self.assertRaises(serializers.ValidationError):
+            self.restock(5)
+        medicine = self.restock(8)
+        self.assertEqual((medicine.quantity, medicine.available), (8, 0))
@@ -1,15 +1,22 @@
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework import status, viewsets
+from rest_framework import serializers, status, viewsets
 from accounts.models import Department
-from administration.views import get_conditions, pagination_datatable
+from administration.exports import EXPORT_RENDERERS, PDFRenderer, export_response, file_response
+from administration.values import values_data
+from administration.views import get_conditions, get_fields, pagination_datatable, select_related_fields
+from django.db import transaction
+from django.db.models import F
 from django.utils.translation import gettext_lazy as _
 from accounts.permissions import IsDispensary
-from dispensary.common_methods import create_mail_pdf, create_pdf
-from dispensary.models import Bill, Medicine, Transaction
+from administration.jobs import job_status
+from administration.models import Job
+from dispensary.common_methods import bill_mail_key, bill_pdf_data, cached_bill_pdf, create_pdf, enqueue_bill_mail
+from dispensary.models import Bill, LowStock, Medicine, Transaction
 from datetime import datetime
-from dispensary.serializers import BillSerializer, MedicineSerializer, TransactionSerializer
+from dispensary.serializers import BillReadSerializer, BillSerializer, MedicineReadSerializer, MedicineSerializer, TransactionReadSerializer, TransactionSerializer
 from doctor.models import Diagnosis
 from doctor.serializers import DiagnosisSerializer
 
@@ -25,7 +32,7 @@ class MedicineView(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'delete', 'patch']
     permission_classes = [IsAuthenticated, IsDispensary]    
     
-    def list(self, request):
+    def list(self, request, export = False):
         context = {}
         try:          
             columns = ['id','name', 'used_for', 'quantity', 'price', "discount_percent", "date_added",'last_modified']
@@ -34,29 +41,51 @@ class MedicineView(viewsets.ModelViewSet):
             last_modified_end = request.query_params.get('last_modified_end','').strip()
             date_filter = [last_modified_start, last_modified_end]
             #------------------
+            fields = get_fields(request.query_params, MedicineReadSerializer, defer = [] if export else ['used_for']) #heavy columns only on retrieve
             medicine_data = pagination_datatable(Medicine, columns, **request.query_params, 
             hospital = request.user.hospital, date_columns = date_columns,
-            date_filter = date_filter, date_col_filter = 'last_modified')
+            date_filter = date_filter, date_col_filter = 'last_modified', serializer_fields = fields, serializer_class = MedicineReadSerializer, export = export)
             #------------------
-            serializer = MedicineSerializer(medicine_data['data'], many = True)
-            context['data'] = serializer.data
+            if export:
+                return export_response(medicine_data['data'], MedicineReadSerializer, request, 'medicines', fields)
+            context['data'] = values_data(medicine_data['data'], MedicineReadSerializer, fields = fields)
             context['draw'] = medicine_data['draw']
             context['recordsTotal'] = medicine_data['recordsTotal']
             context['recordsFiltered'] = medicine_data['recordsFiltered']
+            if 'recordsCapped' in medicine_data:
+                context['recordsCapped'] = medicine_data['recordsCapped']
+            if 'next_cursor' in medicine_data:
+                context['next_cursor'] = medicine_data['next_cursor']
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'], renderer_classes = EXPORT_RENDERERS)
+    def export(self, request):
+        return self.list(request, export = True)
+
+    @action(detail = False, methods = ['get'])
+    def low_stock(self, request):
+        #medicines at or below their reorder level, emptiest first; read from LowStock, not the catalog
+        context = {}
+        try:
+            context['data'] = list(LowStock.objects.filter(hospital = request.user.hospital).order_by('available', 'medicine_id').values(
+                'available', 'reorder_level', 'since', id = F('medicine_id'), name = F('medicine__name'), quantity = F('medicine__quantity')))
+            return Response(context, status = status.HTTP_200_OK)
+        except Exception as e:
+            context['error'] = e
+        return Response(context, status = status.HTTP_400_BAD_REQUEST)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:     
-                medicine_data = self.queryset.get(id = pk, hospital = request.user.hospital)
+                medicine_data = select_related_fields(self.queryset, MedicineReadSerializer).get(id = pk, hospital = request.user.hospital)
             except Medicine.DoesNotExist:
                 context['error'] = {"id": [_(f"Medicine ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = MedicineSerializer(medicine_data)    
+            serializer = MedicineReadSerializer(medicine_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -100,6 +129,8 @@ class MedicineView(viewsets.ModelViewSet):
                 context['message'] =  _(f'Medicine: {serializer.data["id"]} updated!')
                 return Response(context, status = status.HTTP_200_OK) 
             context ['error'] = serializer.errors
+        except serializers.ValidationError as e: #quantity below the units reserved
+            context['error'] = e.detail
         except Exception as e:
             context['error'] = e
         context['message'] = _('Medicine was not updated!')
@@ -129,7 +160,7 @@ class BillView(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'patch']
     permission_classes = [IsAuthenticated, IsDispensary]    
     
-    def list(self, request):
+    def list(self, request, export = False):
         context = {}
         try:        
             columns = ['id','bill_date', 'appointment', 'details', 'total_price']
@@ -139,29 +170,40 @@ class BillView(viewsets.ModelViewSet):
             bill_date_end = request.query_params.get('bill_date_end','').strip()
             date_filter = [bill_date_start, bill_date_end]
             #------------------
+            fields = get_fields(request.query_params, BillReadSerializer, defer = [] if export else ['details']) #heavy columns only on retrieve
             bill_data = pagination_datatable(Bill, columns, **request.query_params, 
             hospital = request.user.hospital, date_columns = date_columns,
-            date_filter = date_filter, date_col_filter = 'appointment_date', exclude = exclude)
+            date_filter = date_filter, date_col_filter = 'appointment_date', exclude = exclude, serializer_fields = fields, serializer_class = BillReadSerializer, export = export)
             #------------------
-            serializer = BillSerializer(bill_data['data'], many = True)
+            if export:
+                return export_response(bill_data['data'], BillReadSerializer, request, 'bills', fields)
+            serializer = BillReadSerializer(bill_data['data'], many = True, fields = fields)
             context['data'] = serializer.data
             context['draw'] = bill_data['draw']
             context['recordsTotal'] = bill_data['recordsTotal']
             context['recordsFiltered'] = bill_data['recordsFiltered']
+            if 'recordsCapped' in bill_data:
+                context['recordsCapped'] = bill_data['recordsCapped']
+            if 'next_cursor' in bill_data:
+                context['next_cursor'] = bill_data['next_cursor']
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'], renderer_classes = EXPORT_RENDERERS)
+    def export(self, request):
+        return self.list(request, export = True)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:     
-                bill_data = self.queryset.get(id = pk, hospital = request.user.hospital)
+                bill_data = select_related_fields(self.queryset, BillReadSerializer).get(id = pk, hospital = request.user.hospital)
             except Bill.DoesNotExist:
                 context['error'] = {"id": [_(f"Bill ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = BillSerializer(bill_data)    
+            serializer = BillReadSerializer(bill_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -238,8 +280,58 @@ class BillView(viewsets.ModelViewSet):
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
             context['error'] = e
-        return Response(context, status = status.HTTP_400_BAD_REQUEST) 
-        
+        return Response(context, status = status.HTTP_400_BAD_REQUEST)
+
+    @action(detail = True, methods = ['get'], renderer_classes = [JSONRenderer, PDFRenderer])
+    def pdf(self, request, pk):
+        #served from the content-addressed PDF cache, repeat downloads (and If-None-Match / Range requests) render nothing
+        context = {}
+        request.accepted_renderer, request.accepted_media_type = JSONRenderer(), JSONRenderer.media_type #errors stay JSON after ?format=pdf
+        try:
+            try:
+                bill = Bill.objects.select_related('hospital', 'appointment__patient', 'appointment__doctor').get(id = pk, hospital = request.user.hospital)
+            except Bill.DoesNotExist:
+                context['error'] = {"id": [_(f"Bill ID: {pk} does not exist!")]}
+                return Response(context, status = status.HTTP_400_BAD_REQUEST)
+            payment = Transaction.objects.filter(bill = bill).first()
+            diagnosis = Diagnosis.objects.filter(appointment_id = bill.appointment_id).first()
+            if payment is None or diagnosis is None:
+                context['error'] = {"id": [_(f"Bill ID: {pk} is not paid yet!" if payment is None else f"Bill ID: {pk} has no diagnosis!")]}
+                return Response(context, status = status.HTTP_400_BAD_REQUEST)
+            location, digest = cached_bill_pdf(bill_pdf_data(bill, payment, diagnosis))
+            return file_response(request, location, digest, 'application/pdf', f'Bill-{bill.id}.pdf')
+        except Exception as e:
+            context['error'] = e
+        context['message'] = _('Bill PDF was not retrieved!')
+        return Response(context, status = status.HTTP_400_BAD_REQUEST)
+
+    @action(detail = True, methods = ['get', 'post'])
+    def mail(self, request, pk):
+        #GET: status of the bill's PDF/email job, POST: queue it again (a failed job is retried, resend = true mails a sent bill again)
+        context = {}
+        try:
+            try:
+                bill = Bill.objects.get(id = pk, hospital = request.user.hospital)
+            except Bill.DoesNotExist:
+                context['error'] = {"id": [_(f"Bill ID: {pk} does not exist!")]}
+                return Response(context, status = status.HTTP_400_BAD_REQUEST)
+            if request.method == 'POST':
+                if not Transaction.objects.filter(bill = bill).exists():
+                    context['error'] = {"id": [_(f"Bill ID: {pk} is not paid yet!")]}
+                    return Response(context, status = status.HTTP_400_BAD_REQUEST)
+                job = enqueue_bill_mail(bill, force = str(request.data.get('resend', '')).lower() in ['1', 'true'])
+            else:
+                job = Job.objects.filter(key = bill_mail_key(bill.id)).first()
+                if job is None:
+                    context['error'] = {"id": [_(f"Bill ID: {pk} has no mail job!")]}
+                    return Response(context, status = status.HTTP_400_BAD_REQUEST)
+            context['data'] = job_status(job)
+            return Response(context, status = status.HTTP_200_OK)
+        except Exception as e:
+            context['error'] = e
+        context['message'] = _('Mail status was not retrieved!')
+        return Response(context, status = status.HTTP_400_BAD_REQUEST)
+
 #-----------------------------------TRANSACTION---------------------------------------------------
 #------------API---------------
 
@@ -249,7 +341,7 @@ class TransactionView(viewsets.ModelViewSet):
     http_method_names = ['get', 'post']
     permission_classes = [IsAuthenticated, IsDispensary]    
     
-    def list(self, request):
+    def list(self, request, export = False):
         context = {}
         try:          
             columns = ['id','transaction_date', 'bill', 'amount', 'payment_mode']
@@ -261,27 +353,36 @@ class TransactionView(viewsets.ModelViewSet):
             #------------------
             transaction_data = pagination_datatable(Transaction, columns, **request.query_params, 
             hospital = request.user.hospital, date_columns = date_columns, 
-            date_filter = date_filter, date_col_filter = 'transaction_date')
+            date_filter = date_filter, date_col_filter = 'transaction_date', serializer_class = TransactionReadSerializer, export = export)
             #------------------
-            serializer = TransactionSerializer(transaction_data['data'], many = True)
-            context['data'] = serializer.data
+            if export:
+                return export_response(transaction_data['data'], TransactionReadSerializer, request, 'transactions')
+            context['data'] = values_data(transaction_data['data'], TransactionReadSerializer)
             context['draw'] = transaction_data['draw']
             context['recordsTotal'] = transaction_data['recordsTotal']
             context['recordsFiltered'] = transaction_data['recordsFiltered']
+            if 'recordsCapped' in transaction_data:
+                context['recordsCapped'] = transaction_data['recordsCapped']
+            if 'next_cursor' in transaction_data:
+                context['next_cursor'] = transaction_data['next_cursor']
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'], renderer_classes = EXPORT_RENDERERS)
+    def export(self, request):
+        return self.list(request, export = True)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:     
-                transaction_data = self.queryset.get(id = pk, hospital = request.user.hospital)
+                transaction_data = select_related_fields(self.queryset, TransactionReadSerializer).get(id = pk, hospital = request.user.hospital)
             except Transaction.DoesNotExist:
                 context['error'] = {"id": [_(f"Transaction ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = TransactionSerializer(transaction_data)    
+            serializer = TransactionReadSerializer(transaction_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -295,25 +396,20 @@ class TransactionView(viewsets.ModelViewSet):
         try:          
             serializer = TransactionSerializer(data = data)
             serializer.context["hospital"] = request.user.hospital #pass context to serializer
-            if serializer.is_valid():
-                serializer.save()
-                bill = Bill.objects.get(pk = data.get('bill'))
-                details = bill.details
-                medicines = details["medicines"]
-                for medicine in medicines:
-                    medicine_model = Medicine.objects.get(pk = medicine["id"], hospital = request.user.hospital)   
-                    medicine_model.quantity -= int(medicine["qty"])
-                    medicine_model.save()
-                
-                msg = 'Transaction added!'
-                if(not create_mail_pdf(bill)):
-                    msg += '\nBill was not mailed!'
-
+            with transaction.atomic(): #payment, stock deduction and the mail job commit together, bill and medicine rows locked meanwhile
+                valid = serializer.is_valid()
+                if valid:
+                    serializer.save()
+                    job = enqueue_bill_mail(serializer.instance.bill) #PDF and email are sent by `manage.py run_workers`
+            if valid:
                 context['data'] = serializer.data
-                context['message'] = _(msg)
+                context['mail'] = job_status(job)
+                context['message'] = _('Transaction added!')
 
                 return Response(context, status = status.HTTP_201_CREATED)
             context ['error'] = serializer.errors
+        except serializers.ValidationError as e: #stock ran out while saving
+            context['error'] = e.detail
         except Exception as e:
             context['error'] = e
         context['message'] = _('Transaction was not added!')   
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class DoctorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'doctor'
+
+    def ready(self):
+        from doctor.signals import holiday_changed, hospital_staff_changed, staff_saved, staff_saving
+        post_save.connect(holiday_changed, sender = 'doctor.DoctorHoliday', dispatch_uid = 'holiday_saved')
+        post_delete.connect(holiday_changed, sender = 'doctor.DoctorHoliday', dispatch_uid = 'holiday_deleted')
+        pre_save.connect(staff_saving, sender = 'accounts.Account', dispatch_uid = 'availability_staff_saving')
+        post_save.connect(staff_saved, sender = 'accounts.Account', dispatch_uid = 'availability_staff_saved')
+        for label in ['accounts.Account', 'accounts.Roles', 'accounts.Department']:
+            post_delete.connect(hospital_staff_changed, sender = label, dispatch_uid = f'availability_deleted_{label}')
+        post_save.connect(hospital_staff_changed, sender = 'accounts.Roles', dispatch_uid = 'availability_role_saved')
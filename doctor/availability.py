@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+from threading import Lock
+from django.conf import settings
+from accounts.models import Account
+from administration.versions import bump_data_version, data_version
+from doctor.models import DoctorHoliday
+
+#Per-process copy of every hospital's doctors with one bit per day for the next AVAILABILITY_CACHE_DAYS days (bit set =
+#no holiday). It is versioned by a DataVersion row that holiday and staff writes bump in their own transaction, so a
+#lookup costs one primary-key read and a process rebuilds as soon as another one has committed a change.
+VERSION = 'doctor.availability' #DataVersion name
+BITMAPS = {} #hospital id -> (version, first day, {department id: [(doctor {id, name, email}, bitmap)]})
+BITMAPS_LOCK = Lock()
+TRACKED_FIELDS = ['name', 'email', 'roles', 'department', 'hospital'] #Account fields the bitmaps depend on
+
+#-----------------------------------INVALIDATION---------------------------------------------------
+def availability_changed(hospital_id):
+    #in the writer's transaction: readers see the new version and the new rows together
+    if hospital_id:
+        bump_data_version(VERSION, hospital_id)
+
+#-----------------------------------BITMAPS---------------------------------------------------
+def build_bitmaps(hospital_id, first_day):
+    days = settings.AVAILABILITY_CACHE_DAYS
+    last_day = first_day + timedelta(days = days - 1)
+    holidays = {}
+    for doctor_id, start_date, end_date in DoctorHoliday.objects.filter(hospital_id = hospital_id, start_date__lte = last_day,
+            end_date__gte = first_day).values_list('doctor_id', 'start_date', 'end_date'):
+        start = max((start_date - first_day).days, 0)
+        end = min((end_date - first_day).days, days - 1)
+        holidays[doctor_id] = holidays.get(doctor_id, 0) | ((1 << (end - start + 1)) - 1) << start
+    departments = {}
+    for doctor in Account.objects.filter(hospital_id = hospital_id, roles__name = 'doctor').order_by('id').values('id', 'name', 'email', 'department_id'):
+        department_id = doctor.pop('department_id')
+        departments.setdefault(department_id, []).append((doctor, ((1 << days) - 1) & ~holidays.get(doctor['id'], 0)))
+    return departments
+
+def hospital_bitmaps(hospital_id):
+    version = data_version(VERSION, hospital_id)
+    today = date.today()
+    bitmaps = BITMAPS.get(hospital_id)
+    if bitmaps is None or bitmaps[0] != version or bitmaps[1] != today:
+        with BITMAPS_LOCK:
+            bitmaps = BITMAPS.get(hospital_id)
+            if bitmaps is None or bitmaps[0] != version or bitmaps[1] != today:
+                bitmaps = (version, today, build_bitmaps(hospital_id, today))
+                BITMAPS[hospital_id] = bitmaps
+    return bitmaps
+
+def available_doctors(department_id, appointment_date, hospital_id):
+    #[{id, name, email}] of the department's doctors without a holiday on the date, None outside the cached days
+    version, first_day, departments = hospital_bitmaps(hospital_id)
+    day = (appointment_date - first_day).days
+    if not 0 <= day < settings.AVAILABILITY_CACHE_DAYS:
+        return None
+    try:
+        department_id = int(department_id)
+    except (TypeError, ValueError):
+        return []
+    return [doctor for doctor, bitmap in departments.get(department_id, []) if bitmap >> day & 1]
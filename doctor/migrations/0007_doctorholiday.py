@@ -0,0 +1,77 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:09
+
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def holidays_to_rows(apps, schema_editor):
+    #{"date": [...]} lists -> one DoctorHoliday per run of consecutive dates
+    DoctorAvailability = apps.get_model('doctor', 'DoctorAvailability')
+    DoctorHoliday = apps.get_model('doctor', 'DoctorHoliday')
+    holidays = []
+    for availability in DoctorAvailability.objects.all().iterator():
+        dates = set()
+        for value in (availability.not_available or {}).get('date', []):
+            try:
+                dates.add(datetime.strptime(value, "%Y-%m-%d").date())
+            except (TypeError, ValueError):
+                pass
+        start = end = None
+        for day in sorted(dates):
+            if end is not None and day == end + timedelta(days = 1):
+                end = day
+                continue
+            if start is not None:
+                holidays.append(DoctorHoliday(doctor_id = availability.doctor_id, start_date = start, end_date = end, hospital_id = availability.hospital_id))
+            start = end = day
+        if start is not None:
+            holidays.append(DoctorHoliday(doctor_id = availability.doctor_id, start_date = start, end_date = end, hospital_id = availability.hospital_id))
+    DoctorHoliday.objects.bulk_create(holidays, batch_size = 1000)
+
+def rows_to_holidays(apps, schema_editor):
+    DoctorAvailability = apps.get_model('doctor', 'DoctorAvailability')
+    DoctorHoliday = apps.get_model('doctor', 'DoctorHoliday')
+    for availability in DoctorAvailability.objects.all().iterator():
+        dates = []
+        for holiday in DoctorHoliday.objects.filter(doctor_id = availability.doctor_id).order_by('start_date'):
+            dates.extend((holiday.start_date + timedelta(days = day)).strftime("%Y-%m-%d") for day in range((holiday.end_date - holiday.start_date).days + 1))
+        availability.not_available = {'date': dates}
+        availability.save(update_fields = ['not_available'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0011_rename_timestamp_otp_generated_time'),
+        ('doctor', '0006_auto_20220805_1132'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorHoliday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='Start Date')),
+                ('end_date', models.DateField(verbose_name='End Date')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='doctorholiday',
+            index=models.Index(fields=['doctor', 'start_date', 'end_date'], name='doctor_doct_doctor__02da98_idx'),
+        ),
+        migrations.RunPython(holidays_to_rows, rows_to_holidays),
+        migrations.AlterField( #a default lets the field be added back to existing rows when migrating backwards
+            model_name='doctoravailability',
+            name='not_available',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RemoveField(
+            model_name='doctoravailability',
+            name='not_available',
+        ),
+    ]
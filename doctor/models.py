@@ -4,12 +4,23 @@ from registration.models import Appointment
 from django.utils.translation import gettext_lazy as _
 # Create your models here.
 class DoctorAvailability(models.Model):
+    doctor = models.ForeignKey(Account, on_delete = models.CASCADE) #one row per doctor, holidays are DoctorHoliday rows
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
+
+    def __str__(self):
+        return str(self.doctor)
+
+class DoctorHoliday(models.Model):
     doctor = models.ForeignKey(Account, on_delete = models.CASCADE)
-    not_available = models.JSONField()
+    start_date = models.DateField(verbose_name = _('Start Date'))
+    end_date = models.DateField(verbose_name = _('End Date')) #same as start_date for a single day
     hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
 
+    class Meta:
+        indexes = [models.Index(fields = ['doctor', 'start_date', 'end_date'])]
+
     def __str__(self):
-        return self.not_available
+        return f"{self.start_date} - {self.end_date}"
 
 class Diagnosis(models.Model):
     appointment = models.ForeignKey(Appointment, on_delete = models.CASCADE)
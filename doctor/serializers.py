@@ -1,30 +1,45 @@
+from datetime import timedelta
 from rest_framework import serializers
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
-from dispensary.models import Medicine
-from doctor.models import Diagnosis, DoctorAvailability
+from administration.serializers import ReadSerializerMixin, SparseFieldsMixin
+from dispensary.serializers import validate_medicine_lines
+from dispensary.stock import reserve_diagnosis, reserved_for
+from doctor.models import Diagnosis, DoctorAvailability, DoctorHoliday
 
 class DoctorAvailabilitySerializer(serializers.ModelSerializer):
+    related_fields = ['doctor', 'hospital']
+    not_available = serializers.SerializerMethodField()
 
     class Meta:
         model = DoctorAvailability
         fields = '__all__'
         extra_kwargs = {
             'doctor': {'required': True},
-            'not_available': {'required': True},
             'hospital': {'required': False, 'read_only': True}
         }
 
+    def get_not_available(self, instance):
+        #same {"date": [sorted yyyy-mm-dd]} as the JSON list it replaced, holiday ranges expanded
+        dates = []
+        for start_date, end_date in DoctorHoliday.objects.filter(doctor_id = instance.doctor_id).order_by('start_date').values_list('start_date', 'end_date'):
+            dates.extend((start_date + timedelta(days = day)).strftime("%Y-%m-%d") for day in range((end_date - start_date).days + 1))
+        return {'date': dates}
+
     def to_representation(self, instance):
-        self.fields['doctor'] =  serializers.StringRelatedField(read_only = True)                 
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+        return DoctorAvailabilityReadSerializer(context = self.context).to_representation(instance)
 
     def validate(self, validated_data):
         validated_data['hospital'] = self.context.get("hospital")
         return validated_data
 
 
-class DiagnosisSerializer(serializers.ModelSerializer):
+class DoctorAvailabilityReadSerializer(ReadSerializerMixin, DoctorAvailabilitySerializer):
+    pass
+
+
+class DiagnosisSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    related_fields = ['appointment', 'hospital']
     
     class Meta:
         model = Diagnosis
@@ -48,31 +63,26 @@ class DiagnosisSerializer(serializers.ModelSerializer):
 
     def validate_medicine(self, value):
         medicine_list = []
-        medicine_id = []
-        for medicine in value:
-            try:
-                if not medicine.get('id', None): raise serializers.ValidationError(('No Medicine ID provided!'))
-                id = int(medicine['id'])
-                qty = int(medicine.get('qty', 1))
-                direction = medicine.get('direction', "No direction provided")
-                medicine = Medicine.objects.get(pk = id, hospital = self.context.get("user").hospital)
-                if qty > medicine.quantity:
-                    raise serializers.ValidationError(_(f'Quantity cannot be more than {medicine.quantity}, for Medicine ID: {id}!'))
-                if qty < 1:
-                    raise serializers.ValidationError(_(f'Quantity cannot be less than 1, for Medicine ID: {id}!'))
-                if id not in medicine_id:
-                    medicine_list.append({'id' : medicine.id, 'name' : medicine.name, 'qty' : qty, 'direction' : direction})
-                    medicine_id.append(id)
-                else:
-                    raise serializers.ValidationError(_(f'Medicine ID: {id} is added more than once!'))    
-            except Medicine.DoesNotExist:
-                raise serializers.ValidationError(_(f'Medicine ID: {id} is not correct!'))    
+        #units this diagnosis already holds count as available when it is edited
+        for medicine, qty, line in validate_medicine_lines(value, self.context.get("user").hospital, reserved_for(self.instance)):
+            direction = line.get('direction', "No direction provided")
+            medicine_list.append({'id' : medicine.id, 'name' : medicine.name, 'qty' : qty, 'direction' : direction})
         return medicine_list    
 
+    def create(self, validated_data):
+        with transaction.atomic(): #no diagnosis without its reservation
+            instance = super().create(validated_data)
+            reserve_diagnosis(instance)
+        return instance
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            reserve_diagnosis(instance)
+        return instance
+
     def to_representation(self, instance):
-        self.fields['appointment'] =  serializers.StringRelatedField(read_only = True)               
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+        return DiagnosisReadSerializer(context = self.context, fields = self.sparse_fields).to_representation(instance)
 
     def validate(self, validated_data):
         validated_data['hospital'] = self.context.get("user").hospital
@@ -80,3 +90,7 @@ class DiagnosisSerializer(serializers.ModelSerializer):
 
 
            
+
+
+class DiagnosisReadSerializer(ReadSerializerMixin, DiagnosisSerializer):
+    pass
@@ -0,0 +1,24 @@
+from accounts.models import Account
+from doctor.availability import TRACKED_FIELDS, availability_changed
+
+
+def holiday_changed(sender, instance, **kwargs):
+    availability_changed(instance.hospital_id)
+
+def staff_saving(sender, instance, update_fields = None, **kwargs):
+    #compared before the UPDATE, acted on in staff_saved; last_login-only saves skip the lookup
+    if update_fields is not None and not set(update_fields) & set(TRACKED_FIELDS + [field + '_id' for field in TRACKED_FIELDS]):
+        return
+    before = Account.objects.filter(pk = instance.pk).values('name', 'email', 'roles_id', 'department_id', 'hospital_id').first() if instance.pk else None
+    after = {'name': instance.name, 'email': instance.email, 'roles_id': instance.roles_id, 'department_id': instance.department_id,
+             'hospital_id': instance.hospital_id}
+    instance._availability_hospitals = set() if before == after else {instance.hospital_id, before and before['hospital_id']}
+
+def staff_saved(sender, instance, **kwargs):
+    for hospital_id in getattr(instance, '_availability_hospitals', ()):
+        availability_changed(hospital_id)
+    instance._availability_hospitals = set()
+
+def hospital_staff_changed(sender, instance, **kwargs):
+    #deleted staff, renamed/deleted roles, deleted departments (their staff is SET_NULL without signals)
+    availability_changed(instance.hospital_id)
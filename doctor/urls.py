@@ -12,6 +12,7 @@ router.register('api/diagnosis', views.DiagnosisView, basename='api_diagnosis')
 urlpatterns = [
     path('api/availability/', views.DoctorAvailabilityView.as_view({'get':'list','post':'create'}), name = "api_availability"),
     path('api/availability/doctors/', views.DoctorAvailabilityView.as_view({'get':'get_doctors_availability'}), name = "api_doctors_availability"),
+    path('api/availability/calendar/', views.DoctorAvailabilityView.as_view({'get':'calendar'}), name = "api_availability_calendar"),
     path('api/availability/holiday/<str:date_delete>/', views.DoctorAvailabilityView.as_view({'delete':'destroy'}), name = "api_availability"),
 ]
 
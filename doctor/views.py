@@ -1,28 +1,70 @@
-from bisect import bisect_left
+from django.conf import settings
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework import status, viewsets
+from rest_framework import serializers, status, viewsets
 from accounts.models import Account
-from administration.serializers import DoctorSerializer
-from administration.views import get_conditions, pagination_datatable
+from administration.counts import cap_counts, cached_count
+from administration.views import get_fields, get_only_fields, get_search_condition, pagination_datatable, select_related_fields
 from django.utils.translation import gettext_lazy as _
 from accounts.permissions import IsDoctor, IsRegistrationOrDoctor
+from dispensary.autocomplete import autocomplete
 from dispensary.models import Medicine
-from dispensary.serializers import MedicineSerializer
-from doctor.models import Diagnosis, DoctorAvailability
-from doctor.serializers import DiagnosisSerializer, DoctorAvailabilitySerializer
-from datetime import datetime
+from dispensary.serializers import MedicineReadSerializer
+from doctor.availability import available_doctors
+from doctor.models import Diagnosis, DoctorAvailability, DoctorHoliday
+from doctor.serializers import DiagnosisReadSerializer, DiagnosisSerializer, DoctorAvailabilityReadSerializer, DoctorAvailabilitySerializer
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.db.models import Count
+from registration.capacity import limit_of
 from registration.models import Appointment
-from registration.serializers import AppointmentSerializer, TokenSerializer
+from registration.queue import changes_since, parse_version, queue_changes
+from registration.serializers import AppointmentReadSerializer, TokenReadSerializer, TokenSerializer
 
 # Create your views here.
 #-----------------------------------DOCTOR_AVAILABILITY METHODS---------------------------------------------------   
 
 def doctor_availability(department_id, appointment_date, hospital):
+    #department doctors without a holiday covering the date, one range lookup on the (doctor, start_date, end_date) index
     doctors_dept = Account.objects.filter(department__id = department_id, roles__name = 'doctor', hospital = hospital)
-    available_doctors_id = DoctorAvailability.objects.exclude(doctor__in = doctors_dept, not_available__date__contains = appointment_date).values_list('doctor')
-    return doctors_dept.filter(id__in = available_doctors_id).order_by('id')   
+    on_holiday = DoctorHoliday.objects.filter(doctor__in = doctors_dept, start_date__lte = appointment_date, end_date__gte = appointment_date).values('doctor')
+    return doctors_dept.exclude(id__in = on_holiday).order_by('id')   
+
+def available_doctor_list(department_id, appointment_date, hospital):
+    #[{id, name, email}] from the in-memory bitmaps, the database only for dates beyond AVAILABILITY_CACHE_DAYS
+    if isinstance(appointment_date, str):
+        appointment_date = datetime.strptime(appointment_date, "%Y-%m-%d").date()
+    doctors = available_doctors(department_id, appointment_date, hospital.id)
+    if doctors is None:
+        doctors = list(doctor_availability(department_id, appointment_date, hospital).values('id', 'name', 'email'))
+    return doctors
+
+def is_doctor_available(doctor_id, department_id, appointment_date, hospital):
+    return int(doctor_id) in {doctor['id'] for doctor in available_doctor_list(department_id, appointment_date, hospital)}
+
+def doctor_calendar(department_id, start_date, end_date, hospital):
+    #[{id, name, email, days: [{date, available, slots}]}] of the department's doctors for every day of the range:
+    #three queries (doctors, their holidays in the range, appointments grouped by doctor and day) whatever the range
+    doctors = list(Account.objects.filter(department__id = department_id, roles__name = 'doctor', hospital = hospital).order_by('id').values(
+                   'id', 'name', 'email', 'daily_appointments', 'department__daily_appointments'))
+    doctor_ids = [doctor['id'] for doctor in doctors]
+    holidays = {}
+    for doctor_id, start, end in DoctorHoliday.objects.filter(doctor__in = doctor_ids, start_date__lte = end_date, end_date__gte = start_date).values_list(
+            'doctor_id', 'start_date', 'end_date'):
+        holidays.setdefault(doctor_id, []).append((start, end))
+    booked = {(row['doctor_id'], row['appointment_date']): row['count'] for row in Appointment.objects.filter(doctor__in = doctor_ids,
+              appointment_date__range = (start_date, end_date)).values('doctor_id', 'appointment_date').annotate(count = Count('id'))}
+    days = [start_date + timedelta(days = day) for day in range((end_date - start_date).days + 1)]
+    for doctor in doctors:
+        ranges = holidays.get(doctor['id'], [])
+        limit = limit_of(doctor.pop('daily_appointments'), doctor.pop('department__daily_appointments'))
+        doctor['days'] = []
+        for day in days:
+            available = not any(start <= day <= end for start, end in ranges)
+            slots = max(limit - booked.get((doctor['id'], day), 0), 0) if available else 0
+            doctor['days'].append({'date': day.strftime("%Y-%m-%d"), 'available': available, 'slots': slots})
+    return doctors
 
 #-----------------------------------DOCTOR_AVAILABILITY---------------------------------------------------   
 
@@ -36,8 +78,8 @@ class DoctorAvailabilityView(viewsets.ModelViewSet):
     def list(self, request):
         context = {}
         try: 
-            doctor_avail_data = self.queryset.filter(doctor__id = request.user.id)
-            serializer = DoctorAvailabilitySerializer(doctor_avail_data, many = True)
+            doctor_avail_data = select_related_fields(self.queryset.filter(doctor__id = request.user.id), DoctorAvailabilityReadSerializer)
+            serializer = DoctorAvailabilityReadSerializer(doctor_avail_data, many = True)
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
@@ -45,6 +87,7 @@ class DoctorAvailabilityView(viewsets.ModelViewSet):
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
     def create(self, request):
+        #{"date": yyyy-mm-dd, "end_date": yyyy-mm-dd (optional, for a range of days)}
         context = {}
         not_avail_date = request.data.get('date')
         if not not_avail_date:
@@ -52,85 +95,95 @@ class DoctorAvailabilityView(viewsets.ModelViewSet):
             return Response(context, status = status.HTTP_400_BAD_REQUEST)
         try:
             not_avail_date = datetime.strptime(not_avail_date, "%Y-%m-%d").date()
-            if not_avail_date < datetime.now().date():
-                context['error'] = {"date": [_("You cannot have holiday in past, invent Time Machine!")]} 
-                return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            not_avail_date = not_avail_date.strftime("%Y-%m-%d")                    
+            end_date = datetime.strptime(request.data.get('end_date') or not_avail_date.strftime("%Y-%m-%d"), "%Y-%m-%d").date()
         except Exception:
             context['error'] = {"date": [_("Not in format yyyy-mm-dd or incorrect date!")]} 
             return Response(context, status = status.HTTP_400_BAD_REQUEST)
-        data = {}
-        data['doctor'] = request.user.id
-        not_available = {}
-        not_available['date'] = []
+        if not_avail_date < datetime.now().date():
+            context['error'] = {"date": [_("You cannot have holiday in past, invent Time Machine!")]} 
+            return Response(context, status = status.HTTP_400_BAD_REQUEST)
+        if end_date < not_avail_date or (end_date - not_avail_date).days >= 366:
+            context['error'] = {"end_date": [_("End date must be within a year on or after the date!")]} 
+            return Response(context, status = status.HTTP_400_BAD_REQUEST)
         try:
-            try: #Append date
-                doctor_avail_data = self.queryset.get(doctor__id = request.user.id)
-                not_available['date'] = doctor_avail_data.not_available['date'][:] #slicing for shallow copy
-                insert_index = bisect_left(not_available['date'], not_avail_date)
-                if insert_index != len(not_available['date']) and not_available['date'][insert_index] == not_avail_date:
-                        context['error'] = {"date": [_("Already Exists!")]} 
-                        return Response(context, status = status.HTTP_400_BAD_REQUEST)                        
-                not_available['date'].insert(insert_index, not_avail_date)
-                data['not_available'] = not_available
-                serializer = DoctorAvailabilitySerializer(doctor_avail_data, data = data)
-            except DoctorAvailability.DoesNotExist: #Create
-                not_available['date'].append(not_avail_date)
-                data['not_available'] = not_available   
-                serializer = DoctorAvailabilitySerializer(data = data)
-            serializer.context["hospital"] = request.user.hospital
-            if serializer.is_valid():
-                serializer.save()
-                context['data'] = serializer.data
-                context['message'] = _(f'Holiday added!') 
-                return Response(context, status = status.HTTP_201_CREATED)
-            context ['error'] = serializer.errors
+            with transaction.atomic():
+                doctor_avail_data, created = self.queryset.get_or_create(doctor = request.user, defaults = {'hospital': request.user.hospital})
+                self.queryset.select_for_update().get(pk = doctor_avail_data.pk) #one holiday change per doctor at a time
+                if DoctorHoliday.objects.filter(doctor = request.user, start_date__lte = end_date, end_date__gte = not_avail_date).exists():
+                    context['error'] = {"date": [_("Already Exists!")]} 
+                    return Response(context, status = status.HTTP_400_BAD_REQUEST)
+                DoctorHoliday.objects.create(doctor = request.user, start_date = not_avail_date, end_date = end_date, hospital = request.user.hospital)
+            context['data'] = DoctorAvailabilitySerializer(doctor_avail_data).data
+            context['message'] = _(f'Holiday added!') 
+            return Response(context, status = status.HTTP_201_CREATED)
         except Exception as e:
             context['error'] = e
         context['message'] = _('Holiday could not be added!')   
         return Response(context, status = status.HTTP_400_BAD_REQUEST)
 
     def destroy(self, request, date_delete = None):
+        #removes one day, a range holding it is shortened or split in two
         context = {}
-        data = {}
-        data['doctor'] = request.user.id
-        not_available = {}
-        not_available['date'] = []
         if not date_delete:
             context['error'] = {"date": [_("No Date Provided to delete!")]} 
             return Response(context, status = status.HTTP_400_BAD_REQUEST)
         try:
-            date_delete = datetime.strptime(date_delete, "%Y-%m-%d").date().strftime("%Y-%m-%d")
+            date_delete = datetime.strptime(date_delete, "%Y-%m-%d").date()
         except Exception:
             context['error'] = {"date": [_("Not in format yyyy-mm-dd or incorrect date!")]} 
             return Response(context, status = status.HTTP_400_BAD_REQUEST)    
         try:
             try:     
                 doctor_avail_data = self.queryset.get(doctor__id = request.user.id)
-                not_available['date'] = doctor_avail_data.not_available['date'][:] #slicing for shallow copy
-                delete_index = bisect_left(not_available['date'], date_delete)
-                if delete_index != len(not_available['date']) and not_available['date'][delete_index] == date_delete:
-                    not_available['date'].pop(delete_index)
-                    data['not_available'] = not_available     
-                    serializer = DoctorAvailabilitySerializer(doctor_avail_data, data = data) 
-                else:
-                    context['error'] = {"date": [f"date: {date_delete} does not exists!"]} 
-                    return Response(context, status = status.HTTP_400_BAD_REQUEST)  
             except DoctorAvailability.DoesNotExist:
                 context['error'] = {"date": [_("No Holidays are recorded!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer.context["hospital"] = request.user.hospital
-            if serializer.is_valid():
-                serializer.save()
-                context['data'] = serializer.data
-                context['message'] =  _(f"date: {date_delete} deleted!")
-                return Response(context, status = status.HTTP_204_NO_CONTENT)
-            context ['error'] = serializer.errors     
+            with transaction.atomic():
+                self.queryset.select_for_update().get(pk = doctor_avail_data.pk)
+                holiday = DoctorHoliday.objects.filter(doctor = request.user, start_date__lte = date_delete, end_date__gte = date_delete).first()
+                if holiday is None:
+                    context['error'] = {"date": [f"date: {date_delete} does not exists!"]} 
+                    return Response(context, status = status.HTTP_400_BAD_REQUEST)  
+                if holiday.start_date == holiday.end_date:
+                    holiday.delete()
+                elif date_delete == holiday.start_date:
+                    holiday.start_date += timedelta(days = 1)
+                    holiday.save()
+                else:
+                    if date_delete < holiday.end_date:
+                        DoctorHoliday.objects.create(doctor = request.user, start_date = date_delete + timedelta(days = 1), end_date = holiday.end_date,
+                                                     hospital = holiday.hospital)
+                    holiday.end_date = date_delete - timedelta(days = 1)
+                    holiday.save()
+            context['data'] = DoctorAvailabilitySerializer(doctor_avail_data).data
+            context['message'] =  _(f"date: {date_delete} deleted!")
+            return Response(context, status = status.HTTP_204_NO_CONTENT)
         except Exception as e:
             context['error'] = e
         context['message'] = _(f"date: {date_delete} not deleted!")
         return Response(context, status = status.HTTP_400_BAD_REQUEST)
 
+    @action(detail = False, methods = ['get'])
+    def calendar(self, request):
+        #?dept_no=&start_date=yyyy-mm-dd&end_date=yyyy-mm-dd: availability and free slots of every doctor on every day
+        context = {}
+        try:
+            dept_no = request.query_params.get('dept_no', None)
+            try:
+                start_date = datetime.strptime(request.query_params.get('start_date', None), "%Y-%m-%d").date()
+                end_date = datetime.strptime(request.query_params.get('end_date', None), "%Y-%m-%d").date()
+            except Exception:
+                context['error'] = {"date": [_("Not in format yyyy-mm-dd or incorrect date!")]} 
+                return Response(context, status = status.HTTP_400_BAD_REQUEST)
+            if end_date < start_date or (end_date - start_date).days >= settings.AVAILABILITY_CALENDAR_MAX_DAYS:
+                context['error'] = {"end_date": [_(f"End date must be within {settings.AVAILABILITY_CALENDAR_MAX_DAYS} days on or after the start date!")]} 
+                return Response(context, status = status.HTTP_400_BAD_REQUEST)
+            context['data'] = doctor_calendar(dept_no, start_date, end_date, request.user.hospital)
+            return Response(context, status = status.HTTP_200_OK)
+        except Exception as e:
+            context['error'] = e
+            return Response(context, status = status.HTTP_404_NOT_FOUND)
+
     @action(detail = False, methods = ['get'])
     def get_doctors_availability(self, request):
         context = {}
@@ -145,9 +198,7 @@ class DoctorAvailabilityView(viewsets.ModelViewSet):
                 context['error'] = {"date": [_("Not in format yyyy-mm-dd or incorrect date!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
 
-            available_doctors = doctor_availability(dept_no,appointment_date, request.user.hospital)
-            serializer = DoctorSerializer(available_doctors, many = True)
-            context['data'] = serializer.data
+            context['data'] = available_doctor_list(dept_no, appointment_date, request.user.hospital)
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
@@ -180,6 +231,7 @@ class DoctorAppointmentView(viewsets.ModelViewSet):
             rows_per_page = int(request.query_params.get('length', None)) #row length that we select in dropdown
             start_index = int(request.query_params.get('start', None)) #starting index
             search_value = request.query_params.get('search[value]', '').strip() #search value
+            estimated = request.query_params.get('count_mode', 'exact').strip() == 'estimated' #bounded counts for very large tables
             sort_column_index = int(request.query_params.get('order[0][column]', None)[0]) #which column was sorted
             sort_direction = (request.query_params.get('order[0][dir]', 'asc')[0]).strip() #contains values -> asc/desc
             sort_column_name = columns[sort_column_index]
@@ -189,9 +241,9 @@ class DoctorAppointmentView(viewsets.ModelViewSet):
             context['data'] = self.queryset #queryset
             if hospital:
                 context['data'] = context['data'].filter(hospital = hospital, doctor = request.user)
-            context['recordsTotal'] = context['data'].count() #Total Record count
+            context['recordsTotal'] = cached_count(context['data'], request.user.hospital, estimated) #Total Record count
 
-            search_condition = get_conditions(search_value, columns, date_columns, fk_columns)
+            search_condition = get_search_condition(Appointment, request.user.hospital, search_value, columns, date_columns, fk_columns)
             if search_condition:
                 context['data'] = context['data'].filter(search_condition)
 
@@ -202,10 +254,13 @@ class DoctorAppointmentView(viewsets.ModelViewSet):
             elif date_filter[1]:
                 context['data'] = context['data'].filter(**{date_col_filter + '__lte' : date_filter[1]})
 
-            context['recordsFiltered'] = context['data'].count() #Filtered record count
+            context['recordsFiltered'] = cached_count(context['data'], request.user.hospital, estimated) #Filtered record count
+            if estimated:
+                cap_counts(context, start_index, rows_per_page)
+            context['data'] = select_related_fields(context['data'], AppointmentReadSerializer)
             context['data'] = context['data'].order_by(sort_column_name)[start_index : (start_index + rows_per_page)] #One Page Data
             #------------------
-            serializer = AppointmentSerializer(context['data'], many = True)
+            serializer = AppointmentReadSerializer(context['data'], many = True)
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
@@ -216,11 +271,11 @@ class DoctorAppointmentView(viewsets.ModelViewSet):
         context = {}
         try:
             try:     
-                appointment_data = self.queryset.get(id = pk, hospital = request.user.hospital, doctor = request.user)
+                appointment_data = select_related_fields(self.queryset, AppointmentReadSerializer).get(id = pk, hospital = request.user.hospital, doctor = request.user)
             except Appointment.DoesNotExist:
                 context['error'] = {"id": [_(f"ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = AppointmentSerializer(appointment_data)    
+            serializer = AppointmentReadSerializer(appointment_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -248,36 +303,54 @@ class DoctorTokenView(viewsets.ModelViewSet):
             rows_per_page = int(request.query_params.get('length', None)) #row length that we select in dropdown
             start_index = int(request.query_params.get('start', None)) #starting index
             search_value = request.query_params.get('search[value]', '').strip() #search value
+            estimated = request.query_params.get('count_mode', 'exact').strip() == 'estimated' #bounded counts for very large tables
 
             #--------data--------
             today = datetime.now().date().strftime("%Y-%m-%d")
             context['data'] = self.queryset.filter(hospital = request.user.hospital, appointment_date = today, doctor = request.user)
-            context['recordsTotal'] = context['data'].count() #Total Record count
-            search_condition = get_conditions(search_value, columns, [], fk_columns)
+            context['recordsTotal'] = cached_count(context['data'], request.user.hospital, estimated) #Total Record count
+            search_condition = get_search_condition(Appointment, request.user.hospital, search_value, columns, [], fk_columns)
 
             if search_condition:
                 context['data'] = context['data'].filter(search_condition)
 
-            context['recordsFiltered'] = context['data'].count() #Filtered record count
+            context['recordsFiltered'] = cached_count(context['data'], request.user.hospital, estimated) #Filtered record count
+            if estimated:
+                cap_counts(context, start_index, rows_per_page)
+            context['data'] = select_related_fields(context['data'], TokenReadSerializer)
             context['data'] = context['data'].order_by('-present', 'id')[start_index : (start_index + rows_per_page)] #One Page Data
             #------------------
-            serializer = TokenSerializer(context['data'], many = True)
+            serializer = TokenReadSerializer(context['data'], many = True)
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'])
+    def changes(self, request):
+        #?version=N: changes of this doctor's tokens on today's queue after version N (registration.queue); answers at once, the
+        #waiting long-poll on this URL is served by the ASGI application without holding a worker thread
+        context = {}
+        try:
+            since = parse_version(request.query_params.get('version'))
+            version, events = changes_since(request.user.hospital_id, since)
+            context['data'] = queue_changes(version, events, request.user.id)
+            return Response(context, status = status.HTTP_200_OK)
+        except Exception as e:
+            context['error'] = e
+            return Response(context, status = status.HTTP_400_BAD_REQUEST)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:
                 today = datetime.now().date().strftime("%Y-%m-%d")     
-                appointment_data = self.queryset.get(id = pk, hospital = request.user.hospital, appointment_date = today, doctor = request.user)
+                appointment_data = select_related_fields(self.queryset, AppointmentReadSerializer).get(id = pk, hospital = request.user.hospital, appointment_date = today, doctor = request.user)
             except Appointment.DoesNotExist:
                 context['error'] = {"id": [_(f"ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = AppointmentSerializer(appointment_data)    
+            serializer = AppointmentReadSerializer(appointment_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -305,7 +378,8 @@ class DoctorTokenView(viewsets.ModelViewSet):
             serializer.context["hospital"] = request.user.hospital
             
             if serializer.is_valid():
-                serializer.save()
+                with transaction.atomic(): #the token and its queue event commit together
+                    serializer.save()
                 if diagnosed:
                     context['message'] =  _(f'Appointment: {serializer.data["id"]} diagnosed!')
                 else:
@@ -342,23 +416,29 @@ class DiagnosisView(viewsets.ModelViewSet):
             rows_per_page = int(request.query_params.get('length', None)) #row length that we select in dropdown
             start_index = int(request.query_params.get('start', None)) #starting index
             search_value = request.query_params.get('search[value]', '').strip() #search value
+            estimated = request.query_params.get('count_mode', 'exact').strip() == 'estimated' #bounded counts for very large tables
             sort_column_index = int(request.query_params.get('order[0][column]', None)[0]) #which column was sorted
             sort_direction = (request.query_params.get('order[0][dir]', 'asc')[0]).strip() #contains values -> asc/desc
             sort_column_name = columns[sort_column_index]
             if sort_direction == 'desc': 
                 sort_column_name = '-' + sort_column_name # - for descending
             #--------data--------
+            fields = get_fields(request.query_params, DiagnosisReadSerializer, defer = ['medicine', 'symptoms']) #heavy columns only on retrieve
             context['data'] = self.queryset.filter(appointment__doctor = request.user, hospital = request.user.hospital)
-            context['recordsTotal'] = context['data'].count() #Total Record count
-            search_condition = get_conditions(search_value, columns, exclude = exclude)
+            context['data'] = context['data'].only(*get_only_fields(Diagnosis, fields, sort_column_name.lstrip('-')))
+            context['recordsTotal'] = cached_count(context['data'], request.user.hospital, estimated) #Total Record count
+            search_condition = get_search_condition(Diagnosis, request.user.hospital, search_value, columns, exclude = exclude)
 
             if search_condition:
                 context['data'] = context['data'].filter(search_condition)
             
-            context['recordsFiltered'] = context['data'].count() #Filtered record count
+            context['recordsFiltered'] = cached_count(context['data'], request.user.hospital, estimated) #Filtered record count
+            if estimated:
+                cap_counts(context, start_index, rows_per_page)
+            context['data'] = select_related_fields(context['data'], DiagnosisReadSerializer, fields)
             context['data'] = context['data'].order_by(sort_column_name)[start_index : (start_index + rows_per_page)] #One Page Data
             #------------------
-            serializer = DiagnosisSerializer(context['data'], many = True)
+            serializer = DiagnosisReadSerializer(context['data'], many = True, fields = fields)
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
@@ -369,11 +449,11 @@ class DiagnosisView(viewsets.ModelViewSet):
         context = {}
         try:
             try:     
-                diagnosis_data = self.queryset.get(id = pk, appointment__doctor = request.user, hospital = request.user.hospital)
+                diagnosis_data = select_related_fields(self.queryset, DiagnosisReadSerializer).get(id = pk, appointment__doctor = request.user, hospital = request.user.hospital)
             except Diagnosis.DoesNotExist:
                 context['error'] = {"id": [_(f"Diagnosis ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = DiagnosisSerializer(diagnosis_data)    
+            serializer = DiagnosisReadSerializer(diagnosis_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -393,6 +473,8 @@ class DiagnosisView(viewsets.ModelViewSet):
                 context['message'] = _(f'Diagnosis added!') 
                 return Response(context, status = status.HTTP_201_CREATED)
             context ['error'] = serializer.errors
+        except serializers.ValidationError as e: #medicines reserved by another diagnosis meanwhile
+            context['error'] = e.detail
         except Exception as e:
             context['error'] = e
         context['message'] = _('Diagnosis was not added!')   
@@ -417,6 +499,8 @@ class DiagnosisView(viewsets.ModelViewSet):
                 context['message'] =  _(f'Diagnosis: {serializer.data["id"]} updated!')
                 return Response(context, status = status.HTTP_200_OK) 
             context ['error'] = serializer.errors
+        except serializers.ValidationError as e: #not enough stock for the added medicines
+            context['error'] = e.detail
         except Exception as e:
             context['error'] = e
         context['message'] = _('Diagnosis was not updated!')
@@ -445,12 +529,29 @@ class DiagnosisView(viewsets.ModelViewSet):
             name = request.query_params.get('name', None)
             medicine_data = None
             if name:
-                medicine_data = Medicine.objects.filter(name__icontains = name, quantity__gt = 0,hospital = request.user.hospital)
+                medicine_data = Medicine.objects.filter(name__icontains = name, available__gt = 0,hospital = request.user.hospital)
             else:
-                medicine_data = Medicine.objects.filter(quantity__gt = 0, hospital = request.user.hospital)
-            serializer = MedicineSerializer(medicine_data, many = True)    
+                medicine_data = Medicine.objects.filter(available__gt = 0, hospital = request.user.hospital)
+            medicine_data = select_related_fields(medicine_data, MedicineReadSerializer)
+            serializer = MedicineReadSerializer(medicine_data, many = True)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
             context['error'] = e
         return Response(context, status = status.HTTP_400_BAD_REQUEST)
+
+    @action(detail = False, methods = ['get'])
+    def medicine_autocomplete(self, request):
+        #?name=<typed prefix>&start=&limit=: top in stock matches as {id, name, quantity} from the in-memory prefix index
+        context = {}
+        try:
+            name = request.query_params.get('name', '')
+            start = max(int(request.query_params.get('start', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', settings.AUTOCOMPLETE_LIMIT)), 1), settings.AUTOCOMPLETE_MAX_LIMIT)
+            context['data'], context['more'] = autocomplete(request.user.hospital_id, name, start, limit)
+            return Response(context, status = status.HTTP_200_OK)
+        except ValueError:
+            context['error'] = {"limit": [_("Start and limit must be numbers!")]}
+        except Exception as e:
+            context['error'] = e
+        return Response(context, status = status.HTTP_400_BAD_REQUEST)
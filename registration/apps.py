@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class RegistrationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'registration'
+
+    def ready(self):
+        from registration.signals import appointment_deleted, appointment_saved, appointment_saving
+        post_delete.connect(appointment_deleted, sender = 'registration.Appointment', dispatch_uid = 'appointment_deleted')
+        pre_save.connect(appointment_saving, sender = 'registration.Appointment', dispatch_uid = 'appointment_saving')
+        post_save.connect(appointment_saved, sender = 'registration.Appointment', dispatch_uid = 'appointment_saved')
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db.models import F
+from registration.models import Appointment, DoctorDayCount
+
+#Booking capacity: one DoctorDayCount row per doctor and day, taken and given back with conditional UPDATEs so the
+#database decides between receptionists booking the last slot at the same time.
+
+#-----------------------------------LIMITS---------------------------------------------------
+def limit_of(doctor_limit, department_limit):
+    for limit in [doctor_limit, department_limit]:
+        if limit is not None:
+            return limit
+    return settings.APPOINTMENTS_PER_DOCTOR_DAY
+
+def daily_limit(doctor):
+    return limit_of(doctor.daily_appointments, doctor.department.daily_appointments if doctor.department_id else None)
+
+#-----------------------------------COUNTERS---------------------------------------------------
+def book_slot(doctor, appointment_date, hospital):
+    #True when a slot was taken; run it in the transaction that saves the appointment, so a failed save gives it back
+    slot = DoctorDayCount.objects.filter(doctor = doctor, appointment_date = appointment_date)
+    if not slot.exists(): #first booking of the day, counted once from what is already booked (seeded/older rows)
+        DoctorDayCount.objects.bulk_create([DoctorDayCount(doctor = doctor, appointment_date = appointment_date, hospital = hospital,
+            booked = Appointment.objects.filter(doctor = doctor, appointment_date = appointment_date).count())], ignore_conflicts = True)
+    return slot.filter(booked__lt = daily_limit(doctor)).update(booked = F('booked') + 1) == 1
+
+def release_slot(doctor_id, appointment_date):
+    if doctor_id:
+        DoctorDayCount.objects.filter(doctor_id = doctor_id, appointment_date = appointment_date, booked__gt = 0).update(booked = F('booked') - 1)
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_daily_appointments'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('registration', '0010_auto_20220805_1200'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDayCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField(verbose_name='Appointment Date')),
+                ('booked', models.PositiveIntegerField(default=0, verbose_name='Booked')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+            ],
+            options={
+                'unique_together': {('doctor', 'appointment_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_daily_appointments'),
+        ('registration', '0011_doctordaycount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenQueueEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='Version')),
+                ('appointment_id', models.BigIntegerField(verbose_name='Appointment ID')),
+                ('token', models.JSONField(blank=True, null=True, verbose_name='Token')),
+                ('doctor_id', models.BigIntegerField(blank=True, null=True, verbose_name='Doctor ID')),
+                ('doctors', models.JSONField(default=list, verbose_name='Doctors')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.hospital')),
+            ],
+            options={
+                'unique_together': {('hospital', 'version')},
+            },
+        ),
+    ]
@@ -37,6 +37,37 @@ class Appointment(models.Model):
     def __str__(self):
         return str(self.pk)
 
+
+class DoctorDayCount(models.Model):
+    #appointments booked per doctor and day, changed only by conditional UPDATEs in registration.capacity
+    doctor = models.ForeignKey(Account, on_delete = models.CASCADE)
+    appointment_date = models.DateField(verbose_name = _('Appointment Date'))
+    booked = models.PositiveIntegerField(verbose_name = _('Booked'), default = 0)
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
+
+    class Meta:
+        unique_together = ['doctor', 'appointment_date']
+
+    def __str__(self):
+        return f"{self.doctor_id} {self.appointment_date}: {self.booked}"
+
+
+class TokenQueueEvent(models.Model):
+    #one change of a token on today's queue, numbered per hospital (registration.queue)
+    version = models.BigIntegerField(verbose_name = _('Version'))
+    appointment_id = models.BigIntegerField(verbose_name = _('Appointment ID')) #no FK, deleted appointments are events too
+    token = models.JSONField(verbose_name = _('Token'), blank = True, null = True) #None: removed from the queue
+    doctor_id = models.BigIntegerField(verbose_name = _('Doctor ID'), blank = True, null = True) #doctor of the token now
+    doctors = models.JSONField(verbose_name = _('Doctors'), default = list) #doctors whose queue it was or is on
+    created = models.DateTimeField(verbose_name = _('Created'), auto_now_add = True)
+    hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE)
+
+    class Meta:
+        unique_together = ['hospital', 'version']
+
+    def __str__(self):
+        return f"{self.hospital_id} {self.version}: {self.appointment_id}"
+
 # class Token(models.Model):
 #     appointment = models.ForeignKey(Appointment, on_delete = models.CASCADE, blank = True, null = True)
 #     hospital = models.ForeignKey(Hospital, on_delete = models.CASCADE, blank = True, null = True)
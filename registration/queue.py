@@ -0,0 +1,83 @@
+from datetime import date
+from django.conf import settings
+from django.db import transaction
+from administration.models import DataVersion
+from administration.versions import bump_data_version, data_version
+from administration.views import select_related_fields
+from registration.models import Appointment, TokenQueueEvent
+from registration.serializers import TokenReadSerializer
+
+#Live token queue: every change to a token on today's queue is stored as a TokenQueueEvent, numbered by its hospital's
+#DataVersion in the transaction that made the change, so dashboards in any process ask for "changes after version N"
+#(SSE stream and long-polling in HospitalManagement.asgi, plain polling through the DRF views) instead of reloading the
+#list. The last TOKEN_QUEUE_BACKLOG events of a hospital are kept.
+VERSION = 'registration.token_queue' #DataVersion name
+QUEUE_FIELDS = ['appointment_date', 'present', 'diagnosed', 'patient_id', 'doctor_id', 'department_id'] #what a dashboard shows
+EVENT_FIELDS = ['appointment_id', 'token', 'doctor_id', 'doctors']
+
+#-----------------------------------PUBLISHING---------------------------------------------------
+def publish(hospital_id, **event):
+    #the version row stays locked until commit, so versions become visible in order and never with a gap
+    with transaction.atomic():
+        version = bump_data_version(VERSION, hospital_id)
+        TokenQueueEvent.objects.create(version = version, hospital_id = hospital_id, **event)
+        TokenQueueEvent.objects.filter(hospital_id = hospital_id, version__lte = version - settings.TOKEN_QUEUE_BACKLOG).delete()
+    return version
+
+def queue_fields(appointment):
+    return {field: getattr(appointment, field) for field in QUEUE_FIELDS}
+
+def on_queue(fields):
+    return fields is not None and str(fields['appointment_date']) == str(date.today())
+
+def token_changed(hospital_id, appointment_id, before):
+    #before: queue_fields() of the stored row, None for a new appointment; published in the caller's transaction, so every
+    #save of an appointment runs in transaction.atomic() and the change and its event commit (or roll back) together
+    if not hospital_id:
+        return
+    appointment = select_related_fields(Appointment.objects, TokenReadSerializer).filter(pk = appointment_id).first()
+    after = queue_fields(appointment) if appointment else None
+    if before == after or not (on_queue(before) or on_queue(after)):
+        return
+    token = None #None: no longer on today's queue (deleted, moved to another day)
+    if on_queue(after):
+        token = dict(TokenReadSerializer(appointment).data, diagnosed = appointment.diagnosed)
+    doctors = {fields['doctor_id'] for fields in [before, after] if on_queue(fields)}
+    publish(hospital_id, appointment_id = appointment_id, token = token, doctor_id = after and after['doctor_id'], doctors = sorted(doctors - {None}))
+
+#-----------------------------------READING---------------------------------------------------
+def queue_versions(hospital_ids):
+    versions = dict.fromkeys(hospital_ids, 0)
+    versions.update(DataVersion.objects.filter(name = VERSION, hospital_id__in = hospital_ids).values_list('hospital_id', 'version'))
+    return versions
+
+def changes_since(hospital_id, since):
+    #(version, events after since); events is None when they cannot be replayed any more and the client must reload
+    version = data_version(VERSION, hospital_id)
+    if since is None or since == version:
+        return version, []
+    if since > version or version - since > settings.TOKEN_QUEUE_BACKLOG:
+        return version, None
+    events = list(TokenQueueEvent.objects.filter(hospital_id = hospital_id, version__gt = since, version__lte = version)
+                  .order_by('version').values(*EVENT_FIELDS))
+    if len(events) != version - since: #older ones already dropped
+        return version, None
+    return version, events
+
+def queue_changes(version, events, doctor_id = None):
+    #response body with the latest state of every changed token; a doctor only sees their own tokens, one moved to
+    #another doctor is removed from their queue
+    if events is None:
+        return {'version': version, 'reset': True, 'changes': []}
+    changes = {}
+    for event in events:
+        if doctor_id is None or doctor_id in event['doctors']:
+            changes.pop(event['appointment_id'], None)
+            changes[event['appointment_id']] = {'id': event['appointment_id'], 'token': event['token'] if doctor_id in [None, event['doctor_id']] else None}
+    return {'version': version, 'reset': False, 'changes': list(changes.values())}
+
+def parse_version(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError): #missing or garbled: answer with the current version
+        return None
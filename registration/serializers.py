@@ -1,10 +1,12 @@
 import re
 from rest_framework import serializers
 from django.utils.translation import gettext_lazy as _
+from administration.serializers import ReadSerializerMixin, SparseFieldsMixin
 from registration.models import Appointment, Patient, gender_choices
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    related_fields = ['hospital']
     email = serializers.EmailField(required = True)
     gender = serializers.ChoiceField(required = True, choices = gender_choices)
     
@@ -22,9 +24,7 @@ class PatientSerializer(serializers.ModelSerializer):
         }
 
     def to_representation(self, instance):
-        self.fields['gender'] = serializers.ChoiceField(required = True, choices = gender_choices, source='get_gender_display') 
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+        return PatientReadSerializer(context = self.context, fields = self.sparse_fields).to_representation(instance)
         
 
     def validate_email(self, value):
@@ -52,7 +52,17 @@ class PatientSerializer(serializers.ModelSerializer):
         return validated_data
     
 
+
+class PatientReadSerializer(ReadSerializerMixin, PatientSerializer):
+    def get_fields(self):
+        fields = super().get_fields()
+        if 'gender' in fields:
+            fields['gender'] = serializers.ChoiceField(required = True, choices = gender_choices, source='get_gender_display')
+        return fields
+
+
 class AppointmentSerializer(serializers.ModelSerializer):
+    related_fields = ['patient', 'doctor', 'department', 'hospital']
     
     class Meta:
         model = Appointment
@@ -68,18 +78,19 @@ class AppointmentSerializer(serializers.ModelSerializer):
         }
 
     def to_representation(self, instance):
-        self.fields['patient'] =  serializers.StringRelatedField(read_only = True)         
-        self.fields['doctor'] =  serializers.StringRelatedField(read_only = True) 
-        self.fields['department'] =  serializers.StringRelatedField(read_only = True)                 
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+        return AppointmentReadSerializer(context = self.context).to_representation(instance)
 
     def validate(self, validated_data):
         validated_data['hospital'] = self.context.get("hospital")
         return validated_data
 
 
+class AppointmentReadSerializer(ReadSerializerMixin, AppointmentSerializer):
+    pass
+
+
 class TokenSerializer(serializers.ModelSerializer):
+    related_fields = ['hospital']
     class Meta:
         model = Appointment
         exclude = ['appointment_date']
@@ -93,10 +104,12 @@ class TokenSerializer(serializers.ModelSerializer):
         }
 
     def to_representation(self, instance):
-        self.fields['hospital'] =  serializers.StringRelatedField(read_only = True)        
-        return super().to_representation(instance)
+        return TokenReadSerializer(context = self.context).to_representation(instance)
 
     def validate(self, validated_data):
         validated_data['hospital'] = self.context.get("hospital")
         return validated_data
 
+
+class TokenReadSerializer(ReadSerializerMixin, TokenSerializer):
+    pass
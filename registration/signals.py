@@ -0,0 +1,15 @@
+from registration.capacity import release_slot
+from registration.models import Appointment
+from registration.queue import QUEUE_FIELDS, queue_fields, token_changed
+
+
+def appointment_saving(sender, instance, **kwargs):
+    #the stored row, compared with the committed one before a token change is published
+    instance._queue_before = Appointment.objects.filter(pk = instance.pk).values(*QUEUE_FIELDS).first() if instance.pk else None
+
+def appointment_saved(sender, instance, **kwargs):
+    token_changed(instance.hospital_id, instance.pk, getattr(instance, '_queue_before', None))
+
+def appointment_deleted(sender, instance, **kwargs):
+    release_slot(instance.doctor_id, instance.appointment_date) #also when deleted along with its patient
+    token_changed(instance.hospital_id, instance.pk, queue_fields(instance))
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from io import BytesIO
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError, close_old_connections, connection
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from accounts.permissions import IsDoctor, IsRegistration
+from registration.queue import changes_since, parse_version, queue_changes, queue_versions
+
+logger = logging.getLogger(__name__)
+
+#Token queue endpoints answered straight from the ASGI server (HospitalManagement.asgi), so an open dashboard holds a
+#coroutine instead of a worker thread. One task per process reads the queue versions of every watched hospital in one
+#query each TOKEN_QUEUE_POLL_INTERVAL, fetches a hospital's new events once and wakes only its streams and long-polls,
+#which are answered from those events; an idle dashboard costs nothing else.
+QUEUES = {'/registration/api/token/': IsRegistration, '/doctor/api/token/': IsDoctor} #path -> role allowed to watch it
+WATCHED = {} #hospital id -> {'listeners', 'version', 'events' up to version, 'changed': asyncio.Event replaced after every change}
+POLLER = None
+READER = ThreadPoolExecutor(max_workers = 1) #every queue query of this process, on one DB connection kept between polls
+
+#-----------------------------------WATCHING---------------------------------------------------
+def read_queue(function, *args):
+    try:
+        return function(*args)
+    except DatabaseError:
+        connection.close() #reconnects on the next read
+        raise
+
+async def read(function, *args):
+    return await asyncio.get_event_loop().run_in_executor(READER, read_queue, function, *args)
+
+async def poll_versions():
+    global POLLER
+    while WATCHED:
+        await asyncio.sleep(settings.TOKEN_QUEUE_POLL_INTERVAL)
+        try:
+            for hospital_id, version in (await read(queue_versions, list(WATCHED))).items():
+                watched = WATCHED.get(hospital_id)
+                if watched is None or version == watched['version']:
+                    continue
+                events = None
+                if watched['version'] is not None:
+                    version, events = await read(changes_since, hospital_id, watched['version'])
+                watched['events'] = [] if events is None else (watched['events'] + events)[-settings.TOKEN_QUEUE_BACKLOG:]
+                watched['version'] = version
+                watched['changed'].set()
+                watched['changed'] = asyncio.Event()
+        except Exception:
+            logger.exception('Token queue poll failed') #waiters time out and retry, the next poll tries again
+    POLLER = None
+
+@asynccontextmanager
+async def watching(hospital_id):
+    global POLLER
+    watched = WATCHED.setdefault(hospital_id, {'listeners': 0, 'version': None, 'events': [], 'changed': asyncio.Event()})
+    watched['listeners'] += 1
+    if POLLER is None:
+        POLLER = asyncio.ensure_future(poll_versions())
+    try:
+        yield
+    finally:
+        watched['listeners'] -= 1
+        if not watched['listeners']:
+            del WATCHED[hospital_id]
+
+async def next_changes(hospital_id, since, timeout):
+    #changes_since() once the version moved past since, (since, []) when nothing changed within timeout
+    watched = WATCHED[hospital_id]
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    first = True
+    while True:
+        changed = watched['changed'] #taken before reading, a change made meanwhile still wakes us up
+        version, events = watched['version'], watched['events']
+        if version is not None and since is not None and version - len(events) <= since <= version:
+            if since < version:
+                return version, events[len(events) - (version - since):]
+        elif first or version is not None: #before the first poll, or a version the poller holds no events for
+            found_version, found = await read(changes_since, hospital_id, since)
+            if since is None or found != []:
+                return found_version, found
+        first = False
+        try:
+            await asyncio.wait_for(changed.wait(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            return since, []
+
+#-----------------------------------REQUESTS---------------------------------------------------
+def queue_user(scope, permission):
+    #the DRF authentication of the token views (session, basic or JWT); None when it would be refused
+    try:
+        request = ASGIRequest(scope, BytesIO())
+        SessionMiddleware(lambda request: None).process_request(request)
+        AuthenticationMiddleware(lambda request: None).process_request(request)
+        request = Request(request, authenticators = [authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        allowed = all(check().has_permission(request, None) for check in [IsAuthenticated, permission])
+        return request.user if allowed and request.user.hospital_id else None
+    except Exception: #bad credentials, staff without a role
+        return None
+    finally:
+        close_old_connections()
+
+async def send_json(send, status, data):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(data, cls = JSONEncoder).encode()})
+
+def server_sent_event(name, data):
+    return f"id: {data['version']}\nevent: {name}\ndata: {json.dumps(data, cls = JSONEncoder)}\n\n".encode()
+
+async def token_changes(scope, receive, send, user, doctor_id):
+    #GET <queue>changes/?version=N, same answer as the DRF action of the token views
+    since = parse_version(parse_qs(scope['query_string'].decode()).get('version', [None])[0])
+    async with watching(user.hospital_id):
+        version, events = await next_changes(user.hospital_id, since, settings.TOKEN_QUEUE_LONG_POLL)
+    await send_json(send, 200, {'data': queue_changes(version, events, doctor_id)})
+
+async def token_stream(scope, receive, send, user, doctor_id):
+    #GET <queue>stream/ (EventSource): a "version" event to start from, then "changes" and "reset" events; a
+    #reconnecting EventSource sends Last-Event-ID and gets the changes it missed
+    headers = dict(scope['headers'])
+    since = parse_version(headers.get(b'last-event-id', b'').decode() or parse_qs(scope['query_string'].decode()).get('version', [None])[0])
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        async with watching(user.hospital_id):
+            while True:
+                changes = asyncio.ensure_future(next_changes(user.hospital_id, since, settings.TOKEN_QUEUE_HEARTBEAT))
+                await asyncio.wait([changes, disconnected], return_when = asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    changes.cancel()
+                    break
+                version, events = changes.result()
+                data = queue_changes(version, events, doctor_id)
+                if since is None:
+                    body = server_sent_event('version', {'version': version})
+                elif data['reset']:
+                    body = server_sent_event('reset', data)
+                elif data['changes']:
+                    body = server_sent_event('changes', data)
+                else:
+                    body = b': keep-alive\n\n' #also how a closed connection is noticed behind proxies
+                since = version
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        disconnected.cancel()
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+def token_queue_application(application):
+    #serves <queue>stream/ and <queue>changes/ of QUEUES, everything else goes to the Django application
+    async def token_queue(scope, receive, send):
+        path = scope.get('path', '')
+        queue, _, endpoint = path.rpartition('/api/token/')
+        permission = QUEUES.get(queue + '/api/token/') if scope['type'] == 'http' and scope['method'] == 'GET' else None
+        if permission is None or endpoint not in ['stream/', 'changes/']:
+            return await application(scope, receive, send)
+        user = await sync_to_async(queue_user)(scope, permission)
+        if user is None:
+            return await send_json(send, 403, {'detail': 'You do not have permission to perform this action.'})
+        doctor_id = user.id if permission is IsDoctor else None
+        endpoint = token_stream if endpoint == 'stream/' else token_changes
+        await endpoint(scope, receive, send, user, doctor_id)
+    return token_queue
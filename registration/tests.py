@@ -1,3 +1,126 @@
-from django.test import TestCase
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from accounts.models import Account, Department, Hospital, Roles
+from doctor.availability import BITMAPS
+from registration.models import Appointment, DoctorDayCount, Patient
 
-# Create your tests here.
+
+class AppointmentCapacityTests(TransactionTestCase):
+    #bookings come from parallel threads with a DB connection each, so only the conditional UPDATE of the
+    #DoctorDayCount row stands between them and an overbooked day
+    LIMIT = 3
+    WORKERS = 6
+
+    def setUp(self):
+        BITMAPS.clear() #ids are reused after every flush
+        self.hospital = Hospital.objects.create(name = 'Test Hospital')
+        self.department = Department.objects.create(name = 'cardiology', daily_appointments = self.LIMIT, hospital = self.hospital)
+        self.doctor = Account.objects.create_user('doctor@hospital.test', 'Test Doctor', 'password', hospital = self.hospital,
+                      department = self.department, roles = Roles.objects.create(name = 'doctor', hospital = self.hospital))
+        self.registrar = Account.objects.create_user('registrar@hospital.test', 'Test Registrar', 'password', hospital = self.hospital,
+                         roles = Roles.objects.create(name = 'registrar', hospital = self.hospital))
+        self.patients = [Patient.objects.create(email = f"patient{index}@hospital.test", mobile = f"9{index:09d}", name = f"patient {index}",
+                         dob = date(1990, 1, 1), gender = 'o', hospital = self.hospital) for index in range(self.LIMIT * 4)]
+        self.day = date.today() + timedelta(days = 1)
+
+    def client_for(self, user, raise_request_exception = True):
+        client = APIClient(raise_request_exception = raise_request_exception)
+        client.force_authenticate(user)
+        return client
+
+    def appointment_data(self, patient, day):
+        return {'appointment_date': day.strftime("%Y-%m-%d"), 'patient': patient.id, 'doctor': self.doctor.id, 'department': self.department.id}
+
+    def send(self, request):
+        try:
+            client = self.client_for(self.registrar, raise_request_exception = False) #a request the database refused is a 500
+            if request[0] == 'delete':
+                return 'delete ' + str(client.delete(f'/registration/api/appointment/{request[1]}/').status_code)
+            return 'post ' + str(client.post('/registration/api/appointment/', self.appointment_data(request[1], self.day), format = 'json').status_code)
+        finally:
+            connection.close()
+
+    def run_parallel(self, requests):
+        with ThreadPoolExecutor(max_workers = self.WORKERS) as executor:
+            return Counter(executor.map(self.send, requests))
+
+    def assertCounted(self, day):
+        #never more appointments than the limit, and the counter is exactly what is booked
+        booked = Appointment.objects.filter(doctor = self.doctor, appointment_date = day).count()
+        counter = DoctorDayCount.objects.filter(doctor = self.doctor, appointment_date = day).values_list('booked', flat = True).first() or 0
+        self.assertLessEqual(booked, self.LIMIT)
+        self.assertEqual(counter, booked)
+        return booked
+
+    def test_parallel_bookings_never_overbook(self):
+        statuses = self.run_parallel([('post', patient) for patient in self.patients[:self.LIMIT * 2]])
+        booked = self.assertCounted(self.day)
+        self.assertEqual(statuses['post 201'], booked)
+        self.assertGreater(booked, 0)
+
+    def test_cancels_while_booking(self):
+        client = self.client_for(self.registrar)
+        for patient in self.patients[:self.LIMIT]:
+            self.assertEqual(client.post('/registration/api/appointment/', self.appointment_data(patient, self.day), format = 'json').status_code, 201)
+        self.assertEqual(self.assertCounted(self.day), self.LIMIT)
+        cancelled = Appointment.objects.filter(doctor = self.doctor, appointment_date = self.day).values_list('id', flat = True)[:2]
+        statuses = self.run_parallel([('delete', appointment_id) for appointment_id in cancelled]
+                                     + [('post', patient) for patient in self.patients[self.LIMIT:]])
+        booked = self.assertCounted(self.day)
+        self.assertEqual(booked, self.LIMIT - statuses['delete 204'] + statuses['post 201'])
+
+    def test_reschedule_and_delete_give_the_slot_back(self):
+        client = self.client_for(self.registrar)
+        for patient in self.patients[:self.LIMIT]:
+            self.assertEqual(client.post('/registration/api/appointment/', self.appointment_data(patient, self.day), format = 'json').status_code, 201)
+        response = client.post('/registration/api/appointment/', self.appointment_data(self.patients[self.LIMIT], self.day), format = 'json')
+        self.assertEqual(response.status_code, 400) #day is full
+
+        later = self.day + timedelta(days = 1)
+        moved, deleted = Appointment.objects.filter(doctor = self.doctor, appointment_date = self.day).order_by('id')[:2]
+        response = client.put(f'/registration/api/appointment/{moved.id}/', self.appointment_data(moved.patient, later), format = 'json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.assertCounted(self.day), self.LIMIT - 1)
+        self.assertEqual(self.assertCounted(later), 1)
+
+        self.assertEqual(client.delete(f'/registration/api/appointment/{deleted.id}/').status_code, 204)
+        self.assertEqual(self.assertCounted(self.day), self.LIMIT - 2)
+        for patient in self.patients[self.LIMIT:self.LIMIT + 3]: #two freed slots, the third booking is refused again
+            client.post('/registration/api/appointment/', self.appointment_data(patient, self.day), format = 'json')
+        self.assertEqual(self.assertCounted(self.day), self.LIMIT)
+
+
+class TokenQueueTests(TestCase):
+    #a token change and its queue event commit together: when the event cannot be stored, the change is rolled back
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name = 'Test Hospital')
+        self.doctor = Account.objects.create_user('doctor@hospital.test', 'Test Doctor', 'password', hospital = self.hospital,
+                      roles = Roles.objects.create(name = 'doctor', hospital = self.hospital))
+        self.registrar = Account.objects.create_user('registrar@hospital.test', 'Test Registrar', 'password', hospital = self.hospital,
+                         roles = Roles.objects.create(name = 'registrar', hospital = self.hospital))
+        patient = Patient.objects.create(email = 'patient@hospital.test', mobile = '9000000000', name = 'patient', dob = date(1990, 1, 1),
+                  gender = 'o', hospital = self.hospital)
+        self.appointment = Appointment.objects.create(appointment_date = date.today(), patient = patient, doctor = self.doctor, hospital = self.hospital)
+
+    def patch(self, user, url, data):
+        client = APIClient(raise_request_exception = False) #the error itself cannot be rendered, it is a 500
+        client.force_authenticate(user)
+        with mock.patch('registration.queue.TokenQueueEvent.objects.create', side_effect = RuntimeError('event not stored')):
+            return client.patch(url, data, format = 'json')
+
+    def test_present_rolled_back_with_its_event(self):
+        response = self.patch(self.registrar, f'/registration/api/token/{self.appointment.id}/', {'present': True})
+        self.assertNotEqual(response.status_code, 200)
+        self.appointment.refresh_from_db()
+        self.assertFalse(self.appointment.present)
+
+    def test_diagnosed_rolled_back_with_its_event(self):
+        response = self.patch(self.doctor, f'/doctor/api/token/{self.appointment.id}/', {'diagnosed': True})
+        self.assertNotEqual(response.status_code, 200)
+        self.appointment.refresh_from_db()
+        self.assertFalse(self.appointment.diagnosed)
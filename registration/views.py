@@ -1,5 +1,6 @@
 from datetime import datetime
 from tokenize import Token
+from django.db import transaction
 from django.shortcuts import render
 from rest_framework.decorators import action
 from rest_framework.views import APIView
@@ -9,14 +10,19 @@ from rest_framework import status, viewsets
 from accounts.models import Account
 from accounts.permissions import IsRegistration
 from administration.serializers import DoctorSerializer
-from administration.views import get_conditions, pagination_datatable
+from administration.counts import cap_counts, cached_count
+from administration.exports import EXPORT_RENDERERS, export_response
+from administration.values import values_data
+from administration.views import get_fields, get_search_condition, pagination_datatable, select_related_fields
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import cache_control
 from django.utils.translation import gettext_lazy as _
 from doctor.models import DoctorAvailability
-from doctor.views import doctor_availability
+from doctor.views import is_doctor_available
+from registration.capacity import book_slot, daily_limit, release_slot
 from registration.models import Appointment, Patient
-from registration.serializers import AppointmentSerializer, PatientSerializer, TokenSerializer
+from registration.queue import changes_since, parse_version, queue_changes
+from registration.serializers import AppointmentReadSerializer, AppointmentSerializer, PatientReadSerializer, PatientSerializer, TokenReadSerializer, TokenSerializer
 # Create your views here.
 
 #-----------------------------------PATIENT---------------------------------------------------
@@ -34,7 +40,7 @@ class PatientView(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'delete', 'patch']    
     permission_classes = [IsAuthenticated, IsRegistration]
     
-    def list(self, request):
+    def list(self, request, export = False):
         context = {}
         try:
             columns = ['id','name','email',"mobile",'dob','gender','register_date','last_accessed']
@@ -43,29 +49,40 @@ class PatientView(viewsets.ModelViewSet):
             last_accessed_end = request.query_params.get('last_accessed_end','').strip()
             date_filter = [last_accessed_start,last_accessed_end]
             #------------------
+            fields = get_fields(request.query_params, PatientReadSerializer)
             patient_data = pagination_datatable(Patient, columns, **request.query_params, 
             hospital = request.user.hospital, date_columns = date_columns, 
-            date_filter = date_filter, date_col_filter = 'last_accessed')
+            date_filter = date_filter, date_col_filter = 'last_accessed', serializer_fields = fields, serializer_class = PatientReadSerializer, export = export)
             #------------------
-            serializer = PatientSerializer(patient_data['data'], many = True)
+            if export:
+                return export_response(patient_data['data'], PatientReadSerializer, request, 'patients', fields)
+            serializer = PatientReadSerializer(patient_data['data'], many = True, fields = fields)
             context['data'] = serializer.data
             context['draw'] = patient_data['draw']
             context['recordsTotal'] = patient_data['recordsTotal']
             context['recordsFiltered'] = patient_data['recordsFiltered']
+            if 'recordsCapped' in patient_data:
+                context['recordsCapped'] = patient_data['recordsCapped']
+            if 'next_cursor' in patient_data:
+                context['next_cursor'] = patient_data['next_cursor']
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'], renderer_classes = EXPORT_RENDERERS)
+    def export(self, request):
+        return self.list(request, export = True)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:     
-                patient_data = self.queryset.get(id = pk, hospital = request.user.hospital)
+                patient_data = select_related_fields(self.queryset, PatientReadSerializer).get(id = pk, hospital = request.user.hospital)
             except Patient.DoesNotExist:
                 context['error'] = {"id": [_(f"ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = PatientSerializer(patient_data)    
+            serializer = PatientReadSerializer(patient_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -147,7 +164,7 @@ class AppointmentView(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'delete', 'put']
     permission_classes = [IsAuthenticated, IsRegistration]    
     
-    def list(self, request):
+    def list(self, request, export = False):
         context = {}
         try:          
             columns = ['id','appointment_date', 'present', 'diagnosed', 'patient',"doctor",'department']
@@ -159,27 +176,36 @@ class AppointmentView(viewsets.ModelViewSet):
             #------------------
             appointment_data = pagination_datatable(Appointment, columns, **request.query_params, 
             hospital = request.user.hospital, date_columns = date_columns, fk_columns = fk_columns,
-            date_filter = date_filter, date_col_filter = 'appointment_date')
+            date_filter = date_filter, date_col_filter = 'appointment_date', serializer_class = AppointmentReadSerializer, export = export)
             #------------------
-            serializer = AppointmentSerializer(appointment_data['data'], many = True)
-            context['data'] = serializer.data
+            if export:
+                return export_response(appointment_data['data'], AppointmentReadSerializer, request, 'appointments')
+            context['data'] = values_data(appointment_data['data'], AppointmentReadSerializer)
             context['draw'] = appointment_data['draw']
             context['recordsTotal'] = appointment_data['recordsTotal']
             context['recordsFiltered'] = appointment_data['recordsFiltered']
+            if 'recordsCapped' in appointment_data:
+                context['recordsCapped'] = appointment_data['recordsCapped']
+            if 'next_cursor' in appointment_data:
+                context['next_cursor'] = appointment_data['next_cursor']
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'], renderer_classes = EXPORT_RENDERERS)
+    def export(self, request):
+        return self.list(request, export = True)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:     
-                appointment_data = self.queryset.get(id = pk, hospital = request.user.hospital)
+                appointment_data = select_related_fields(self.queryset, AppointmentReadSerializer).get(id = pk, hospital = request.user.hospital)
             except Appointment.DoesNotExist:
                 context['error'] = {"id": [_(f"ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = AppointmentSerializer(appointment_data)    
+            serializer = AppointmentReadSerializer(appointment_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -193,7 +219,7 @@ class AppointmentView(viewsets.ModelViewSet):
         try:
             department_id = data.get('department')
             try:      
-                Account.objects.get(id = data.get('doctor'), 
+                doctor = Account.objects.select_related('department').get(id = data.get('doctor'), 
                                     department__id = department_id, roles__name = 'doctor')
             except Account.DoesNotExist:
                 context['error'] = {"doctor": [_(f"This doctor is not in Department:{department_id}")]} 
@@ -213,33 +239,23 @@ class AppointmentView(viewsets.ModelViewSet):
                 context['error'] = {"date": [_("Not in format yyyy-mm-dd or incorrect date!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
             
-            try:
-                doctor_availability(department_id,appointment_date,request.user.hospital).get(id = doctor_id)
-            except Account.DoesNotExist:
+            if not is_doctor_available(doctor_id, department_id, appointment_date, request.user.hospital):
                 context['error'] = {"doctor": [_("Doctor is not available!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
 
-            
-            total_appoint = self.queryset.filter(doctor__id = doctor_id, appointment_date = appointment_date)    
-            total_appoint_count = total_appoint.count()
 
-            total_appoint_possible = 6
-            if total_appoint_count >= total_appoint_possible:
-                context['error'] = {"doctor": [_(f"Doctor already have {total_appoint_possible} appointments on {appointment_date}!")]} 
-                return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            elif total_appoint == 0: pass    
-            else:    
-                try:
-                    total_appoint.get(patient__id = patient_id, department__id = department_id)
-                    context['error'] = {"id": [_("Same Appointment can't exist twice!")]} 
-                    return Response(context, status = status.HTTP_400_BAD_REQUEST)                
-                except Appointment.DoesNotExist:
-                    pass                
+            if self.queryset.filter(doctor__id = doctor_id, appointment_date = appointment_date, patient__id = patient_id, department__id = department_id).exists():
+                context['error'] = {"id": [_("Same Appointment can't exist twice!")]} 
+                return Response(context, status = status.HTTP_400_BAD_REQUEST)                
 
             serializer = AppointmentSerializer(data = data)
             serializer.context["hospital"] = request.user.hospital #pass context to serializer
             if serializer.is_valid():
-                serializer.save()
+                with transaction.atomic(): #slot and appointment are saved together
+                    if not book_slot(doctor, appointment_date, request.user.hospital):
+                        context['error'] = {"doctor": [_(f"Doctor already have {daily_limit(doctor)} appointments on {appointment_date}!")]} 
+                        return Response(context, status = status.HTTP_400_BAD_REQUEST)
+                    serializer.save()
                 context['data'] = serializer.data
                 context['message'] = _(f'Appointment created!') 
                 return Response(context, status = status.HTTP_201_CREATED)
@@ -262,7 +278,7 @@ class AppointmentView(viewsets.ModelViewSet):
             #--------------
             department_id = data.get('department')
             try:      
-                Account.objects.get(id = data.get('doctor'), 
+                doctor = Account.objects.select_related('department').get(id = data.get('doctor'), 
                                     department__id = department_id, roles__name = 'doctor')
             except Account.DoesNotExist:
                 context['error'] = {"doctor": [_(f"This doctor is not in Department:{department_id}")]} 
@@ -282,36 +298,29 @@ class AppointmentView(viewsets.ModelViewSet):
                 context['error'] = {"date": [_("Not in format yyyy-mm-dd or incorrect date!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
             
-            try:
-                doctor_availability(department_id,appointment_date,request.user.hospital).get(id = doctor_id)
-            except Account.DoesNotExist:
+            if not is_doctor_available(doctor_id, department_id, appointment_date, request.user.hospital):
                 context['error'] = {"doctor": [_("Doctor is not available!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
 
-            
-            total_appoint = self.queryset.filter(doctor__id = doctor_id, appointment_date = appointment_date)    
-            total_appoint_count = total_appoint.count()
-
-            total_appoint_possible = 6
 
-            if total_appoint_count >= total_appoint_possible and (appointment_data.doctor.id != doctor_id or appointment_data.appointment_date.strftime("%Y-%m-%d") != appointment_date):
-                context['error'] = {"doctor": [_(f"Doctor already have {total_appoint_possible} appointments on {appointment_date}!")]} 
-                return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            elif total_appoint == 0: pass    
-            else:    
-                try:
-                    total_appoint.get(patient__id = patient_id, department__id = department_id)
-                    context['error'] = {"id": [_("Already this appointment exists!")]} 
-                    return Response(context, status = status.HTTP_400_BAD_REQUEST)                
-                except Appointment.DoesNotExist:
-                    pass                
+            if self.queryset.filter(doctor__id = doctor_id, appointment_date = appointment_date, patient__id = patient_id, 
+                                    department__id = department_id).exclude(id = appointment_data.id).exists():
+                context['error'] = {"id": [_("Already this appointment exists!")]} 
+                return Response(context, status = status.HTTP_400_BAD_REQUEST)                
             #--------------
 
             serializer = AppointmentSerializer(appointment_data, data = data)
             serializer.context["hospital"] = request.user.hospital
             
             if serializer.is_valid():
-                serializer.save()
+                old_doctor_id, old_date = appointment_data.doctor_id, appointment_data.appointment_date
+                with transaction.atomic(): #rescheduling takes the new slot before giving back the old one
+                    if (old_doctor_id, old_date.strftime("%Y-%m-%d")) != (doctor.id, appointment_date):
+                        if not book_slot(doctor, appointment_date, request.user.hospital):
+                            context['error'] = {"doctor": [_(f"Doctor already have {daily_limit(doctor)} appointments on {appointment_date}!")]} 
+                            return Response(context, status = status.HTTP_400_BAD_REQUEST)
+                        release_slot(old_doctor_id, old_date)
+                    serializer.save()
                 context['data'] = serializer.data
                 context['message'] =  _(f'Appointment: {serializer.data["id"]} updated!')
                 return Response(context, status = status.HTTP_200_OK) 
@@ -377,36 +386,54 @@ class TokenView(viewsets.ModelViewSet):
             rows_per_page = int(request.query_params.get('length', None)) #row length that we select in dropdown
             start_index = int(request.query_params.get('start', None)) #starting index
             search_value = request.query_params.get('search[value]', '').strip() #search value
+            estimated = request.query_params.get('count_mode', 'exact').strip() == 'estimated' #bounded counts for very large tables
 
             #--------data--------
             today = datetime.now().date().strftime("%Y-%m-%d")
             context['data'] = self.queryset.filter(hospital = request.user.hospital, appointment_date = today)
-            context['recordsTotal'] = context['data'].count() #Total Record count
-            search_condition = get_conditions(search_value, columns, [], fk_columns)
+            context['recordsTotal'] = cached_count(context['data'], request.user.hospital, estimated) #Total Record count
+            search_condition = get_search_condition(Appointment, request.user.hospital, search_value, columns, [], fk_columns)
 
             if search_condition:
                 context['data'] = context['data'].filter(search_condition)
 
-            context['recordsFiltered'] = context['data'].count() #Filtered record count
+            context['recordsFiltered'] = cached_count(context['data'], request.user.hospital, estimated) #Filtered record count
+            if estimated:
+                cap_counts(context, start_index, rows_per_page)
+            context['data'] = select_related_fields(context['data'], TokenReadSerializer)
             context['data'] = context['data'].order_by('-present', 'id')[start_index : (start_index + rows_per_page)] #One Page Data
             #------------------
-            serializer = TokenSerializer(context['data'], many = True)
+            serializer = TokenReadSerializer(context['data'], many = True)
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK)
         except Exception as e:
             context['error'] = e
             return Response(context, status = status.HTTP_404_NOT_FOUND)
 
+    @action(detail = False, methods = ['get'])
+    def changes(self, request):
+        #?version=N: changes of tokens on today's queue after version N (registration.queue); answers at once, the
+        #waiting long-poll on this URL is served by the ASGI application without holding a worker thread
+        context = {}
+        try:
+            since = parse_version(request.query_params.get('version'))
+            version, events = changes_since(request.user.hospital_id, since)
+            context['data'] = queue_changes(version, events)
+            return Response(context, status = status.HTTP_200_OK)
+        except Exception as e:
+            context['error'] = e
+            return Response(context, status = status.HTTP_400_BAD_REQUEST)
+
     def retrieve(self, request, pk):
         context = {}
         try:
             try:
                 today = datetime.now().date().strftime("%Y-%m-%d")     
-                appointment_data = self.queryset.get(id = pk, hospital = request.user.hospital, appointment_date = today)
+                appointment_data = select_related_fields(self.queryset, AppointmentReadSerializer).get(id = pk, hospital = request.user.hospital, appointment_date = today)
             except Appointment.DoesNotExist:
                 context['error'] = {"id": [_(f"ID: {pk} does not exist!")]} 
                 return Response(context, status = status.HTTP_400_BAD_REQUEST)
-            serializer = AppointmentSerializer(appointment_data)    
+            serializer = AppointmentReadSerializer(appointment_data)    
             context['data'] = serializer.data
             return Response(context, status = status.HTTP_200_OK) 
         except Exception as e:
@@ -433,7 +460,8 @@ class TokenView(viewsets.ModelViewSet):
             serializer.context["hospital"] = request.user.hospital
             
             if serializer.is_valid():
-                serializer.save()
+                with transaction.atomic(): #the token and its queue event commit together
+                    serializer.save()
                 context['data'] = serializer.data
                 context['message'] =  _(f'Appointment: {serializer.data["id"]} updated!')
                 return Response(context, status = status.HTTP_200_OK) 